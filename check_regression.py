@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+import numpy as np
+import results_store
+from compare_platforms import compare, CONVERGENCES, DACAPO_DIR, CONFIDENCE, ALPHA, RESAMPLES
+
+# Compares a candidate results store against a baseline one from the same sweep (e.g. before and
+# after a Xen or OSv change) at every point both ran, and exits non-zero if any metric got
+# significantly worse: by more than its threshold, with the rank-sum test rejecting at alpha and
+# the bootstrap interval of the candidate over baseline ratio above 1. Points the baseline ran and
+# the candidate lacks fail the check too, unless --allow-missing is given.
+# (metric, description, default threshold as a fraction of the baseline mean)
+METRICS = [('runtime', "DaCapo iteration runtime (ms)", 0.05),
+           ('gc', "DaCapo GC time per iteration (ms)", 0.10),
+           ('hazard', "Concurrency hazard fraction per domain", 0.10),
+           ('ycsb_p99', "YCSB 99th percentile latency per run (ms)", 0.10),
+           ('ycsb_p999', "YCSB 99.9th percentile latency per run (ms)", 0.20)]
+MIN_SAMPLES = 2
+
+def metric_samples(db, platform):
+  # Returns {(metric, benchmark or operation, num_jvms, heap) -> samples} of everything in a store
+  # for one platform. Heap is 0 for YCSB.
+  samples = dict()
+  benchmarks = [benchmark for benchmark, in db.execute("SELECT DISTINCT benchmark FROM iterations WHERE suite = ? AND platform = ?", (DACAPO_DIR, platform))]
+  for benchmark in benchmarks:
+    for (num_jvms, heap), domains in results_store.measured_iterations(db, DACAPO_DIR, platform, benchmark, CONVERGENCES.get(benchmark, 0)).iteritems():
+      # Only domains with a complete measurement window
+      rows = [row for size, domain_rows in domains.values() if len(domain_rows) == size for row in domain_rows]
+      if rows:
+        samples[('runtime', benchmark, num_jvms, heap)] = [runtime for runtime, gc in rows]
+        samples[('gc', benchmark, num_jvms, heap)] = [gc for runtime, gc in rows]
+  for benchmark, in db.execute("SELECT DISTINCT benchmark FROM runstates WHERE suite = ? AND platform = ?", (DACAPO_DIR, platform)):
+    for (num_jvms, heap), fractions in results_store.hazard_fractions(db, DACAPO_DIR, platform, benchmark).iteritems():
+      samples[('hazard', benchmark, num_jvms, heap)] = fractions
+  for metric, column in (('ycsb_p99', 'p99_ms'), ('ycsb_p999', 'p999_ms')):
+    for (num_jvms, operation), latencies in results_store.ycsb_latencies(db, platform, column).iteritems():
+      samples[(metric, operation, num_jvms, 0)] = latencies
+  return samples
+
+def check(baseline, candidate, thresholds, **options):
+  # Returns (rows, missing): a compare_platforms.compare row with 'metric', 'name', 'num_jvms',
+  # 'heap' and 'regression' for every point in both, and the points only the baseline has
+  rows = []
+  for key in sorted(set(baseline) & set(candidate)):
+    metric, name, num_jvms, heap = key
+    if min(len(baseline[key]), len(candidate[key])) < MIN_SAMPLES or not np.any(baseline[key]) and not np.any(candidate[key]):
+      continue
+    with np.errstate(divide='ignore', invalid='ignore'):
+      row = compare(baseline[key], candidate[key], **options)
+    row.update({'metric': metric, 'name': name, 'num_jvms': num_jvms, 'heap': heap})
+    row['regression'] = row['verdict'] == 'slower' and row['ratio'] > 1 + thresholds[metric]
+    rows.append(row)
+  return rows, sorted(set(baseline) - set(candidate))
+
+def print_report(rows, missing, thresholds, allow_missing=False):
+  # Returns how many points fail the check: the regressions, and the missing points unless allowed
+  print "%-10s %-18s %5s %6s %14s %14s %8s %18s %9s %7s  %s" % ("Metric", "Benchmark/op", "JVMs", "Heap", "Baseline mean", "Candidate mean",
+                                                               "Change", "Ratio CI", "p", "Delta", "Status")
+  for row in rows:
+    status = "REGRESSION" if row['regression'] else row['verdict']
+    print "%-10s %-18s %5d %6d %14.4g %14.4g %+7.1f%% %8.3f-%-9.3f %9.2g %7.2f  %s" % (row['metric'], row['name'], row['num_jvms'], row['heap'],
+      row['baseline_mean'], row['candidate_mean'], (row['ratio'] - 1) * 100, row['ratio_low'], row['ratio_high'], row['p'], row['cliffs_delta'], status)
+  for metric, name, num_jvms, heap in missing:
+    print "Missing from the candidate: %s %s %d JVMs %d MB" % (metric, name, num_jvms, heap)
+  regressions = [row for row in rows if row['regression']]
+  print "\n%d points checked, %d regressions, %d missing%s (thresholds: %s)" % (len(rows), len(regressions), len(missing),
+    " (allowed)" if allow_missing and missing else "",
+    ", ".join("%s %+.0f%%" % (metric, thresholds[metric] * 100) for metric, description, threshold in METRICS))
+  return len(regressions) + (0 if allow_missing else len(missing))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("baseline", help="results store of the reference run")
+  parser.add_argument("candidate", help="results store of the run to check")
+  parser.add_argument("--baseline-results", action="store", default=None, help="bring the baseline store up to date with this results directory first")
+  parser.add_argument("--candidate-results", action="store", default=None, help="bring the candidate store up to date with this results directory first")
+  parser.add_argument("-p", "--platform", action="store", default='xen', help="platform to compare (default: %(default)s)")
+  for metric, description, threshold in METRICS:
+    parser.add_argument("--%s-threshold" % metric.replace('_', '-'), action="store", default=threshold, type=float, dest=metric,
+                        help="fractional increase in %s that counts as a regression (default: %s)" % (description, threshold))
+  parser.add_argument("--alpha", action="store", default=ALPHA, type=float, help="significance level of the rank-sum test (default: %(default)s)")
+  parser.add_argument("-c", "--confidence", action="store", default=CONFIDENCE, type=float, help="confidence level of the ratio interval (default: %(default)s)")
+  parser.add_argument("-n", "--resamples", action="store", default=RESAMPLES, type=int, help="bootstrap resamples (default: %(default)s)")
+  parser.add_argument("--allow-missing", action="store_true", default=False, help="don't fail on points the baseline has and the candidate lacks")
+  parser.add_argument("--seed", action="store", default=0, type=int, help="random seed, for repeatable intervals")
+  cmdargs = parser.parse_args()
+
+  stores = []
+  for store, results_dir in ((cmdargs.baseline, cmdargs.baseline_results), (cmdargs.candidate, cmdargs.candidate_results)):
+    db = results_store.open_store(store)
+    if results_dir:
+      print "Read %d changed files into %s" % (results_store.ingest(db, results_dir), store)
+    stores.append(metric_samples(db, cmdargs.platform))
+  thresholds = dict((metric, getattr(cmdargs, metric)) for metric, description, threshold in METRICS)
+  rows, missing = check(stores[0], stores[1], thresholds, resamples=cmdargs.resamples, confidence=cmdargs.confidence,
+                        alpha=cmdargs.alpha, rng=np.random.RandomState(cmdargs.seed))
+  sys.exit(1 if print_report(rows, missing, thresholds, cmdargs.allow_missing) else 0)
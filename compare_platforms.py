@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import numpy as np
+from collections import defaultdict
+from scipy.stats import mannwhitneyu
+import results_store
+
+# Compares the measured DaCapo iteration times of two platforms (e.g. xen and xen_gangscheduled)
+# at every (benchmark, JVMs, heap) point both ran: bootstrap confidence intervals for the mean and
+# a tail percentile of each, and for the ratio of their means, a rank-sum test and Cliff's delta,
+# so a scheduler change can be called better or worse at a consolidation level with some confidence.
+DACAPO_DIR = 'dacapo'
+PLATFORMS = ['xen', 'xen_gangscheduled', 'linux']
+COMPARISON_FILE = "platform_comparison.csv"
+RESAMPLES = 10000
+CONFIDENCE = 0.95
+TAIL_PERCENTILE = 95
+ALPHA = 0.05
+# |Cliff's delta| thresholds of a small, medium and large effect (Romano et al.)
+EFFECT_SIZES = [(0.147, 'negligible'), (0.33, 'small'), (0.474, 'medium'), (1.0, 'large')]
+COLUMNS = ['benchmark', 'num_jvms', 'heap', 'baseline', 'candidate', 'baseline_n', 'candidate_n',
+           'baseline_mean', 'baseline_mean_low', 'baseline_mean_high', 'candidate_mean', 'candidate_mean_low', 'candidate_mean_high',
+           'baseline_tail', 'baseline_tail_low', 'baseline_tail_high', 'candidate_tail', 'candidate_tail_low', 'candidate_tail_high',
+           'ratio', 'ratio_low', 'ratio_high', 'u', 'p', 'cliffs_delta', 'effect', 'verdict']
+with open('dacapo_convergences.json', 'r') as f:
+  CONVERGENCES = json.load(f)
+
+def bootstrap(samples, statistic, resamples=RESAMPLES, rng=np.random):
+  # Returns statistic of resamples resamplings of samples, computed at once on a
+  # (resamples, len(samples)) array. statistic takes an axis argument like np.mean.
+  samples = np.asarray(samples, dtype=np.float64)
+  return statistic(samples[rng.randint(0, len(samples), (resamples, len(samples)))], axis=1)
+
+def interval(estimates, confidence=CONFIDENCE):
+  # Percentile bootstrap confidence interval
+  tail = (1 - confidence) / 2 * 100
+  return tuple(np.percentile(estimates, [tail, 100 - tail]))
+
+def tail_statistic(percentile):
+  return lambda samples, axis: np.percentile(samples, percentile, axis=axis)
+
+def effect_size(delta):
+  return next(label for threshold, label in EFFECT_SIZES if abs(delta) < threshold or threshold == 1.0)
+
+def compare(baseline, candidate, resamples=RESAMPLES, confidence=CONFIDENCE, tail=TAIL_PERCENTILE, alpha=ALPHA, rng=np.random):
+  # Returns {column -> value} comparing two samples of iteration times. ratio is candidate over
+  # baseline mean, so below 1 is faster; Cliff's delta is P(candidate > baseline) - P(candidate <
+  # baseline), so negative is faster. A difference is only called when the rank-sum test rejects
+  # at alpha and the ratio's interval excludes 1.
+  baseline, candidate = np.asarray(baseline, dtype=np.float64), np.asarray(candidate, dtype=np.float64)
+  row = {'baseline_n': len(baseline), 'candidate_n': len(candidate)}
+  means = {}
+  for name, samples in (('baseline', baseline), ('candidate', candidate)):
+    means[name] = bootstrap(samples, np.mean, resamples, rng)
+    tails = bootstrap(samples, tail_statistic(tail), resamples, rng)
+    row['%s_mean' % name] = np.mean(samples)
+    row['%s_mean_low' % name], row['%s_mean_high' % name] = interval(means[name], confidence)
+    row['%s_tail' % name] = np.percentile(samples, tail)
+    row['%s_tail_low' % name], row['%s_tail_high' % name] = interval(tails, confidence)
+  row['ratio'] = row['candidate_mean'] / row['baseline_mean']
+  row['ratio_low'], row['ratio_high'] = interval(means['candidate'] / means['baseline'], confidence)
+  if np.ptp(np.concatenate((baseline, candidate))) == 0:
+    row['u'], row['p'] = len(baseline) * len(candidate) / 2.0, 1.0
+  else:
+    row['u'], row['p'] = mannwhitneyu(candidate, baseline, alternative='two-sided')
+  row['cliffs_delta'] = 2 * row['u'] / (len(baseline) * len(candidate)) - 1
+  row['effect'] = effect_size(row['cliffs_delta'])
+  if row['p'] < alpha and row['ratio_high'] < 1:
+    row['verdict'] = 'faster'
+  elif row['p'] < alpha and row['ratio_low'] > 1:
+    row['verdict'] = 'slower'
+  else:
+    row['verdict'] = 'no difference'
+  return row
+
+def platform_samples(db, platform, benchmark):
+  # Returns {(num_jvms, heap) -> [runtime_ms]} of the measured iterations of every domain with a
+  # complete measurement window
+  samples = dict()
+  for point, domains in results_store.measured_iterations(db, DACAPO_DIR, platform, benchmark, CONVERGENCES.get(benchmark, 0)).iteritems():
+    runtimes = [runtime for size, rows in domains.values() if len(rows) == size for runtime, gc in rows]
+    if runtimes:
+      samples[point] = runtimes
+  return samples
+
+def compare_platforms(db, platforms, benchmarks=None, **options):
+  # Returns a row (see compare) for every pair of platforms, the earlier one as the baseline,
+  # at every point both ran
+  if benchmarks is None:
+    benchmarks = [benchmark for benchmark, in db.execute("SELECT DISTINCT benchmark FROM iterations WHERE suite = ? ORDER BY benchmark", (DACAPO_DIR,))]
+  rows = []
+  for benchmark in benchmarks:
+    samples = dict((platform, platform_samples(db, platform, benchmark)) for platform in platforms)
+    for baseline, candidate in itertools.combinations(platforms, 2):
+      for num_jvms, heap in sorted(set(samples[baseline]) & set(samples[candidate])):
+        row = compare(samples[baseline][(num_jvms, heap)], samples[candidate][(num_jvms, heap)], **options)
+        row.update({'benchmark': benchmark, 'num_jvms': num_jvms, 'heap': heap, 'baseline': baseline, 'candidate': candidate})
+        rows.append(row)
+  return rows
+
+def save_comparison(path, rows):
+  with open(path, 'wb') as f:
+    writer = csv.DictWriter(f, COLUMNS)
+    writer.writeheader()
+    for row in rows:
+      writer.writerow(dict((column, '%.6g' % value if isinstance(value, float) else value) for column, value in row.iteritems()))
+
+def print_summary(rows, confidence=CONFIDENCE):
+  print "%-8s %5s %6s  %-28s %22s %22s %18s %9s %7s  %s" % ("Bench", "JVMs", "Heap", "Candidate vs baseline", "Baseline mean (ms)",
+                                                         "Candidate mean (ms)", "Ratio %d%% CI" % (confidence * 100), "p", "Delta", "Verdict")
+  for row in rows:
+    print "%-8s %5d %6d  %-28s %9.1f [%5.0f,%5.0f] %9.1f [%5.0f,%5.0f] %5.3f [%.3f,%.3f] %9.2g %7.2f  %s (%s)" % (
+      row['benchmark'], row['num_jvms'], row['heap'], "%s vs %s" % (row['candidate'], row['baseline']),
+      row['baseline_mean'], row['baseline_mean_low'], row['baseline_mean_high'], row['candidate_mean'], row['candidate_mean_low'],
+      row['candidate_mean_high'], row['ratio'], row['ratio_low'], row['ratio_high'], row['p'], row['cliffs_delta'], row['verdict'], row['effect'])
+  # How often each candidate won, lost or tied at each consolidation level
+  print
+  verdicts = defaultdict(lambda: defaultdict(int))
+  for row in rows:
+    verdicts[(row['candidate'], row['baseline'], row['num_jvms'])][row['verdict']] += 1
+  print "%-28s %5s %7s %7s %14s" % ("Candidate vs baseline", "JVMs", "Faster", "Slower", "No difference")
+  for (candidate, baseline, num_jvms), counts in sorted(verdicts.iteritems()):
+    print "%-28s %5d %7d %7d %14d" % ("%s vs %s" % (candidate, baseline), num_jvms, counts['faster'], counts['slower'], counts['no difference'])
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("-r", "--resultsdir", action="store", help="name of the directory containing the results")
+  parser.add_argument("-s", "--store", action="store", default=None, help="results store to update and compare from (default: %s in the results directory)" % results_store.STORE_FILE)
+  parser.add_argument("-p", "--platforms", action="store", default=','.join(PLATFORMS), help="comma separated platforms to compare pairwise, earlier ones as the baseline (default: %(default)s)")
+  parser.add_argument("-b", "--benchmark", action="store", default=None, help="compare a specific benchmark")
+  parser.add_argument("-o", "--output", action="store", default=None, help="csv file to write every comparison to (default: %s in the results directory)" % COMPARISON_FILE)
+  parser.add_argument("-n", "--resamples", action="store", default=RESAMPLES, type=int, help="bootstrap resamples (default: %(default)s)")
+  parser.add_argument("-c", "--confidence", action="store", default=CONFIDENCE, type=float, help="confidence level of the intervals (default: %(default)s)")
+  parser.add_argument("--tail", action="store", default=TAIL_PERCENTILE, type=float, help="tail percentile of iteration time to bootstrap (default: %(default)s)")
+  parser.add_argument("--alpha", action="store", default=ALPHA, type=float, help="significance level of the rank-sum test (default: %(default)s)")
+  parser.add_argument("--seed", action="store", default=0, type=int, help="random seed, for repeatable intervals")
+  parser.add_argument("-j", "--jobs", action="store", default=0, type=int, help="how many processes to parse changed files on (default: one per cpu)")
+  cmdargs = parser.parse_args()
+
+  db = results_store.open_store(cmdargs.store or os.path.join(cmdargs.resultsdir, results_store.STORE_FILE))
+  print "Read %d changed files" % results_store.ingest(db, cmdargs.resultsdir, jobs=cmdargs.jobs)
+  rows = compare_platforms(db, cmdargs.platforms.split(','), [cmdargs.benchmark] if cmdargs.benchmark else None,
+                           resamples=cmdargs.resamples, confidence=cmdargs.confidence, tail=cmdargs.tail, alpha=cmdargs.alpha,
+                           rng=np.random.RandomState(cmdargs.seed))
+  output = cmdargs.output or os.path.join(cmdargs.resultsdir, COMPARISON_FILE)
+  save_comparison(output, rows)
+  print_summary(rows, cmdargs.confidence)
+  print "\nWrote %d comparisons to %s" % (len(rows), output)
@@ -0,0 +1,7 @@
+import sys
+
+# The parsers are python 2, the load generator python 3: each interpreter collects only the tests
+# of the modules it can import. The python 2 tests are unittest modules, as pytest is python 3 here.
+PYTHON2_TESTS = ['test_gc_log.py', 'test_parse_xentrace.py']
+PYTHON3_TESTS = ['test_cql_loadgen.py']
+collect_ignore = PYTHON2_TESTS if sys.version_info[0] >= 3 else PYTHON3_TESTS
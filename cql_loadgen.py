@@ -0,0 +1,802 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import re
+import string
+import struct
+import sys
+import time
+import numpy as np
+from latency_histogram import LatencyHistogram, save_histograms
+
+# Host side load generator for Cassandra in place of a YCSB domain per node: it speaks the CQL
+# native protocol (v4, or v3 if the node is older) from asyncio over many connections to many
+# nodes, so no load generating JVM competes with the JVMs under test. It runs the YCSB core
+# workloads against the usertable of init_ycsb_testtable.cql and prints YCSB's status lines and
+# summary (with measurementtype=histogram buckets), so its output parses like a YCSB run's.
+# With --target, the run phase is open loop: operations arrive at that rate (evenly spaced or as
+# a Poisson process) whether or not the nodes keep up, and latency is measured from when each was
+# meant to start, so a stalled node shows in the percentiles instead of just slowing the client.
+# "serve" runs a stand-in node with an in-memory usertable, to try it without a cluster.
+PROTOCOL_VERSIONS = [4, 3]
+CQL_VERSION = "3.0.0"
+DEFAULT_PORT = 9042
+HEADER = struct.Struct('>BBhBi')
+RESPONSE_FLAG = 0x80
+# Opcodes
+ERROR, STARTUP, READY, OPTIONS, SUPPORTED, QUERY, RESULT, PREPARE, EXECUTE = 0x00, 0x01, 0x02, 0x05, 0x06, 0x07, 0x08, 0x09, 0x0A
+# Result kinds
+RESULT_VOID, RESULT_ROWS, RESULT_SET_KEYSPACE, RESULT_PREPARED, RESULT_SCHEMA_CHANGE = 1, 2, 3, 4, 5
+# Error codes
+SERVER_ERROR, PROTOCOL_ERROR, SYNTAX_ERROR, INVALID, ALREADY_EXISTS, UNPREPARED = 0x0000, 0x000A, 0x2000, 0x2200, 0x2400, 0x2500
+CONSISTENCY_ONE = 0x0001
+VALUES_FLAG = 0x01
+GLOBAL_TABLE_SPEC, HAS_MORE_PAGES, NO_METADATA = 0x0001, 0x0002, 0x0004
+VARCHAR = 0x000D
+MAX_STREAMS = 32768
+
+# YCSB core workloads, as in YCSB's workloads/workloadX files
+CORE_WORKLOADS = {
+    'a': {'readproportion': '0.5', 'updateproportion': '0.5', 'requestdistribution': 'zipfian'},
+    'b': {'readproportion': '0.95', 'updateproportion': '0.05', 'requestdistribution': 'zipfian'},
+    'c': {'readproportion': '1', 'updateproportion': '0', 'requestdistribution': 'zipfian'},
+    'f': {'readproportion': '0.5', 'updateproportion': '0', 'readmodifywriteproportion': '0.5', 'requestdistribution': 'zipfian'},
+}
+DEFAULT_PROPERTIES = {'recordcount': '1000', 'operationcount': '1000', 'insertstart': '0', 'fieldcount': '10', 'fieldlength': '100',
+                      'readallfields': 'true', 'writeallfields': 'false', 'readproportion': '0.95', 'updateproportion': '0.05',
+                      'readmodifywriteproportion': '0', 'insertproportion': '0', 'requestdistribution': 'uniform',
+                      'table': 'usertable', 'keyspace': 'ycsb', 'histogram.buckets': '1000'}
+# (operation, YCSB summary section), in the order YCSB prints them
+OPERATIONS = [('insert', 'INSERT'), ('read', 'READ'), ('update', 'UPDATE'), ('readmodifywrite', 'READ-MODIFY-WRITE')]
+KEY_COLUMN = 'y_id'
+FIELD_COLUMN = 'field%d'
+# Random field values are drawn from a pool rather than generated per operation
+VALUE_POOL = 1024
+# Latencies are batched into the histograms every this many operations
+FLUSH_BATCH = 4096
+# Zipfian constants of YCSB's ZipfianGenerator and ScrambledZipfianGenerator
+ZIPFIAN_CONSTANT = 0.99
+SCRAMBLED_ITEM_COUNT = 10000000000
+SCRAMBLED_ZETAN = 26.46902820178302
+FNV_OFFSET_BASIS_64 = 0xCBF29CE484222325
+FNV_PRIME_64 = 1099511628211
+ARRIVALS = ['constant', 'poisson']
+
+
+class CqlError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, "CQL error 0x%04x: %s" % (code, message))
+        self.code = code
+        self.message = message
+
+
+def packString(s):
+    data = s.encode('utf-8')
+    return struct.pack('>H', len(data)) + data
+
+def packLongString(s):
+    data = s.encode('utf-8')
+    return struct.pack('>i', len(data)) + data
+
+def packBytes(data):
+    if data is None:
+        return struct.pack('>i', -1)
+    return struct.pack('>i', len(data)) + data
+
+def packShortBytes(data):
+    return struct.pack('>H', len(data)) + data
+
+def packStringMap(values):
+    return struct.pack('>H', len(values)) + b''.join(packString(k) + packString(v) for k, v in values.items())
+
+def packStringMultimap(values):
+    return struct.pack('>H', len(values)) + b''.join(packString(k) + struct.pack('>H', len(v)) + b''.join(packString(s) for s in v)
+                                                     for k, v in values.items())
+
+def packFrame(version, stream, opcode, body, response=False):
+    return HEADER.pack(version | (RESPONSE_FLAG if response else 0), 0, stream, opcode, len(body)) + body
+
+def packError(code, message):
+    return struct.pack('>i', code) + packString(message)
+
+
+class BodyReader(object):
+    # Cursor over the body of a frame
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt, size):
+        value = struct.unpack_from(fmt, self.data, self.offset)[0]
+        self.offset += size
+        return value
+
+    def readByte(self):
+        return self.unpack('>B', 1)
+
+    def readShort(self):
+        return self.unpack('>H', 2)
+
+    def readInt(self):
+        return self.unpack('>i', 4)
+
+    def readRaw(self, length):
+        data = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return data
+
+    def readString(self):
+        return self.readRaw(self.readShort()).decode('utf-8')
+
+    def readLongString(self):
+        return self.readRaw(self.readInt()).decode('utf-8')
+
+    def readBytes(self):
+        length = self.readInt()
+        return None if length < 0 else self.readRaw(length)
+
+    def readShortBytes(self):
+        return self.readRaw(self.readShort())
+
+    def readStringMap(self):
+        return dict((self.readString(), self.readString()) for i in range(self.readShort()))
+
+    def readStringMultimap(self):
+        return dict((self.readString(), [self.readString() for j in range(self.readShort())]) for i in range(self.readShort()))
+
+    def readOption(self):
+        # Skips over a column type, returning its id
+        kind = self.readShort()
+        if kind == 0x0000:
+            self.readString()
+        elif kind in (0x0020, 0x0022):
+            self.readOption()
+        elif kind == 0x0021:
+            self.readOption()
+            self.readOption()
+        elif kind == 0x0030:
+            self.readString()
+            self.readString()
+            for i in range(self.readShort()):
+                self.readString()
+                self.readOption()
+        elif kind == 0x0031:
+            for i in range(self.readShort()):
+                self.readOption()
+        return kind
+
+    def readMetadata(self, version, prepared=False):
+        # Returns the column names of rows or prepared metadata
+        flags = self.readInt()
+        count = self.readInt()
+        if prepared and version >= 4:
+            for i in range(self.readInt()):
+                self.readShort()
+        if flags & HAS_MORE_PAGES:
+            self.readBytes()
+        if flags & NO_METADATA:
+            return []
+        if flags & GLOBAL_TABLE_SPEC:
+            self.readString()
+            self.readString()
+        columns = []
+        for i in range(count):
+            if not flags & GLOBAL_TABLE_SPEC:
+                self.readString()
+                self.readString()
+            columns.append(self.readString())
+            self.readOption()
+        return columns
+
+
+async def readFrame(reader):
+    # Returns (version, stream, opcode, body) of the next frame
+    version, flags, stream, opcode, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return version & ~RESPONSE_FLAG, stream, opcode, await reader.readexactly(length)
+
+
+class CqlConnection(object):
+    # A connection to one node, multiplexing requests over stream ids
+    def __init__(self, host, port=DEFAULT_PORT, version=None):
+        self.host = host
+        self.port = port
+        self.version = version
+        self.writer = None
+        self.readerTask = None
+        self.pending = {}
+        self.streams = list(range(MAX_STREAMS - 1, -1, -1))
+        self.available = asyncio.Semaphore(MAX_STREAMS)
+        self.prepared = {}
+
+    async def connect(self):
+        # Starts up on the newest protocol version the node supports
+        for version in ([self.version] if self.version else PROTOCOL_VERSIONS):
+            reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.version = version
+            self.readerTask = asyncio.ensure_future(self.readResponses(reader))
+            try:
+                await self.request(STARTUP, packStringMap({'CQL_VERSION': CQL_VERSION}))
+                return self
+            except (CqlError, ConnectionError) as e:
+                await self.close()
+                if isinstance(e, CqlError) and e.code != PROTOCOL_ERROR:
+                    raise
+        raise CqlError(PROTOCOL_ERROR, "%s:%d supports none of protocol versions %s" % (self.host, self.port, PROTOCOL_VERSIONS))
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.readerTask is not None:
+            await asyncio.gather(self.readerTask, return_exceptions=True)
+            self.readerTask = None
+
+    async def readResponses(self, reader):
+        try:
+            while True:
+                version, stream, opcode, body = await readFrame(reader)
+                future = self.pending.get(stream)
+                if future is not None and not future.done():
+                    future.set_result((opcode, body))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            error = e
+        except asyncio.CancelledError:
+            error = ConnectionError("connection closed")
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("connection to %s:%d lost: %s" % (self.host, self.port, error)))
+
+    async def request(self, opcode, body):
+        # Returns a BodyReader of the response, raising CqlError on an ERROR response
+        async with self.available:
+            stream = self.streams.pop()
+            future = asyncio.get_running_loop().create_future()
+            self.pending[stream] = future
+            try:
+                self.writer.write(packFrame(self.version, stream, opcode, body))
+                opcode, body = await future
+            finally:
+                del self.pending[stream]
+                self.streams.append(stream)
+        response = BodyReader(body)
+        if opcode == ERROR:
+            raise CqlError(response.readInt(), response.readString())
+        return response
+
+    def parseResult(self, response):
+        # Returns rows (lists of column values) for ROWS, the statement id for PREPARED, else None
+        kind = response.readInt()
+        if kind == RESULT_ROWS:
+            columns = response.readMetadata(self.version)
+            return [[response.readBytes() for c in columns] for r in range(response.readInt())]
+        if kind == RESULT_PREPARED:
+            return response.readShortBytes()
+        return None
+
+    async def query(self, cql):
+        body = packLongString(cql) + struct.pack('>HB', CONSISTENCY_ONE, 0)
+        return self.parseResult(await self.request(QUERY, body))
+
+    async def prepare(self, cql):
+        if cql not in self.prepared:
+            self.prepared[cql] = self.parseResult(await self.request(PREPARE, packLongString(cql)))
+        return self.prepared[cql]
+
+    async def execute(self, cql, values):
+        statementId = await self.prepare(cql)
+        body = (packShortBytes(statementId) + struct.pack('>HBH', CONSISTENCY_ONE, VALUES_FLAG, len(values)) +
+                b''.join(packBytes(value) for value in values))
+        try:
+            return self.parseResult(await self.request(EXECUTE, body))
+        except CqlError as e:
+            if e.code != UNPREPARED:
+                raise
+            # The node forgot the statement (e.g. it restarted): prepare it again
+            del self.prepared[cql]
+            return await self.execute(cql, values)
+
+
+def fnvhash64(value):
+    # YCSB's Utils.FNVhash64, a non-negative java long
+    hashval = FNV_OFFSET_BASIS_64
+    for i in range(8):
+        hashval ^= value & 0xff
+        hashval = (hashval * FNV_PRIME_64) & 0xFFFFFFFFFFFFFFFF
+        value >>= 8
+    return abs(hashval - (1 << 64) if hashval >= 1 << 63 else hashval)
+
+def zeta(items, theta):
+    total = 0.0
+    for start in range(1, items + 1, 1 << 20):
+        total += float(np.sum(np.arange(start, min(start + (1 << 20), items + 1), dtype=np.float64) ** -theta))
+    return total
+
+
+class ZipfianGenerator(object):
+    # YCSB's ZipfianGenerator (Gray et al., "Quickly generating billion-record synthetic databases")
+    def __init__(self, items, theta=ZIPFIAN_CONSTANT, zetan=None):
+        self.items = items
+        self.theta = theta
+        self.alpha = 1.0 / (1.0 - theta)
+        self.zetan = zetan if zetan is not None else zeta(items, theta)
+        self.eta = (1 - (2.0 / items) ** (1 - theta)) / (1 - zeta(2, theta) / self.zetan)
+
+    def next(self, rng):
+        u = rng.random()
+        uz = u * self.zetan
+        if uz < 1.0:
+            return 0
+        if uz < 1.0 + 0.5 ** self.theta:
+            return 1
+        return int(self.items * (self.eta * u - self.eta + 1) ** self.alpha)
+
+
+class KeyChooser(object):
+    # Key numbers of requestdistribution: uniform, or zipfian scrambled over the key space as by
+    # YCSB's ScrambledZipfianGenerator, so the popular keys are not the first ones loaded
+    def __init__(self, distribution, start, count):
+        self.start = start
+        self.count = count
+        if distribution == 'zipfian':
+            self.zipfian = ZipfianGenerator(SCRAMBLED_ITEM_COUNT, zetan=SCRAMBLED_ZETAN)
+        elif distribution == 'uniform':
+            self.zipfian = None
+        else:
+            raise ValueError("Unsupported requestdistribution %s" % distribution)
+
+    def next(self, rng):
+        if self.zipfian is None:
+            return self.start + rng.randrange(self.count)
+        return self.start + fnvhash64(self.zipfian.next(rng)) % self.count
+
+
+class Workload(object):
+    # A YCSB core workload over usertable: keys "user" + fnvhash64(keynum), fieldcount varchar fields
+    def __init__(self, properties, seed=None):
+        self.properties = properties
+        self.table = properties['table']
+        self.fieldCount = int(properties['fieldcount'])
+        self.fieldLength = int(properties['fieldlength'])
+        self.recordCount = int(properties['recordcount'])
+        self.insertStart = int(properties['insertstart'])
+        self.readAllFields = properties['readallfields'] == 'true'
+        self.writeAllFields = properties['writeallfields'] == 'true'
+        self.rng = random.Random(seed)
+        self.keys = KeyChooser(properties['requestdistribution'], self.insertStart, self.recordCount)
+        self.nextInsert = self.insertStart + self.recordCount
+        operations = [(operation, float(properties['%sproportion' % operation])) for operation, section in OPERATIONS]
+        self.operations = [operation for operation, proportion in operations if proportion > 0]
+        self.weights = [proportion for operation, proportion in operations if proportion > 0]
+        if not self.operations:
+            raise ValueError("The workload has no operations with a proportion above 0")
+        alphabet = (string.ascii_letters + string.digits).encode('ascii')
+        self.values = [bytes(self.rng.choice(alphabet) for i in range(self.fieldLength)) for j in range(VALUE_POOL)]
+        fields = [FIELD_COLUMN % i for i in range(self.fieldCount)]
+        self.insertCql = "INSERT INTO %s (%s, %s) VALUES (?, %s)" % (self.table, KEY_COLUMN, ", ".join(fields), ", ".join("?" for f in fields))
+        self.readCql = ["SELECT %s FROM %s WHERE %s = ?" % (field, self.table, KEY_COLUMN) for field in fields]
+        self.readAllCql = "SELECT * FROM %s WHERE %s = ?" % (self.table, KEY_COLUMN)
+        self.updateCql = ["UPDATE %s SET %s = ? WHERE %s = ?" % (self.table, field, KEY_COLUMN) for field in fields]
+        self.updateAllCql = "UPDATE %s SET %s WHERE %s = ?" % (self.table, ", ".join("%s = ?" % f for f in fields), KEY_COLUMN)
+
+    def keyName(self, keynum):
+        return ("user%d" % fnvhash64(keynum)).encode('ascii')
+
+    def value(self):
+        return self.rng.choice(self.values)
+
+    def chooseOperation(self):
+        return self.rng.choices(self.operations, self.weights)[0]
+
+    async def insert(self, connection, keynum):
+        await connection.execute(self.insertCql, [self.keyName(keynum)] + [self.value() for i in range(self.fieldCount)])
+
+    async def read(self, connection, key):
+        if self.readAllFields:
+            return await connection.execute(self.readAllCql, [key])
+        return await connection.execute(self.readCql[self.rng.randrange(self.fieldCount)], [key])
+
+    async def update(self, connection, key):
+        if self.writeAllFields:
+            await connection.execute(self.updateAllCql, [self.value() for i in range(self.fieldCount)] + [key])
+        else:
+            await connection.execute(self.updateCql[self.rng.randrange(self.fieldCount)], [self.value(), key])
+
+    async def doTransaction(self, connection, operation, measurements):
+        # Reads and updates of a read-modify-write are also measured on their own, as YCSB's DBWrapper does
+        if operation == 'insert':
+            # Inserted keys are not chosen by later operations, as in YCSB with a fixed keychooser
+            keynum = self.nextInsert
+            self.nextInsert += 1
+            await self.insert(connection, keynum)
+            return
+        key = self.keyName(self.keys.next(self.rng))
+        if operation == 'read':
+            await self.read(connection, key)
+        elif operation == 'update':
+            await self.update(connection, key)
+        else:
+            begin = time.perf_counter()
+            await self.read(connection, key)
+            middle = time.perf_counter()
+            await self.update(connection, key)
+            measurements.record('read', int((middle - begin) * 1000000), counted=False)
+            measurements.record('update', int((time.perf_counter() - middle) * 1000000), counted=False)
+
+
+class Measurements(object):
+    # Latencies in us of each operation: exactly per ms bucket for YCSB's histogram summary, and in a
+    # LatencyHistogram for percentiles, plus the interval sums behind the status lines
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.pending = dict((operation, []) for operation, section in OPERATIONS)
+        self.histograms = dict((operation, LatencyHistogram()) for operation, section in OPERATIONS)
+        self.msCounts = dict((operation, np.zeros(buckets + 1, dtype=np.int64)) for operation, section in OPERATIONS)
+        self.sums = dict((operation, 0) for operation, section in OPERATIONS)
+        self.errors = dict((operation, 0) for operation, section in OPERATIONS)
+        self.intervalSums = dict((operation, [0, 0]) for operation, section in OPERATIONS)
+        self.operations = 0
+
+    def record(self, operation, latency, ok=True, counted=True):
+        # counted is False for the parts of an operation, which do not add to the throughput
+        if counted:
+            self.operations += 1
+        if not ok:
+            self.errors[operation] += 1
+            return
+        self.pending[operation].append(latency)
+        self.sums[operation] += latency
+        self.intervalSums[operation][0] += latency
+        self.intervalSums[operation][1] += 1
+        if len(self.pending[operation]) >= FLUSH_BATCH:
+            self.flush(operation)
+
+    def flush(self, operation):
+        latencies = np.array(self.pending[operation], dtype=np.int64)
+        self.pending[operation] = []
+        self.histograms[operation].record_values(latencies)
+        self.msCounts[operation] += np.bincount(np.minimum(latencies // 1000, self.buckets), minlength=self.buckets + 1)
+
+    def intervalLatencies(self):
+        # Returns [(section, mean latency in us)] since the last call
+        latencies = []
+        for operation, section in OPERATIONS:
+            total, count = self.intervalSums[operation]
+            if count:
+                latencies.append((section, float(total) / count))
+            self.intervalSums[operation] = [0, 0]
+        return latencies
+
+    def summary(self, runtime, target=0):
+        # YCSB's end of run summary with measurementtype=histogram
+        for operation, section in OPERATIONS:
+            self.flush(operation)
+        lines = ["[OVERALL], RunTime(ms), %.1f" % (runtime * 1000),
+                 "[OVERALL], Throughput(ops/sec), %s" % (self.operations / runtime if runtime > 0 else 0.0)]
+        if target:
+            lines.append("[OVERALL], Target(ops/sec), %s" % target)
+        for operation, section in OPERATIONS:
+            histogram = self.histograms[operation]
+            count = histogram.count()
+            if not count and not self.errors[operation]:
+                continue
+            lines += ["[%s], Operations, %d" % (section, count + self.errors[operation]),
+                      "[%s], AverageLatency(us), %s" % (section, float(self.sums[operation]) / count if count else 0.0),
+                      "[%s], MinLatency(us), %d" % (section, histogram.min_value or 0),
+                      "[%s], MaxLatency(us), %d" % (section, histogram.max_value or 0),
+                      "[%s], 95thPercentileLatency(ms), %d" % (section, histogram.percentile(95) // 1000),
+                      "[%s], 99thPercentileLatency(ms), %d" % (section, histogram.percentile(99) // 1000),
+                      "[%s], Return=0, %d" % (section, count)]
+            if self.errors[operation]:
+                lines.append("[%s], Return=-1, %d" % (section, self.errors[operation]))
+            lines += ["[%s], %d, %d" % (section, ms, self.msCounts[operation][ms]) for ms in range(self.buckets)]
+            lines.append("[%s], >%d, %d" % (section, self.buckets, self.msCounts[operation][self.buckets]))
+        return "\n".join(lines)
+
+    def saveHistograms(self, path):
+        # The full resolution histograms by YCSB section, which merge exactly across runs and instances
+        for operation, section in OPERATIONS:
+            self.flush(operation)
+        save_histograms(path, dict((section, self.histograms[operation]) for operation, section in OPERATIONS if self.histograms[operation].count()))
+
+
+def loadProperties(workload, overrides):
+    # YCSB properties: the defaults, then a core workload letter or a workload file, then -p overrides
+    properties = dict(DEFAULT_PROPERTIES)
+    if workload:
+        name = workload.lower()
+        name = name[len('workload'):] if name.startswith('workload') else name
+        if not os.path.exists(workload) and name in CORE_WORKLOADS:
+            properties.update(CORE_WORKLOADS[name])
+        else:
+            with open(workload, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#') and '=' in line:
+                        key, value = line.split('=', 1)
+                        properties[key.strip()] = value.strip()
+    for override in overrides or []:
+        key, value = override.split('=', 1)
+        properties[key.strip()] = value.strip()
+    return properties
+
+async def openConnections(hosts, port, perHost, version=None):
+    connections = [CqlConnection(host, port, version) for host in hosts for i in range(perHost)]
+    await asyncio.gather(*[connection.connect() for connection in connections])
+    return connections
+
+async def createSchema(connection, path):
+    # Runs the statements of a cql file, such as init_ycsb_testtable.cql, ignoring those that exist
+    with open(path, 'r') as f:
+        statements = [statement.strip() for statement in f.read().split(';')]
+    for statement in statements:
+        if statement:
+            try:
+                await connection.query(statement)
+            except CqlError as e:
+                if e.code != ALREADY_EXISTS:
+                    raise
+
+async def reportStatus(measurements, start, interval, done):
+    # YCSB's -s status lines, every interval seconds until done
+    last, lastOperations = start, 0
+    while not done.is_set():
+        try:
+            await asyncio.wait_for(done.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        now = time.time()
+        operations = measurements.operations
+        latencies = "".join(" [%s AverageLatency(us)=%.2f]" % latency for latency in measurements.intervalLatencies())
+        print(" %d sec: %d operations; %.1f current ops/sec;%s" % (int(now - start), operations,
+              (operations - lastOperations) / (now - last) if now > last else 0.0, latencies), flush=True)
+        last, lastOperations = now, operations
+
+async def runPhase(options, properties):
+    # Runs the load (inserts of every record) or run (operationcount transactions) phase and prints its summary
+    workload = Workload(properties, options.seed)
+    connections = await openConnections(options.hosts.split(','), options.port, options.connections, options.protocol_version)
+    if options.schema:
+        await createSchema(connections[0], options.schema)
+    for connection in connections:
+        await connection.query("USE %s" % properties['keyspace'])
+    measurements = Measurements(int(properties['histogram.buckets']))
+    total = workload.recordCount if options.phase == 'load' else int(properties['operationcount'])
+    target = options.target if options.phase == 'run' else 0
+    issued = [0]
+    arrivals = asyncio.Queue()
+
+    async def operate(connection, operation, keynum, begin):
+        try:
+            if options.phase == 'load':
+                await workload.insert(connection, keynum)
+            else:
+                await workload.doTransaction(connection, operation, measurements)
+            ok = True
+        except (CqlError, ConnectionError) as e:
+            print("Error in %s: %s" % (operation, e), file=sys.stderr)
+            ok = False
+        measurements.record(operation, int((time.perf_counter() - begin) * 1000000), ok)
+
+    async def worker(connection):
+        # Closed loop: the next operation starts when the last one is done
+        while issued[0] < total:
+            if options.phase == 'load':
+                operation, keynum = 'insert', workload.insertStart + issued[0]
+            else:
+                operation, keynum = workload.chooseOperation(), None
+            issued[0] += 1
+            await operate(connection, operation, keynum, time.perf_counter())
+
+    async def openWorker(connection):
+        # Open loop: operations wait in arrivals while every worker is busy, and that wait counts
+        while True:
+            intended = await arrivals.get()
+            if intended is None:
+                return
+            await operate(connection, workload.chooseOperation(), None, intended)
+
+    async def arrive(workers):
+        # Queues each operation at its intended start time
+        rng = random.Random(options.seed)
+        intended = time.perf_counter()
+        for i in range(total):
+            intended += rng.expovariate(target) if options.arrival == 'poisson' else 1.0 / target
+            await asyncio.sleep(max(intended - time.perf_counter(), 0))
+            arrivals.put_nowait(intended)
+        for i in range(workers):
+            arrivals.put_nowait(None)
+
+    start = time.time()
+    done = asyncio.Event()
+    status = asyncio.ensure_future(reportStatus(measurements, start, options.status_interval, done)) if options.status_interval > 0 else None
+    if target:
+        workers = [openWorker(connection) for connection in connections for i in range(options.concurrency)]
+        await asyncio.gather(arrive(len(workers)), *workers)
+    else:
+        await asyncio.gather(*[worker(connection) for connection in connections for i in range(options.concurrency)])
+    runtime = time.time() - start
+    done.set()
+    if status is not None:
+        await status
+    for connection in connections:
+        await connection.close()
+    print(measurements.summary(runtime, target), flush=True)
+    if options.histogram_file:
+        measurements.saveHistograms(options.histogram_file)
+
+
+class StandInNode(object):
+    # Enough of a Cassandra node for the load generator: keyspaces are ignored, each table is a dict
+    # of rows, and SELECT/INSERT/UPDATE by key work as prepared statements. service time and
+    # workers emulate a node of limited capacity, versions an older node (e.g. [3]).
+    def __init__(self, serviceTime=0.0, workers=0, versions=PROTOCOL_VERSIONS):
+        self.serviceTime = serviceTime
+        self.versions = versions
+        self.workers = asyncio.Semaphore(workers) if workers else None
+        self.columns = {}
+        self.tables = {}
+        self.statements = {}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                version, stream, opcode, body = await readFrame(reader)
+                if version not in self.versions:
+                    writer.write(packFrame(max(self.versions), stream, ERROR,
+                                           packError(PROTOCOL_ERROR, "Invalid or unsupported protocol version (%d)" % version), True))
+                    await writer.drain()
+                    break
+                asyncio.ensure_future(self.respond(writer, version, stream, opcode, body))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    async def respond(self, writer, version, stream, opcode, body):
+        if self.workers is not None:
+            await self.workers.acquire()
+        try:
+            if self.serviceTime:
+                await asyncio.sleep(self.serviceTime)
+            try:
+                opcode, body = self.process(version, opcode, BodyReader(body))
+            except CqlError as e:
+                opcode, body = ERROR, packError(e.code, e.message)
+            except Exception as e:
+                opcode, body = ERROR, packError(SERVER_ERROR, str(e))
+        finally:
+            if self.workers is not None:
+                self.workers.release()
+        if not writer.is_closing():
+            writer.write(packFrame(version, stream, opcode, body, True))
+
+    def process(self, version, opcode, request):
+        if opcode == OPTIONS:
+            return SUPPORTED, packStringMultimap({'CQL_VERSION': [CQL_VERSION], 'COMPRESSION': []})
+        if opcode == STARTUP:
+            return READY, b''
+        if opcode == QUERY:
+            return RESULT, self.query(request.readLongString())
+        if opcode == PREPARE:
+            return RESULT, self.prepare(version, request.readLongString())
+        if opcode == EXECUTE:
+            statementId = request.readShortBytes()
+            if statementId not in self.statements:
+                raise CqlError(UNPREPARED, "Prepared query with ID %s not found" % statementId.hex())
+            request.readShort()
+            flags = request.readByte()
+            values = [request.readBytes() for i in range(request.readShort())] if flags & VALUES_FLAG else []
+            return RESULT, self.execute(self.statements[statementId], values)
+        raise CqlError(PROTOCOL_ERROR, "Unsupported opcode 0x%02x" % opcode)
+
+    def query(self, cql):
+        words = cql.split()
+        if words[0].lower() == 'use':
+            return struct.pack('>i', RESULT_SET_KEYSPACE) + packString(words[1].strip('"'))
+        match = re.match(r"create\s+table\s+(?:if\s+not\s+exists\s+)?(?:\w+\.)?(\w+)\s*\((.*)\)\s*$", cql, re.I | re.S)
+        if match:
+            table = match.group(1)
+            if table in self.columns:
+                raise CqlError(ALREADY_EXISTS, "Table %s already exists" % table)
+            definitions = [definition.split() for definition in match.group(2).split(',') if definition.strip()]
+            keys = [d[0] for d in definitions if ' '.join(d[2:]).lower() == 'primary key']
+            columns = [d[0] for d in definitions if d[0].lower() != 'primary']
+            # The key first, then the rest in order
+            self.columns[table] = (keys or columns[:1]) + [c for c in columns if c not in keys]
+            self.tables[table] = {}
+            return struct.pack('>i', RESULT_SCHEMA_CHANGE) + packString('CREATED') + packString('TABLE') + packString('ycsb') + packString(table)
+        if re.match(r"create\s+keyspace", cql, re.I):
+            return struct.pack('>i', RESULT_SCHEMA_CHANGE) + packString('CREATED') + packString('KEYSPACE') + packString(words[2])
+        match = re.match(r"truncate\s+(?:\w+\.)?(\w+)", cql, re.I)
+        if match:
+            self.tables.get(match.group(1), {}).clear()
+            return struct.pack('>i', RESULT_VOID)
+        raise CqlError(INVALID, "The stand-in node only runs schema statements unprepared: %s" % cql)
+
+    def prepare(self, version, cql):
+        # Prepared statements are (kind, table, bound columns, selected columns)
+        match = re.match(r"select\s+(.+?)\s+from\s+(?:\w+\.)?(\w+)\s+where\s+(\w+)\s*=\s*\?$", cql, re.I)
+        if match:
+            selected, table, key = match.groups()
+            statement = ('select', table, [key], None if selected.strip() == '*' else [c.strip() for c in selected.split(',')])
+        else:
+            match = re.match(r"insert\s+into\s+(?:\w+\.)?(\w+)\s*\((.+?)\)\s*values", cql, re.I)
+            if match:
+                statement = ('insert', match.group(1), [c.strip() for c in match.group(2).split(',')], None)
+            else:
+                match = re.match(r"update\s+(?:\w+\.)?(\w+)\s+set\s+(.+?)\s+where\s+(\w+)\s*=\s*\?$", cql, re.I)
+                if not match:
+                    raise CqlError(SYNTAX_ERROR, "The stand-in node cannot prepare: %s" % cql)
+                table, assignments, key = match.groups()
+                statement = ('update', table, [a.split('=')[0].strip() for a in assignments.split(',')] + [key], None)
+        kind, table, bound, selected = statement
+        if table not in self.columns:
+            raise CqlError(INVALID, "unconfigured table %s" % table)
+        statementId = hashlib.md5(cql.encode('utf-8')).digest()
+        self.statements[statementId] = statement
+        key = self.columns[table][0]
+        metadata = struct.pack('>ii', GLOBAL_TABLE_SPEC, len(bound))
+        if version >= 4:
+            metadata += struct.pack('>iH', 1, bound.index(key))
+        metadata += packString('ycsb') + packString(table) + b''.join(packString(c) + struct.pack('>H', VARCHAR) for c in bound)
+        if kind == 'select':
+            metadata += self.rowsMetadata(table, selected)
+        else:
+            metadata += struct.pack('>ii', NO_METADATA, 0)
+        return struct.pack('>i', RESULT_PREPARED) + packShortBytes(statementId) + metadata
+
+    def rowsMetadata(self, table, selected):
+        columns = selected or self.columns[table]
+        return (struct.pack('>ii', GLOBAL_TABLE_SPEC, len(columns)) + packString('ycsb') + packString(table) +
+                b''.join(packString(c) + struct.pack('>H', VARCHAR) for c in columns))
+
+    def execute(self, statement, values):
+        kind, table, bound, selected = statement
+        if len(values) != len(bound):
+            raise CqlError(INVALID, "There were %d markers(?) in CQL but %d bound variables" % (len(bound), len(values)))
+        row = dict(zip(bound, values))
+        key = row.pop(self.columns[table][0])
+        if kind == 'select':
+            stored = self.tables[table].get(key)
+            rows = [] if stored is None else [[key if c == self.columns[table][0] else stored.get(c) for c in selected or self.columns[table]]]
+            return (struct.pack('>i', RESULT_ROWS) + self.rowsMetadata(table, selected) + struct.pack('>i', len(rows)) +
+                    b''.join(packBytes(value) for r in rows for value in r))
+        self.tables[table].setdefault(key, {}).update(row)
+        return struct.pack('>i', RESULT_VOID)
+
+async def serve(options):
+    node = StandInNode(options.service_ms / 1000.0, options.workers)
+    server = await asyncio.start_server(node.handle, options.listen, options.port)
+    print("Stand-in CQL node listening on %s:%d" % (options.listen, options.port), flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='run')
+    parser.add_argument("phase", choices=['load', 'run', 'serve'], help="load the records, run the transactions, or serve a stand-in node")
+    parser.add_argument("--hosts", action="store", default="127.0.0.1", help="comma separated nodes to send to")
+    parser.add_argument("--port", action="store", default=DEFAULT_PORT, type=int, help="native protocol port (default: %(default)s)")
+    parser.add_argument("-P", "--workload", action="store", default="", help="YCSB workload file, or core workload a, b, c or f")
+    parser.add_argument("-p", "--property", action="append", default=[], dest="properties", help="YCSB property key=value, overriding the workload's")
+    parser.add_argument("--connections", action="store", default=1, type=int, help="connections to each node (default: %(default)s)")
+    parser.add_argument("--concurrency", action="store", default=2, type=int, help="operations in flight on each connection, like YCSB's threadcount; with --target, the most in flight at once (default: %(default)s)")
+    parser.add_argument("--protocol-version", action="store", default=None, type=int, choices=PROTOCOL_VERSIONS, help="native protocol version (default: the newest the node supports)")
+    parser.add_argument("--schema", action="store", default=None, help="cql file to create the keyspace and table from first, such as init_ycsb_testtable.cql")
+    parser.add_argument("--target", action="store", default=0.0, type=float, help="operations per second to offer in the run phase, open loop (default: closed loop)")
+    parser.add_argument("--arrival", action="store", default="constant", choices=ARRIVALS, help="arrival process of the open loop operations (default: %(default)s)")
+    parser.add_argument("--histogram-file", action="store", default=None, help="npz file to save the run's latency histograms into, for merging (see latency_histogram.py)")
+    parser.add_argument("--status-interval", action="store", default=1.0, type=float, help="seconds between status lines (0 to disable)")
+    parser.add_argument("--seed", action="store", default=None, type=int, help="random seed, for a repeatable operation sequence")
+    parser.add_argument("--listen", action="store", default="127.0.0.1", help="address the stand-in node listens on")
+    parser.add_argument("--service-ms", action="store", default=0.0, type=float, help="milliseconds the stand-in node takes per request")
+    parser.add_argument("--workers", action="store", default=0, type=int, help="requests the stand-in node serves at once (0 for no limit)")
+    cmdargs = parser.parse_args()
+
+    if cmdargs.phase == 'serve':
+        asyncio.run(serve(cmdargs))
+    else:
+        asyncio.run(runPhase(cmdargs, loadProperties(cmdargs.workload, cmdargs.properties)))
@@ -1,27 +1,127 @@
 #!/usr/bin/env python
 
 import argparse
+import hashlib
 import json
 import math
+import multiprocessing
 import random
 import re
+import shutil
 import subprocess
+import tempfile
 
 ALL_BENCHMARKS = ["avrora", "h2", "jython", "luindex", "lusearch", "xalan"]
 CONVERGENCE_PATTERN = r'warmup (\d+)'
+CACHE_FILE = "dacapo_convergence_cache.json"
+
+# CPU set the current pool worker is pinned to
+workerCpus = None
+
+def initWorker(cpuSets):
+    global workerCpus
+    workerCpus = cpuSets.get()
+
+def runTrial(task):
+    # Returns (task, convergence iteration, None), or (task, None, error) if the trial failed
+    try:
+        return task, convergenceTrial(task), None
+    except Exception as e:
+        return task, None, "%s: %s" % (type(e).__name__, e)
+
+def convergenceTrial(task):
+    dacapo, heap, benchmark = task
+    # Every trial gets its own scratch directory so concurrent trials don't clobber each other
+    scratch = tempfile.mkdtemp(prefix='scratch')
+    cmd = ['taskset', '-c', workerCpus, 'java']
+    if heap:
+        cmd += ['-Xmx%dM' % heap]
+    cmd += ['-jar', dacapo, '--scratch-directory', scratch, benchmark, '-C']
+    try:
+        stderr = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[1]
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return parseNumIterations(stderr)
+
+def fileHash(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def javaVersion():
+    # java -version prints to stderr
+    stderr = subprocess.Popen(['java', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[1]
+    return hashlib.sha1(stderr).hexdigest()
+
+def cacheKey(jarHash, javaHash, heap, benchmark):
+    return "%s:%s:%s:%s" % (jarHash, javaHash, heap or "default", benchmark)
+
+def loadCache(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except IOError:
+        return dict()
+
+def saveCache(path, cache):
+    with open(path, "w") as f:
+        json.dump(cache, f, sort_keys=True, indent=4, separators=(',', ': '))
+
+def cpuSets(options):
+    cpus = range(multiprocessing.cpu_count())
+    sets = [cpus[i:i + options.cpuspertrial] for i in range(0, len(cpus) - options.cpuspertrial + 1, options.cpuspertrial)]
+    if options.jobs:
+        sets = sets[:options.jobs]
+    if not sets:
+        sets = [cpus]
+    return [",".join(map(str, cpuSet)) for cpuSet in sets]
 
 def findConvergence(options):
+    cache = loadCache(options.cache)
+    jarHash, javaHash = fileHash(options.dacapo), javaVersion()
+
+    # Only run the trials the cache doesn't already have
+    tasks = []
+    for benchmark in ALL_BENCHMARKS:
+        key = cacheKey(jarHash, javaHash, options.heap, benchmark)
+        trials = cache.setdefault(key, [])
+        tasks += [(options.dacapo, options.heap, benchmark)] * max(0, options.numtrials - len(trials))
+    random.shuffle(tasks)
+
+    failed = []
+    if tasks:
+        sets = cpuSets(options)
+        print "Running %d trials on %d CPU sets" % (len(tasks), len(sets))
+        queue = multiprocessing.Queue()
+        for cpuSet in sets:
+            queue.put(cpuSet)
+        pool = multiprocessing.Pool(len(sets), initWorker, (queue,))
+        try:
+            # Cache every trial as it finishes so an interrupted run keeps what it got.
+            # Failed trials are not cached, so the next run tries them again.
+            for (dacapo, heap, benchmark), n, error in pool.imap_unordered(runTrial, tasks):
+                if error is not None:
+                    print "%s trial failed: %s" % (benchmark, error)
+                    failed.append((benchmark, error))
+                    continue
+                cache[cacheKey(jarHash, javaHash, heap, benchmark)].append(n)
+                saveCache(options.cache, cache)
+        finally:
+            pool.terminate()
+
     convergence = dict()
     for benchmark in ALL_BENCHMARKS:
-        print benchmark
-        numIterations = 0
-        for i in range(options.numtrials):
-            stderr = subprocess.Popen(['java', '-jar', options.dacapo, benchmark, '-C'], stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[1]
-            n = parseNumIterations(stderr)
-            print "Trial %d: %d" % (i + 1, n)
-            numIterations += n
-        convergence[benchmark] = int(math.ceil(float(numIterations) / options.numtrials))
-        print
+        trials = cache[cacheKey(jarHash, javaHash, options.heap, benchmark)][:options.numtrials]
+        print "%s: %s" % (benchmark, trials)
+        if not trials:
+            continue
+        convergence[benchmark] = int(math.ceil(float(sum(trials)) / len(trials)))
+    if failed:
+        print "%d trials failed, rerun to retry them:" % len(failed)
+        for benchmark, error in failed:
+            print "  %s: %s" % (benchmark, error)
 
     with open("dacapo_convergences.json", "w") as f:
         json.dump(convergence, f, sort_keys=True, indent=4, separators=(',', ': '))
@@ -35,6 +135,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog='run')
     parser.add_argument("-d", "--dacapo", action="store", default="dacapo-9.12-bach.jar", help="where dacapo is located")
     parser.add_argument("-n", "--numtrials", action="store", default=5, type=int, help="How many trials to run to get average convergence time")
+    parser.add_argument("-j", "--jobs", action="store", default=0, type=int, help="How many trials to run at once (default: as many as there are CPU sets)")
+    parser.add_argument("--cpuspertrial", action="store", default=2, type=int, help="How many CPUs to pin each trial to")
+    parser.add_argument("--heap", action="store", default=None, type=int, help="Max heap size in MB to run the trials with (default: the JVM default)")
+    parser.add_argument("--cache", action="store", default=CACHE_FILE, help="File caching trial results by dacapo jar, java version, heap and benchmark")
 
     cmdargs = parser.parse_args()
     findConvergence(cmdargs)
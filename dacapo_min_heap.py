@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from dacapo_converge import ALL_BENCHMARKS, cpuSets
+
+OOM_PATTERN = "OutOfMemoryError"
+
+def printVerbose(options, statement):
+    if options.verbose:
+        print statement
+
+def startProbe(options, benchmark, heap, cpus):
+    scratch = tempfile.mkdtemp(prefix='scratch')
+    output = tempfile.TemporaryFile()
+    cmd = ['taskset', '-c', cpus, 'java', '-Xmx%dM' % heap] + options.jvmargs.split() + \
+        ['-jar', options.dacapo, '--scratch-directory', scratch, '-n', str(options.iterations), benchmark]
+    proc = subprocess.Popen(cmd, stdout=output, stderr=subprocess.STDOUT)
+    return {'heap': heap, 'proc': proc, 'output': output, 'scratch': scratch, 'cpus': cpus}
+
+def stopProbe(probe, kill=False):
+    if kill:
+        probe['proc'].kill()
+        probe['proc'].wait()
+    probe['output'].close()
+    shutil.rmtree(probe['scratch'], ignore_errors=True)
+    return probe['cpus']
+
+def probePassed(probe):
+    probe['output'].seek(0)
+    return probe['proc'].returncode == 0 and OOM_PATTERN not in probe['output'].read()
+
+def nextHeap(search, probes, resolution):
+    # Probe the middle of the widest gap between the bounds and the probes already running
+    points = sorted([search['lo'], search['hi']] + [probe['heap'] for probe in probes])
+    gap, lo = max((b - a, a) for a, b in zip(points, points[1:]))
+    if gap <= resolution:
+        return None
+    return lo + gap // 2
+
+def findMinHeaps(options):
+    if options.benchmark == "all":
+        benchmarks = ALL_BENCHMARKS
+    else:
+        benchmarks = options.benchmark.split(",")
+
+    # Each benchmark's min heap lies in (lo, hi]: lo is known to fail and hi to pass
+    searches = dict((benchmark, {'lo': options.startheap - 1, 'hi': options.maxheap}) for benchmark in benchmarks)
+    running = dict((benchmark, []) for benchmark in benchmarks)
+    free = cpuSets(options)
+    print "Bisecting %d benchmarks on %d CPU sets" % (len(benchmarks), len(free))
+
+    try:
+        while True:
+            # Hand out free CPU sets round robin to the searches that still have gaps to probe
+            progress = True
+            while free and progress:
+                progress = False
+                for benchmark in sorted(benchmarks, key=lambda b: len(running[b])):
+                    heap = nextHeap(searches[benchmark], running[benchmark], options.resolution)
+                    if free and heap is not None:
+                        running[benchmark].append(startProbe(options, benchmark, heap, free.pop()))
+                        progress = True
+            if not any(running.values()):
+                break
+
+            time.sleep(0.5)
+            for benchmark in benchmarks:
+                search = searches[benchmark]
+                for probe in [p for p in running[benchmark] if p['proc'].poll() is not None]:
+                    running[benchmark].remove(probe)
+                    passed = probePassed(probe)
+                    if passed:
+                        search['hi'] = min(search['hi'], probe['heap'])
+                    else:
+                        search['lo'] = max(search['lo'], probe['heap'])
+                    printVerbose(options, "%s: %dMB %s" % (benchmark, probe['heap'], "passed" if passed else "failed"))
+                    free.append(stopProbe(probe))
+                # Cancel probes that fall outside the bounds, their outcome is already known
+                for probe in [p for p in running[benchmark] if not search['lo'] < p['heap'] < search['hi']]:
+                    running[benchmark].remove(probe)
+                    free.append(stopProbe(probe, kill=True))
+    finally:
+        for probes in running.values():
+            for probe in probes:
+                stopProbe(probe, kill=True)
+
+    minheaps = dict()
+    for benchmark in benchmarks:
+        minheaps[benchmark] = searches[benchmark]['hi']
+        print "%s: %dMB" % (benchmark, minheaps[benchmark])
+
+    with open(options.output, "w") as f:
+        json.dump(minheaps, f, sort_keys=True, indent=4, separators=(',', ': '))
+
+if __name__ == "__main__":
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog='run')
+    parser.add_argument("-d", "--dacapo", action="store", default="dacapo-9.12-bach.jar", help="where dacapo is located")
+    parser.add_argument("-b", "--benchmark", action="store", default="all", help="which dacapo benchmarks to find the min heap of")
+    parser.add_argument("--startheap", action="store", default=1, type=int, help="smallest heap size in MB to consider")
+    parser.add_argument("-p", "--maxheap", action="store", default=1024, type=int, help="largest heap size in MB to consider, assumed to be enough")
+    parser.add_argument("--resolution", action="store", default=1, type=int, help="stop bisecting once the min heap is known to within this many MB")
+    parser.add_argument("--iterations", action="store", default=3, type=int, help="how many iterations each probe runs")
+    parser.add_argument("--jvmargs", action="store", default="-XX:+UseParallelOldGC", help="extra JVM arguments, should match the experiments")
+    parser.add_argument("-j", "--jobs", action="store", default=0, type=int, help="How many probes to run at once (default: as many as there are CPU sets)")
+    parser.add_argument("--cpuspertrial", action="store", default=2, type=int, help="How many CPUs to pin each probe to")
+    parser.add_argument("-o", "--output", action="store", default="dacapo_min_heap.json", help="where to write the min heap sizes")
+    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="be more verbose")
+
+    cmdargs = parser.parse_args()
+    findMinHeaps(cmdargs)
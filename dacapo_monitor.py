@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+import json
+import math
+import os
+import re
+import time
+import results_io
+
+ITERATION_PATTERN = r"%s .* in (\d+) msec"
+WINDOW_FILE = "measurement_window.json"
+EVENTS_FILE = "events%02d"
+EVENT_MARKER = "===== DaCapo"
+MEASURED_ITERATIONS = 5
+
+# Two-sided 95% Student t critical values, indexed by degrees of freedom
+T_95 = [None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+def readIterationTimes(console, benchmark):
+    with open(console, 'r') as f:
+        output = f.read()
+    return map(int, re.findall(ITERATION_PATTERN % benchmark, output)), '[backtrace]' in output
+
+def logIterationEvents(console, events, done):
+    # Copy DaCapo's iteration lines to the events file as they appear on the console,
+    # prefixed with the host time they were seen at, until done is set
+    logConsoleEvents(console, events, done, re.escape(EVENT_MARKER))
+
+def logConsoleEvents(console, events, done, pattern):
+    # Copy the console lines matching pattern to the events file as they appear, prefixed
+    # with the host time they were seen at, until done is set
+    offset, partial = 0, ''
+    with open(events, 'w') as fout:
+        while True:
+            finished = done.is_set()
+            with open(console, 'r') as fin:
+                fin.seek(offset)
+                data = fin.read()
+            offset += len(data)
+            lines = (partial + data).split('\n')
+            partial = lines.pop()
+            now = time.time()
+            for line in lines:
+                if re.search(pattern, line):
+                    fout.write("%.3f %s\n" % (now, line.strip()))
+            fout.flush()
+            if finished:
+                break
+            time.sleep(0.1)
+
+def tCritical(df):
+    if df < len(T_95):
+        return T_95[df]
+    return 1.960 + 2.4 / df
+
+def relativeHalfWidth(samples):
+    # Half width of the 95% confidence interval of the mean, relative to the mean
+    n = len(samples)
+    if n < 2:
+        return float('inf')
+    mean = float(sum(samples)) / n
+    variance = sum((x - mean) ** 2 for x in samples) / (n - 1)
+    return tCritical(n - 1) * math.sqrt(variance / n) / mean
+
+def mserTruncation(times):
+    # MSER: the number of leading iterations to drop so that the standard error
+    # of the mean of the remaining ones is smallest, searched over the first half
+    best, bestScore = 0, float('inf')
+    if not times:
+        return best
+    for d in range(len(times) // 2 + 1):
+        tail = times[d:]
+        mean = float(sum(tail)) / len(tail)
+        score = sum((x - mean) ** 2 for x in tail) / len(tail) ** 2
+        if score < bestScore:
+            best, bestScore = d, score
+    return best
+
+def steadyStateWarmup(times, options):
+    # Returns the detected warmup length, or None while the domain is still warming up.
+    # The truncation point is only trusted once it is clear of the end of the search
+    # range and enough steady iterations follow it.
+    d = mserTruncation(times)
+    if d < len(times) // 2 and len(times) - d >= options.steadyiterations:
+        return d
+    if len(times) >= options.maxwarmup + options.steadyiterations:
+        return d
+    return None
+
+def timedOut(start, options):
+    return options.windowtimeout > 0 and time.time() - start > options.windowtimeout * 60
+
+def waitForSteadyState(console, benchmark, alive, options, warmups, i):
+    # alive() tells whether the domain is still running: one that exits or hangs before
+    # reaching steady state (e.g. out of memory at a near minimum heap) counts as crashed
+    start = time.time()
+    while True:
+        running = alive()
+        times, crashed = readIterationTimes(console, benchmark)
+        steadystate = steadyStateWarmup(times, options)
+        crashed = crashed or not running or timedOut(start, options)
+        if crashed or steadystate is not None:
+            warmups[i] = {'steadystate': steadystate, 'completed': len(times)}
+            break
+        #Wait 1 Second before checking again
+        time.sleep(1)
+
+def waitForMeasurement(console, benchmark, alive, warmup, options, windows, i, steadystate=None):
+    # Watch a domain's iterations until its measurement window is complete. In adaptive
+    # mode that is once the post-warmup mean is known to within options.ciwidth, or
+    # options.maxiterations have been measured. A warmup of None means detect it here.
+    # A domain that exits before its window is complete (without a backtrace, e.g. out of
+    # memory, or out of iterations), or is still short of it after options.windowtimeout
+    # minutes, has its window recorded as crashed.
+    start = time.time()
+    while True:
+        running = alive()
+        times, crashed = readIterationTimes(console, benchmark)
+        ended = not running or timedOut(start, options)
+        if warmup is None:
+            steadystate = steadyStateWarmup(times, options)
+            if steadystate is None and not crashed and not ended:
+                time.sleep(1)
+                continue
+            warmup = steadystate or 0
+        measured = times[warmup:]
+        width = relativeHalfWidth(measured)
+        if options.adaptive:
+            done = len(measured) >= options.maxiterations or \
+                (len(measured) >= options.miniterations and width <= options.ciwidth)
+        else:
+            done = len(measured) >= MEASURED_ITERATIONS
+        if crashed or done or ended:
+            windows[i] = {'warmup': warmup, 'iterations': len(measured), 'halfwidth': width, 'crashed': crashed or not done}
+            if steadystate is not None:
+                windows[i]['steadystate'] = steadystate
+            if not done and not crashed:
+                windows[i]['ended'] = 'exited' if not running else 'timeout'
+            break
+        #Wait 1 Second before checking again
+        time.sleep(1)
+
+def loadMeasurementWindows(outputdir):
+    try:
+        with results_io.open_file(os.path.join(outputdir, WINDOW_FILE), 'r') as f:
+            return json.load(f)
+    except IOError:
+        return dict()
+
+def experimentSummary(outputdir, benchmark, numjvms, warmup, xen):
+    # Mean measured iteration time over all domains of an experiment and the relative
+    # half width of its confidence interval, or None if no domain got that far. Windows
+    # cut short by a crash, exit or timeout are left out.
+    windows = loadMeasurementWindows(outputdir)
+    samples = []
+    for i in range(numjvms):
+        # Runtimes are logged in the stderr files on linux and stdout files on xen
+        console = os.path.join(outputdir, ('stdout%02d' if xen else 'stderr%02d') % (i + 1))
+        if not os.path.exists(console):
+            continue
+        times, crashed = readIterationTimes(console, benchmark)
+        window = windows.get("%02d" % (i + 1), {'warmup': warmup, 'iterations': MEASURED_ITERATIONS})
+        if window.get('crashed'):
+            continue
+        samples += times[window['warmup']:window['warmup'] + window['iterations']]
+    if not samples:
+        return None
+    return float(sum(samples)) / len(samples), relativeHalfWidth(samples)
+
+def saveMeasurementWindows(outputdir, windows):
+    # Keyed the same way as the console files: "01", "02", ...
+    windows = dict(("%02d" % (i + 1), window) for i, window in windows.iteritems())
+    with open(os.path.join(outputdir, WINDOW_FILE), 'w') as f:
+        json.dump(windows, f, sort_keys=True, indent=4, separators=(',', ': '))
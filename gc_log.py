@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+import argparse
+import calendar
+import mmap
+import os
+import re
+import time
+import numpy as np
+import results_io
+
+# Streaming parser for the GC output (-XX:+PrintGCDetails -XX:+PrintGCTimeStamps) of the
+# ParallelOld DaCapo runs and the CMS Cassandra runs. The log is memory-mapped and scanned once
+# with precompiled bytes patterns that only stop at iteration markers and GC lines, keeping track
+# of which iteration is running as it goes.
+ITERATION_DTYPE = np.dtype([('runtime_ms', '<u4'), ('gc_minor_ms', '<f4'), ('gc_major_ms', '<f4')])
+# A line is either a DaCapo marker (===== DaCapo ... =====) or a GC pause:
+# [GC [PSYoungGen: ...] 1024K->512K(2048K), 0.0012340 secs]
+LINE_PATTERN = re.compile(br"=====[^\n]*|\[(Full GC|GC)[^\n]*, ([.\d]+) secs")
+
+# Every collection logged, one row each. Sizes are in KB and -1 where the log does not give
+# them; old generation sizes the log leaves out are worked out from the heap and young sizes.
+# Concurrent CMS phases do not pause the application, their duration is the wall time taken.
+# timestamp is the JVM's uptime, datestamp the guest's wall clock (with -XX:+PrintGCDateStamps,
+# else NaN) in seconds since the epoch.
+GC_KINDS = ['young', 'full', 'initial_mark', 'remark', 'concurrent']
+PAUSE_KINDS = [GC_KINDS.index(kind) for kind in ('young', 'full', 'initial_mark', 'remark')]
+GC_EVENT_DTYPE = np.dtype([('timestamp', '<f8'), ('datestamp', '<f8'), ('kind', 'u1'), ('pause', '<f8'), ('duration', '<f8'),
+                           ('young_before', '<i8'), ('young_after', '<i8'), ('young_capacity', '<i8'),
+                           ('old_before', '<i8'), ('old_after', '<i8'), ('old_capacity', '<i8'),
+                           ('heap_before', '<i8'), ('heap_after', '<i8'), ('heap_capacity', '<i8'),
+                           ('iteration', '<i4')])
+PAUSE_PERCENTILES = [50, 90, 99, 99.9]
+YOUNG_GENERATIONS = [b'PSYoungGen', b'ParNew', b'DefNew']
+# A DaCapo marker, a pause or a concurrent CMS phase, each with an optional datestamp:
+# 2015-05-01T12:00:01.234+0000: 1.234: [GC 1.234: [ParNew: 1000K->100K(2000K), 0.0100 secs] 5000K->4200K(10000K), 0.0101 secs]
+# 2.345: [CMS-concurrent-mark: 0.210/0.230 secs]
+DATESTAMP = br"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d+[+-]\d{4})"
+EVENT_PATTERN = re.compile(br"=====[^\n]*"
+                           br"|(?:" + DATESTAMP + br": )?(?:(\d+\.\d+): )?\[(Full GC|GC)([^\n]*), ([.\d]+) secs\]"
+                           br"|(?:" + DATESTAMP + br": )?(\d+\.\d+): \[CMS-concurrent-[a-z-]+: [.\d]+/([.\d]+) secs\]")
+GENERATION_PATTERN = re.compile(br"\[(PSYoungGen|ParNew|DefNew|ParOldGen|PSOldGen|CMS|Tenured)(?: \([^)\n]*\))?: (\d+)K->(\d+)K\((\d+)K\)")
+# Whole heap before and after, the one size change not labelled with a generation
+HEAP_PATTERN = re.compile(br"(?<!: )(?<!\d)(\d+)K->(\d+)K\((\d+)K\)")
+# [1 CMS-initial-mark: 4000K(8000K)] 4200K(10000K) and [YG occupancy: 500 K (2000 K)]
+MARK_PATTERN = re.compile(br"CMS-(initial-mark|remark): (\d+)K\((\d+)K\)\] (\d+)K\((\d+)K\)")
+YOUNG_OCCUPANCY_PATTERN = re.compile(br"YG occupancy: (\d+) K \((\d+) K\)")
+
+# Safepoints logged with -XX:+PrintSafepointStatistics -XX:PrintSafepointStatisticsCount=1, one
+# row each. Time to safepoint is how long the VM waited for every thread to stop (the sync
+# column), which grows when a vCPU running one of them is preempted, operation time how long
+# the VM operation (e.g. a collection) then took. Both are logged in whole ms.
+SAFEPOINT_DTYPE = np.dtype([('timestamp', '<f8'), ('operation', 'S48'), ('threads', '<u4'), ('time_to_safepoint', '<f8'),
+                            ('cleanup', '<f8'), ('operation_time', '<f8'), ('iteration', '<i4')])
+# Stops logged with -XX:+PrintGCApplicationStoppedTime, and on newer JVMs how long stopping took
+STOPPED_DTYPE = np.dtype([('stopped', '<f8'), ('stopping', '<f8'), ('iteration', '<i4')])
+SAFEPOINT_PERCENTILES = [50, 99]
+# 0.235: ParallelGCFailedAllocation   [  10  0  0 ]  [  0  0  0  0  5 ]  0
+# 2.106: no vm operation   [  12  1  1 ]  [  0  0  0  0  0 ]  0
+# Total time for which application threads were stopped: 0.0052340 seconds, Stopping threads took: 0.0000450 seconds
+SAFEPOINT_PATTERN = re.compile(br"=====[^\n]*"
+                               br"|(\d+\.\d+): +(no vm operation|[\w-]+) +\[ *(\d+) +\d+ +\d+ *\] +\[ *\d+ +\d+ +(\d+) +(\d+) +(\d+) *\]"
+                               br"|Total time for which application threads were stopped: ([.\d]+) seconds(?:, Stopping threads took: ([.\d]+) seconds)?")
+
+def open_log(path):
+  # Returns a read only memory map of the file at path, or an empty string if it is empty,
+  # which mmap refuses to map. Logs packed into an experiment archive are read into memory.
+  if results_io.archived(path):
+    return results_io.read(path)
+  with open(path, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def completed_pattern(benchmark):
+  return re.compile((re.escape(benchmark).encode('ascii') if benchmark else b"DaCapo") + br" .* in (\d+) msec")
+
+def iteration_gc(path, benchmark):
+  # Returns an ITERATION_DTYPE array with a row per completed iteration of a DaCapo console
+  # log. GC pauses are counted towards the iteration running when they were logged.
+  completed = completed_pattern(benchmark)
+  rows = []
+  running, minor, major = False, 0.0, 0.0
+  log = open_log(path)
+  try:
+    for match in LINE_PATTERN.finditer(log):
+      kind, seconds = match.groups()
+      if kind is None:
+        done = completed.search(match.group(0))
+        if done:
+          rows.append((int(done.group(1)), minor, major))
+          running, minor, major = False, 0.0, 0.0
+        elif b'starting' in match.group(0):
+          running, minor, major = True, 0.0, 0.0
+      elif running:
+        if kind == b'GC':
+          minor += float(seconds) * 1000
+        else:
+          major += float(seconds) * 1000
+  finally:
+    if isinstance(log, mmap.mmap):
+      log.close()
+  return np.array(rows, dtype=ITERATION_DTYPE)
+
+def parse_datestamp(datestamp):
+  # Seconds since the epoch of a -XX:+PrintGCDateStamps stamp, e.g. 2015-05-01T12:00:01.234+0000
+  if not datestamp:
+    return np.nan
+  datestamp = datestamp.decode('ascii')
+  seconds, zone = datestamp[:-5], datestamp[-5:]
+  whole, fraction = seconds.split('.')
+  offset = (int(zone[1:3]) * 3600 + int(zone[3:5]) * 60) * (1 if zone[0] == '+' else -1)
+  return calendar.timegm(time.strptime(whole, '%Y-%m-%dT%H:%M:%S')) + float('0.' + fraction) - offset
+
+def pause_event(timestamp, datestamp, token, body, seconds):
+  # Returns a GC_EVENT_DTYPE row for one pause from the text between [GC or [Full GC and its
+  # total time
+  sizes = dict(('%s_%s' % (generation, field), -1) for generation in ('young', 'old', 'heap') for field in ('before', 'after', 'capacity'))
+  kind = 'full' if token == b'Full GC' else 'young'
+  for name, before, after, capacity in GENERATION_PATTERN.findall(body):
+    generation = 'young' if name in YOUNG_GENERATIONS else 'old'
+    sizes.update({generation + '_before': int(before), generation + '_after': int(after), generation + '_capacity': int(capacity)})
+    # The old generation is only collected in a young pause when it fails over to a full collection
+    if generation == 'old':
+      kind = 'full'
+  mark = MARK_PATTERN.search(body)
+  if mark:
+    kind = mark.group(1).replace(b'-', b'_').decode('ascii')
+    old, old_capacity, heap, heap_capacity = map(int, mark.groups()[1:])
+    sizes.update({'old_before': old, 'old_after': old, 'old_capacity': old_capacity,
+                  'heap_before': heap, 'heap_after': heap, 'heap_capacity': heap_capacity})
+    occupancy = YOUNG_OCCUPANCY_PATTERN.search(body)
+    if occupancy:
+      young, young_capacity = map(int, occupancy.groups())
+      sizes.update({'young_before': young, 'young_after': young, 'young_capacity': young_capacity})
+  else:
+    heap = HEAP_PATTERN.findall(body)
+    if heap:
+      sizes.update(zip(('heap_before', 'heap_after', 'heap_capacity'), map(int, heap[-1])))
+  if sizes['old_before'] < 0 and sizes['young_before'] >= 0 and sizes['heap_before'] >= 0:
+    for field in ('before', 'after', 'capacity'):
+      sizes['old_' + field] = sizes['heap_' + field] - sizes['young_' + field]
+  pause = float(seconds)
+  return (float(timestamp) if timestamp else np.nan, parse_datestamp(datestamp), GC_KINDS.index(kind), pause, pause,
+          sizes['young_before'], sizes['young_after'], sizes['young_capacity'],
+          sizes['old_before'], sizes['old_after'], sizes['old_capacity'],
+          sizes['heap_before'], sizes['heap_after'], sizes['heap_capacity'])
+
+def gc_events(path, benchmark=None):
+  # Returns a GC_EVENT_DTYPE array of every collection in a GC log. In a DaCapo console, each
+  # event is numbered with the iteration it happened in (as the rows of iteration_gc are), and
+  # -1 outside of one.
+  completed = completed_pattern(benchmark)
+  rows = []
+  iteration, running = 0, False
+  log = open_log(path)
+  try:
+    for match in EVENT_PATTERN.finditer(log):
+      datestamp, timestamp, token, body, seconds, concurrent_datestamp, concurrent_timestamp, concurrent_seconds = match.groups()
+      if token:
+        rows.append(pause_event(timestamp, datestamp, token, body, seconds) + (iteration if running else -1,))
+      elif concurrent_timestamp:
+        rows.append((float(concurrent_timestamp), parse_datestamp(concurrent_datestamp), GC_KINDS.index('concurrent'), 0.0, float(concurrent_seconds))
+                    + (-1,) * 9 + (iteration if running else -1,))
+      elif completed.search(match.group(0)):
+        iteration, running = iteration + 1, False
+      elif b'starting' in match.group(0):
+        running = True
+  finally:
+    if isinstance(log, mmap.mmap):
+      log.close()
+  return np.array(rows, dtype=GC_EVENT_DTYPE)
+
+def pauses(events):
+  return events[np.in1d(events['kind'], PAUSE_KINDS)]
+
+def pause_percentiles(events, percentiles=PAUSE_PERCENTILES):
+  # Returns {percentile -> pause seconds} over the pauses among events
+  times = pauses(events)['pause']
+  return dict((percentile, np.percentile(times, percentile) if len(times) else 0.0) for percentile in percentiles)
+
+def iteration_overhead(events, runtimes_ms):
+  # Returns the fraction of each iteration's runtime spent paused for GC
+  times = pauses(events)
+  totals = np.bincount(times['iteration'][times['iteration'] >= 0], weights=times['pause'][times['iteration'] >= 0], minlength=len(runtimes_ms))
+  return totals[:len(runtimes_ms)] * 1000 / np.maximum(np.asarray(runtimes_ms, dtype=float), 1)
+
+def allocation_rates(events):
+  # Returns (allocation, promotion) in MB/s between the first and last timed collection.
+  # Allocation is what the young generation grew by between collections, promotion what the
+  # old generation grew by during young collections.
+  collections = pauses(events)
+  collections = collections[~np.isnan(collections['timestamp']) & (collections['young_before'] >= 0)]
+  if len(collections) < 2:
+    return 0.0, 0.0
+  elapsed = collections['timestamp'][-1] - collections['timestamp'][0]
+  if elapsed <= 0:
+    return 0.0, 0.0
+  allocated = np.maximum(collections['young_before'][1:] - collections['young_after'][:-1], 0).sum()
+  young = collections[1:][(collections['kind'][1:] == GC_KINDS.index('young')) & (collections['old_before'][1:] >= 0)]
+  promoted = np.maximum(young['old_after'] - young['old_before'], 0).sum()
+  return allocated / 1024.0 / elapsed, promoted / 1024.0 / elapsed
+
+def gc_summary(events, runtimes_ms=None):
+  # Returns {metric -> value} for a set of events: pause count, total and percentiles (s), GC
+  # overhead (mean per iteration if runtimes are given, else over the time the log covers),
+  # and allocation and promotion rates (MB/s)
+  times = pauses(events)
+  summary = {'pauses': len(times), 'pause_total': times['pause'].sum(), 'pause_max': times['pause'].max() if len(times) else 0.0}
+  for percentile, pause in pause_percentiles(events).iteritems():
+    summary['pause_p%s' % ('%g' % percentile).replace('.', '')] = pause
+  if runtimes_ms is not None:
+    summary['overhead'] = np.mean(iteration_overhead(events, runtimes_ms)) if len(runtimes_ms) else 0.0
+  else:
+    timed = events[~np.isnan(events['timestamp'])]
+    elapsed = (timed['timestamp'][-1] + timed['duration'][-1] - timed['timestamp'][0]) if len(timed) else 0.0
+    summary['overhead'] = summary['pause_total'] / elapsed if elapsed > 0 else 0.0
+  summary['allocation_rate'], summary['promotion_rate'] = allocation_rates(events)
+  return summary
+
+def safepoint_events(path, benchmark=None):
+  # Returns (SAFEPOINT_DTYPE array, STOPPED_DTYPE array) of the safepoints and application
+  # stops in a log, numbered by DaCapo iteration as gc_events numbers GC events
+  completed = completed_pattern(benchmark)
+  safepoints, stops = [], []
+  iteration, running = 0, False
+  log = open_log(path)
+  try:
+    for match in SAFEPOINT_PATTERN.finditer(log):
+      timestamp, operation, threads, sync, cleanup, vmop, stopped, stopping = match.groups()
+      if timestamp:
+        safepoints.append((float(timestamp), operation, int(threads), int(sync) / 1000.0, int(cleanup) / 1000.0,
+                           int(vmop) / 1000.0, iteration if running else -1))
+      elif stopped:
+        stops.append((float(stopped), float(stopping) if stopping else np.nan, iteration if running else -1))
+      elif completed.search(match.group(0)):
+        iteration, running = iteration + 1, False
+      elif b'starting' in match.group(0):
+        running = True
+  finally:
+    if isinstance(log, mmap.mmap):
+      log.close()
+  return np.array(safepoints, dtype=SAFEPOINT_DTYPE), np.array(stops, dtype=STOPPED_DTYPE)
+
+def safepoint_summary(safepoints, stops, iterations=0):
+  # Returns {metric -> value} splitting the time stopped at safepoints into time to safepoint and
+  # operation time (s), with time to safepoint percentiles and its share of all safepoint time.
+  # Totals are also given per iteration if the number of iterations is.
+  ttsp, operation = safepoints['time_to_safepoint'], safepoints['operation_time']
+  summary = {'safepoints': len(safepoints), 'ttsp_total': ttsp.sum(), 'operation_total': operation.sum(),
+             'ttsp_max': ttsp.max() if len(ttsp) else 0.0, 'stopped_total': stops['stopped'].sum(),
+             'stopping_total': np.nansum(stops['stopping']) if len(stops) else 0.0}
+  for percentile in SAFEPOINT_PERCENTILES:
+    summary['ttsp_p%d' % percentile] = np.percentile(ttsp, percentile) if len(ttsp) else 0.0
+  total = summary['ttsp_total'] + summary['operation_total']
+  summary['ttsp_fraction'] = summary['ttsp_total'] / total if total > 0 else 0.0
+  if iterations:
+    for metric in ('ttsp', 'operation', 'stopped'):
+      summary['%s_per_iteration' % metric] = summary['%s_total' % metric] / iterations
+  return summary
+
+def save_events(path, events):
+  np.save(path, events)
+
+def load_events(path):
+  return np.load(path)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("log", action="store", help="GC log, e.g. a DaCapo console (stdoutNN on xen, stderrNN on linux) or a Cassandra stdoutNN")
+  parser.add_argument("-b", "--benchmark", action="store", default=None, help="benchmark the DaCapo console is of, to print its iterations")
+  parser.add_argument("--events", action="store", default=None, help="also save the GC events to this .npy file")
+  parser.add_argument("--safepoints", action="store_true", default=False, help="print the safepoint statistics (-XX:+PrintSafepointStatistics) instead")
+  cmdargs = parser.parse_args()
+
+  if cmdargs.safepoints:
+    safepoints, stops = safepoint_events(cmdargs.log, cmdargs.benchmark)
+    print "%-36s %8s %14s %14s" % ("operation", "count", "ttsp (ms)", "operation (ms)")
+    for operation in sorted(set(safepoints['operation'])):
+      mine = safepoints[safepoints['operation'] == operation]
+      print "%-36s %8d %14.0f %14.0f" % (operation, len(mine), mine['time_to_safepoint'].sum() * 1000, mine['operation_time'].sum() * 1000)
+    print
+    for metric, value in sorted(safepoint_summary(safepoints, stops).iteritems()):
+      print "%-16s %12.4f" % (metric, value)
+  else:
+    events = gc_events(cmdargs.log, cmdargs.benchmark)
+    if cmdargs.events:
+      save_events(cmdargs.events, events)
+    if cmdargs.benchmark:
+      iterations = iteration_gc(cmdargs.log, cmdargs.benchmark)
+      overhead = iteration_overhead(events, iterations['runtime_ms'])
+      print "%9s %12s %14s %14s %9s" % ("iteration", "runtime (ms)", "minor gc (ms)", "major gc (ms)", "overhead")
+      for i, (runtime, minor, major) in enumerate(iterations.tolist()):
+        print "%9d %12d %14.1f %14.1f %9.3f" % (i, runtime, minor, major, overhead[i])
+      print
+    print "%-14s %8s %12s" % ("kind", "events", "time (s)")
+    for kind, name in enumerate(GC_KINDS):
+      mine = events[events['kind'] == kind]
+      print "%-14s %8d %12.3f" % (name, len(mine), mine['duration'].sum())
+    print
+    for metric, value in sorted(gc_summary(events).iteritems()):
+      print "%-16s %12.4f" % (metric, value)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+
+# HDR-style latency histogram: buckets hold a single value up to 2 * 10^significant_digits and
+# then keep the same number of buckets per power of two, so every value is stored to within a fixed relative error
+# (significant_digits) however large it is. Two histograms with the same layout merge exactly by
+# adding their counts, so percentiles of a merge are the percentiles of the combined samples
+# rather than an average of per run percentiles. Works under python 2 and 3.
+DEFAULT_HIGHEST = 3600 * 1000 * 1000
+DEFAULT_DIGITS = 2
+
+class LatencyHistogram(object):
+  def __init__(self, highest=DEFAULT_HIGHEST, significant_digits=DEFAULT_DIGITS):
+    # Values are non-negative integers (e.g. microseconds) up to highest
+    self.highest = int(highest)
+    self.significant_digits = significant_digits
+    self.sub_bucket_magnitude = int(math.ceil(math.log(2 * 10 ** significant_digits, 2)))
+    self.sub_buckets = 1 << self.sub_bucket_magnitude
+    self.half = self.sub_buckets // 2
+    size = self.index(np.array([self.highest]))[0] + 1
+    self.counts = np.zeros(size, dtype=np.int64)
+    self.min_value, self.max_value = None, None
+
+  def layout(self):
+    return (self.highest, self.significant_digits)
+
+  def index(self, values):
+    # Bucket index of every value in values
+    values = np.asarray(values, dtype=np.int64)
+    shift = np.floor(np.log2(np.maximum(values, 1))).astype(np.int64) - self.sub_bucket_magnitude + 1
+    shift = np.maximum(shift, 0)
+    return np.where(shift == 0, values, self.sub_buckets + (shift - 1) * self.half + ((values >> shift) - self.half))
+
+  def highest_equivalent(self, indices):
+    # Largest value stored in each bucket
+    indices = np.asarray(indices, dtype=np.int64)
+    shift = np.maximum((indices - self.sub_buckets) // self.half + 1, 0)
+    sub = np.where(shift == 0, indices, (indices - self.sub_buckets) % self.half + self.half)
+    return ((sub + 1) << shift) - 1
+
+  def record(self, value, count=1):
+    self.record_values([value], [count])
+
+  def record_values(self, values, counts=None):
+    values = np.minimum(np.asarray(values, dtype=np.int64), self.highest)
+    if len(values) == 0:
+      return
+    if values.min() < 0:
+      raise ValueError("Latencies must be non-negative")
+    counts = np.ones(len(values), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    np.add.at(self.counts, self.index(values), counts)
+    recorded = values[counts > 0]
+    if len(recorded):
+      self.min_value = min(int(recorded.min()), self.min_value if self.min_value is not None else self.highest)
+      self.max_value = max(int(recorded.max()), self.max_value or 0)
+
+  def merge(self, other):
+    # Adds other's samples to this histogram, exactly
+    if other.layout() != self.layout():
+      raise ValueError("Cannot merge histograms with layouts %s and %s" % (self.layout(), other.layout()))
+    self.counts += other.counts
+    if other.min_value is not None:
+      self.min_value = other.min_value if self.min_value is None else min(self.min_value, other.min_value)
+      self.max_value = other.max_value if self.max_value is None else max(self.max_value, other.max_value)
+    return self
+
+  def count(self):
+    return int(self.counts.sum())
+
+  def percentile(self, percentile):
+    # Value at or below which percentile % of the samples fall, as the highest value of the
+    # bucket the sample falls in (never more than the largest value recorded)
+    total = self.count()
+    if total == 0:
+      return 0
+    rank = max(1, int(math.ceil(percentile / 100.0 * total)))
+    index = int(np.searchsorted(np.cumsum(self.counts), rank))
+    return int(min(self.highest_equivalent([index])[0], self.max_value))
+
+  def percentiles(self, percentiles):
+    return dict((percentile, self.percentile(percentile)) for percentile in percentiles)
+
+  def mean(self):
+    # Mean of the bucket midpoints, to within the histogram's precision
+    total = self.count()
+    if total == 0:
+      return 0.0
+    nonzero = np.nonzero(self.counts)[0]
+    highest = self.highest_equivalent(nonzero)
+    lowest = np.where(nonzero < self.sub_buckets, nonzero, self.highest_equivalent(nonzero - 1) + 1)
+    return float(((highest + lowest) / 2.0 * self.counts[nonzero]).sum() / total)
+
+  def to_arrays(self):
+    # Returns (bucket indices, counts) of the non-empty buckets, for saving
+    nonzero = np.nonzero(self.counts)[0]
+    return nonzero, self.counts[nonzero]
+
+  @classmethod
+  def from_arrays(cls, indices, counts, highest=DEFAULT_HIGHEST, significant_digits=DEFAULT_DIGITS):
+    histogram = cls(highest, significant_digits)
+    histogram.counts[np.asarray(indices, dtype=np.int64)] = counts
+    if len(indices):
+      nonzero = np.nonzero(histogram.counts)[0]
+      histogram.max_value = int(histogram.highest_equivalent(nonzero[-1:])[0])
+      histogram.min_value = int(nonzero[0]) if nonzero[0] < histogram.sub_buckets else int(histogram.highest_equivalent(nonzero[:1] - 1)[0] + 1)
+    return histogram
+
+def merge_all(histograms):
+  # Returns a new histogram of every sample in histograms
+  histograms = list(histograms)
+  if not histograms:
+    return LatencyHistogram()
+  merged = LatencyHistogram(*histograms[0].layout())
+  for histogram in histograms:
+    merged.merge(histogram)
+  return merged
+
+def save_histograms(path, histograms):
+  # Saves {name -> LatencyHistogram} to an npz file as the non-empty buckets of each
+  arrays = dict()
+  for name, histogram in histograms.items():
+    arrays['%s.indices' % name], arrays['%s.counts' % name] = histogram.to_arrays()
+    arrays['%s.layout' % name] = np.array(histogram.layout(), dtype=np.int64)
+  np.savez_compressed(path, **arrays)
+
+def load_histograms(f):
+  # Returns {name -> LatencyHistogram} from a file or path written by save_histograms
+  with np.load(f) as data:
+    names = set(key.rsplit('.', 1)[0] for key in data.files)
+    return dict((name, LatencyHistogram.from_arrays(data['%s.indices' % name], data['%s.counts' % name],
+                                                    *[int(value) for value in data['%s.layout' % name]])) for name in names)
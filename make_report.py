@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import matplotlib
+# Workers render off screen, whatever the display
+matplotlib.use('Agg')
+
+import argparse
+import cgi
+import glob
+import os
+import re
+import traceback
+import results_store
+import parse_dacapo
+import parse_ycsb
+from parse_engine import parse_all
+
+# Renders every figure of parse_dacapo.py and parse_ycsb.py for a results directory in one pass
+# and writes an index.html showing them next to tables of the numbers behind them. The logs are
+# parsed once, into the results store (only files that changed since the last report are read
+# again), and figures are drawn from it on a process pool, one task per (figure type, benchmark).
+REPORT_FILE = "index.html"
+# (type, parse_dacapo plotter, results suite, subdirectory the plotter saves into, section title)
+DACAPO_FIGURES = [('runtime', 'plot_runtimes', 'dacapo', 'runtimes', "Mean total runtime"),
+                  ('slowdown', 'plot_slowdowns', 'dacapo', 'slowdowns', "Runtime slowdown"),
+                  ('cdf', 'plot_cdfs', 'dacapo', 'cdfs', "Iteration runtime CDF"),
+                  ('gc', 'plot_gc', 'dacapo', 'gc', "GC time slowdown"),
+                  ('jit', 'plot_jit', 'dacapo-jit', 'jit', "Runtime in isolation after parallel warmup"),
+                  ('xenalyze', 'plot_xenalyze', 'dacapo', 'xenalyze', "Concurrency hazard")]
+JIT_JVM_COUNTS = {'avrora': [1, 16], 'h2': [], 'jython': [1, 16], 'luindex': [1, 16], 'lusearch': [], 'xalan': [1, 16]}
+FIGURE_TYPES = [figure_type for figure_type, plotter, suite, subdirectory, title in DACAPO_FIGURES] + ['ycsb']
+# Store each worker process opens for itself, as sqlite connections do not survive a fork
+STORE_PATH = None
+
+def experiment_names(results_dir, suite, os_type):
+  experiments_dir = os.path.join(results_dir, suite, os_type)
+  return os.listdir(experiments_dir) if os.path.isdir(experiments_dir) else []
+
+def render(task):
+  # Draws one figure type for one benchmark (or a YCSB metric) and returns None, or the error
+  kind, figure_type, name, os_type, output_dir, output_extension, payload = task
+  try:
+    if kind == 'ycsb':
+      parse_ycsb.plot_results(figure_type, payload, output_dir, output_extension)
+      return None
+    if parse_dacapo.STORE is None:
+      parse_dacapo.STORE = results_store.open_store(STORE_PATH)
+    plotter, suite = [(plotter, suite) for dacapo_type, plotter, suite, subdirectory, title in DACAPO_FIGURES if dacapo_type == figure_type][0]
+    parse_dacapo.DACAPO_DIR = suite
+    if figure_type == 'jit':
+      parse_dacapo.JVM_COUNTS = JIT_JVM_COUNTS
+    experiments = [exp for exp in experiment_names(parse_dacapo.results_dir, suite, os_type) if re.match("^%s_.*" % name, exp)]
+    getattr(parse_dacapo, plotter)(name, experiments, os_type, parse_dacapo.results_dir, output_dir, output_extension)
+    return None
+  except Exception:
+    return traceback.format_exc()
+
+def dacapo_benchmarks(db, suite, os_type):
+  return [benchmark for benchmark, in db.execute("SELECT DISTINCT benchmark FROM iterations WHERE suite = ? AND platform = ? ORDER BY benchmark",
+                                                 (suite, os_type))]
+
+def runtime_table(db, benchmark, os_type):
+  # HTML table of mean total runtime and its standard deviation over domains, JVMs by heap size
+  results = results_store.runtime_results(db, 'dacapo', os_type, benchmark, parse_dacapo.CONVERGENCES.get(benchmark, 0))
+  if not results:
+    return ""
+  heaps = sorted(set(heap for memsize_to_results in results.values() for heap in memsize_to_results))
+  rows = ["<tr><th>JVMs</th>%s</tr>" % "".join("<th>%d MB</th>" % heap for heap in heaps)]
+  for num_jvms, memsize_to_results in sorted(results.iteritems()):
+    rows.append("<tr><td>%d</td>%s</tr>" % (num_jvms, "".join("<td>%.0f &plusmn; %.0f ms</td>" % memsize_to_results[heap]
+                                                              if heap in memsize_to_results else "<td></td>" for heap in heaps)))
+  return "<table>%s</table>" % "\n".join(rows)
+
+def ycsb_table(ycsb_results):
+  # HTML table of every YCSB metric, one row per JVM count
+  rows = ["<tr><th>JVMs</th>%s</tr>" % "".join("<th>%s</th>" % cgi.escape(parse_ycsb.RESULT_LABELS[metric][0]) for metric in parse_ycsb.RESULT_METRICS)]
+  for jvm_count, result in sorted(ycsb_results.iteritems()):
+    rows.append("<tr><td>%d</td>%s</tr>" % (jvm_count, "".join("<td>%.4g</td>" % getattr(result, metric) for metric in parse_ycsb.RESULT_METRICS)))
+  return "<table>%s</table>" % "\n".join(rows)
+
+def figures_html(output_dir, pattern):
+  return "\n".join('<img src="%s">' % cgi.escape(os.path.relpath(path, output_dir), True) for path in sorted(glob.glob(os.path.join(output_dir, pattern))))
+
+def write_index(output_dir, output_extension, db, os_type, benchmarks, ycsb_results, errors):
+  sections = []
+  for benchmark in benchmarks:
+    parts = ["<h2>%s</h2>" % cgi.escape(benchmark), runtime_table(db, benchmark, os_type)]
+    for figure_type, plotter, suite, subdirectory, title in DACAPO_FIGURES:
+      figures = figures_html(output_dir, "dacapo/%s/%s[._]*%s" % (subdirectory, benchmark, output_extension))
+      if figures:
+        parts.append("<h3>%s</h3>\n%s" % (title, figures))
+    sections.append("\n".join(parts))
+  if ycsb_results:
+    figures = [figures_html(output_dir, "ycsb/%s.%s" % (metric, output_extension)) for metric in parse_ycsb.RESULT_METRICS]
+    sections.append("<h2>Cassandra/YCSB</h2>\n%s\n%s" % (ycsb_table(ycsb_results), "\n".join(figure for figure in figures if figure)))
+  if errors:
+    sections.append("<h2>Failed figures</h2>\n%s" % "\n".join("<h3>%s</h3><pre>%s</pre>" % (cgi.escape(name), cgi.escape(error)) for name, error in errors))
+  with open(os.path.join(output_dir, REPORT_FILE), 'w') as f:
+    f.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Results report: %s (%s)</title>\n"
+            "<style>body { font-family: sans-serif; } img { max-width: 48%%; } table { border-collapse: collapse; } "
+            "td, th { border: 1px solid #ccc; padding: 2px 6px; text-align: right; }</style></head><body>\n"
+            "<h1>Results report: %s (%s)</h1>\n%s\n</body></html>\n" % (cgi.escape(parse_dacapo.results_dir), cgi.escape(os_type),
+                                                                      cgi.escape(parse_dacapo.results_dir), cgi.escape(os_type), "\n".join(sections)))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("-r", "--resultsdir", action="store", help="name of the directory containing the results")
+  parser.add_argument("-o", "--outputdir", action="store", default="report", help="directory to write the figures and %s into (default: %%(default)s)" % REPORT_FILE)
+  parser.add_argument("-e", "--extension", action="store", default="png", help="file type of the figures (default: %(default)s)")
+  parser.add_argument("-x", "--xen", action="store_const", default='linux', const='xen', help="enable to report xen results instead of linux")
+  parser.add_argument("-t", "--types", action="store", default=",".join(FIGURE_TYPES), help="comma separated figure types to draw (default: %(default)s)")
+  parser.add_argument("-j", "--jobs", action="store", default=0, type=int, help="how many processes to parse and draw on (default: one per cpu)")
+  parser.add_argument("--store", action="store", default=None, help="results store to parse into (default: %s in the results directory)" % results_store.STORE_FILE)
+  cmdargs = parser.parse_args()
+
+  results_dir = cmdargs.resultsdir
+  os_type = cmdargs.xen
+  figure_types = cmdargs.types.split(',')
+  STORE_PATH = cmdargs.store or os.path.join(results_dir, results_store.STORE_FILE)
+  db = results_store.open_store(STORE_PATH)
+  print "Read %d changed files into %s" % (results_store.ingest(db, results_dir, jobs=cmdargs.jobs), STORE_PATH)
+  # Workers inherit these and draw in a single process each
+  parse_dacapo.results_dir = parse_ycsb.results_dir = results_dir
+  parse_dacapo.JOBS = parse_ycsb.JOBS = 1
+
+  tasks = []
+  benchmarks = dacapo_benchmarks(db, 'dacapo', os_type)
+  for figure_type, plotter, suite, subdirectory, title in DACAPO_FIGURES:
+    if figure_type in figure_types:
+      tasks.extend(('dacapo', figure_type, benchmark, os_type, cmdargs.outputdir, cmdargs.extension, None)
+                   for benchmark in (benchmarks if suite == 'dacapo' else dacapo_benchmarks(db, suite, os_type)))
+  ycsb_results = None
+  ycsb_experiments = [exp for exp in experiment_names(results_dir, parse_ycsb.YCSB_DIR, os_type) if re.match(".*jvms$", exp)]
+  if 'ycsb' in figure_types and ycsb_experiments:
+    parse_ycsb.JOBS = cmdargs.jobs
+    ycsb_results = dict(parse_ycsb.parse_results(ycsb_experiments, os_type))
+    parse_ycsb.JOBS = 1
+    tasks.extend(('ycsb', metric, metric, os_type, cmdargs.outputdir, cmdargs.extension, ycsb_results) for metric in parse_ycsb.RESULT_METRICS)
+  db.close()
+
+  errors = [("%s %s" % (figure_type, name), error) for (kind, figure_type, name, os_type, output_dir, output_extension, payload), error
+            in zip(tasks, parse_all(render, tasks, cmdargs.jobs)) if error]
+  for name, error in errors:
+    print "Failed to draw %s:\n%s" % (name, error)
+  if not os.path.exists(cmdargs.outputdir):
+    os.makedirs(cmdargs.outputdir)
+  write_index(cmdargs.outputdir, cmdargs.extension, results_store.open_store(STORE_PATH), os_type, benchmarks, ycsb_results, errors)
+  print "Drew %d of %d figure sets, wrote %s" % (len(tasks) - len(errors), len(tasks), os.path.join(cmdargs.outputdir, REPORT_FILE))
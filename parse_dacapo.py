@@ -8,6 +8,12 @@ import argparse
 import json
 from collections import defaultdict
 from scipy.stats import cumfreq
+from parse_xentrace import experiment_costop, jvm_domains, load_trace_times
+from trace_reducer import load_domain_times, REDUCED_FILE
+import results_store
+import results_io
+from parse_engine import parse_all, dacapo_iterations, gc_event_table, safepoint_table
+from gc_log import gc_summary, allocation_rates, safepoint_summary
 
 DACAPO_DIR='dacapo'
 DACAPO_BENCHMARKS = ['avrora', 'jython', 'luindex', 'xalan']
@@ -26,8 +32,27 @@ JVM_COUNTS = {'avrora': [1, 2, 4, 8, 16],
               'xalan': [1, 2, 4, 8, 16]
               }
 XENALYZE_FILE = "xenalyze_summary"
+WINDOW_FILE = "measurement_window.json"
+MEASURED_ITERATIONS = 5
+CPU_HZ = 2.67e9
+COSTOP_METRICS = [('skew_mean', "Mean vCPU Skew", "Skew (ms)", 1000),
+                  ('hazard_p99', "99th Percentile Concurrency Hazard Interval", "Interval (ms)", 1000),
+                  ('runnable_fraction', "Fraction of vCPU Time Runnable", "Fraction vCPU Time Runnable", 1)]
+GC_PAUSE_METRICS = [('pause_p99', "99th Percentile GC Pause", "Pause (ms)", 1000),
+                    ('pause_max', "Longest GC Pause", "Pause (ms)", 1000),
+                    ('overhead', "Mean GC Overhead per Iteration", "Fraction of Iteration Runtime", 1),
+                    ('allocation_rate', "Allocation Rate", "Allocation Rate (MB/s)", 1),
+                    ('promotion_rate', "Promotion Rate", "Promotion Rate (MB/s)", 1)]
+SAFEPOINT_METRICS = [('ttsp_per_iteration', "Time to Safepoint per Iteration", "Time (ms)", 1000),
+                     ('operation_per_iteration', "Safepoint Operation Time per Iteration", "Time (ms)", 1000),
+                     ('ttsp_p99', "99th Percentile Time to Safepoint", "Time (ms)", 1000),
+                     ('ttsp_fraction', "Fraction of Safepoint Time Spent Reaching It", "Fraction of Safepoint Time", 1)]
 with open('dacapo_convergences.json', 'r') as f:
   CONVERGENCES = json.load(f)
+# Results store the parsers query instead of scanning the logs, if any
+STORE = None
+# Processes to parse logs on, 0 for one per cpu
+JOBS = 0
 
 def plot_runtimes(benchmark, benchmark_experiments, os_type, results_dir, output_dir, output_extension):
   print "Parsing and plotting runtime results for %d %s experiments...\n" % (len(benchmark_experiments), benchmark)
@@ -39,7 +64,7 @@ def plot_runtimes(benchmark, benchmark_experiments, os_type, results_dir, output
     return
 
   # Initialize values we'll need for the x-axis
-  memory_sizes = MEM_SIZES[benchmark]
+  memory_sizes = sweep_mem_sizes(runtime_results)
   xs = range(1,len(memory_sizes)+1)
   bar_width, offset = 0.1, -0.2 # These offset the bar series from each other. Designed for 5 bar series.
   color_iter = iter(['#8FE3FF', '#FFC94D', '#FF6363', '#4EC6CC', '#989898']) # Colors for successive bar series
@@ -50,8 +75,9 @@ def plot_runtimes(benchmark, benchmark_experiments, os_type, results_dir, output
   ax.set_xlim(0, len(memory_sizes)+1)
 
   for jvm_count, memsize_to_results in sorted(runtime_results.iteritems(), key=lambda t: t[0]):
-    avg_runtimes, errors = zip(*[memsize_to_results[memsize] for memsize in memory_sizes])
-    ax.bar([x + offset for x in xs], avg_runtimes, width=bar_width, color=next(color_iter), align="center", label="%d JVMs" % jvm_count, yerr=errors, error_kw={'ecolor': 'k', 'capsize': 4})
+    memsizes = [memsize for memsize in memory_sizes if memsize in memsize_to_results]
+    avg_runtimes, errors = zip(*[memsize_to_results[memsize] for memsize in memsizes])
+    ax.bar([xs[memory_sizes.index(memsize)] + offset for memsize in memsizes], avg_runtimes, width=bar_width, color=next(color_iter), align="center", label="%d JVMs" % jvm_count, yerr=errors, error_kw={'ecolor': 'k', 'capsize': 4})
     offset += bar_width
 
   # Apply labels and bounds
@@ -188,7 +214,7 @@ def plot_jit(benchmark, benchmark_experiments, os_type, results_dir, output_dir,
     return
 
   # Initialize values we'll need for the x-axis
-  memory_sizes = MEM_SIZES[benchmark]
+  memory_sizes = sweep_mem_sizes(runtime_results)
   xs = range(1,len(memory_sizes)+1)
   # These offset the bar series from each other. Designed for 5 bar series.
   bar_width, offset = 0.15, -0.075 # These offset the bar series from each other. Designed for 2 bar series.
@@ -201,9 +227,10 @@ def plot_jit(benchmark, benchmark_experiments, os_type, results_dir, output_dir,
   ax.set_xlim(0, len(memory_sizes)+1)
 
   for jvm_count, memsize_to_results in sorted(runtime_results.iteritems(), key=lambda t: t[0]):
-    print [memsize_to_results[memsize] for memsize in memory_sizes]
-    avg_runtimes, std_runtimes = zip(*[memsize_to_results[memsize] for memsize in memory_sizes])
-    ax.bar([x + offset for x in xs], avg_runtimes, yerr=std_runtimes, ecolor='k', capsize=5, width=bar_width, color=next(color_iter), align="center", label="%d JVMs" % jvm_count)
+    memsizes = [memsize for memsize in memory_sizes if memsize in memsize_to_results]
+    print [memsize_to_results[memsize] for memsize in memsizes]
+    avg_runtimes, std_runtimes = zip(*[memsize_to_results[memsize] for memsize in memsizes])
+    ax.bar([xs[memory_sizes.index(memsize)] + offset for memsize in memsizes], avg_runtimes, yerr=std_runtimes, ecolor='k', capsize=5, width=bar_width, color=next(color_iter), align="center", label="%d JVMs" % jvm_count)
     offset += bar_width
 
   # Apply labels and legend
@@ -249,36 +276,120 @@ def plot_xenalyze(benchmark, benchmark_experiments, os_type, results_dir, output
 
   save_or_show_current(output_dir, 'xenalyze', benchmark, output_extension)
 
+def plot_costop(benchmark, benchmark_experiments, os_type, results_dir, output_dir, output_extension):
+  print "Parsing and plotting vCPU co-scheduling for %d %s experiments...\n" % (len(benchmark_experiments), benchmark)
+
+  costop_results = parse_costop(benchmark, benchmark_experiments, os_type)
+  if len(costop_results) == 0:
+    print "Not enough results found for %s. Skipping..." % benchmark
+    return
+  runtime_results = parse_runtime_results(benchmark, benchmark_experiments, os_type)
+
+  print "%6s %8s %14s %12s %14s %10s" % ("JVMs", "Heap", "Runtime (ms)", "Skew (ms)", "Hazard p99 (ms)", "Runnable")
+  for jvm_count, memsize_to_results in sorted(costop_results.iteritems()):
+    for mem_size, costop in sorted(memsize_to_results.iteritems()):
+      runtime = runtime_results[jvm_count][mem_size][0] if mem_size in runtime_results[jvm_count] else float('nan')
+      print "%6d %6dMB %14.0f %12.2f %14.2f %10.3f" % (jvm_count, mem_size, runtime, costop['skew_mean'] * 1000,
+                                                     costop['hazard_p99'] * 1000, costop['runnable_fraction'])
+
+  for metric, title, ylabel, scale in COSTOP_METRICS:
+    plot_metric(benchmark, costop_results, metric, title, ylabel, scale)
+    save_or_show_current(output_dir, 'costop', benchmark, output_extension, suffix=metric)
+
+def plot_gc_pauses(benchmark, benchmark_experiments, os_type, results_dir, output_dir, output_extension):
+  print "Parsing and plotting GC pauses for %d %s experiments...\n" % (len(benchmark_experiments), benchmark)
+
+  pause_results = parse_gc_pauses(benchmark, benchmark_experiments, os_type)
+  if len(pause_results) == 0:
+    print "Not enough results found for %s. Skipping..." % benchmark
+    return
+
+  print "%6s %8s %8s %14s %14s %14s %10s %12s %12s" % ("JVMs", "Heap", "Pauses", "p50 (ms)", "p99 (ms)", "Max (ms)",
+                                                      "Overhead", "Alloc (MB/s)", "Promo (MB/s)")
+  for jvm_count, memsize_to_results in sorted(pause_results.iteritems()):
+    for mem_size, summary in sorted(memsize_to_results.iteritems()):
+      print "%6d %6dMB %8d %14.2f %14.2f %14.2f %10.3f %12.1f %12.1f" % (jvm_count, mem_size, summary['pauses'],
+        summary['pause_p50'] * 1000, summary['pause_p99'] * 1000, summary['pause_max'] * 1000, summary['overhead'],
+        summary['allocation_rate'], summary['promotion_rate'])
+
+  for metric, title, ylabel, scale in GC_PAUSE_METRICS:
+    plot_metric(benchmark, pause_results, metric, title, ylabel, scale)
+    save_or_show_current(output_dir, 'gcpauses', benchmark, output_extension, suffix=metric)
+
+def plot_safepoints(benchmark, benchmark_experiments, os_type, results_dir, output_dir, output_extension):
+  print "Parsing and plotting safepoints for %d %s experiments...\n" % (len(benchmark_experiments), benchmark)
+
+  safepoint_results = parse_safepoints(benchmark, benchmark_experiments, os_type)
+  if len(safepoint_results) == 0:
+    print "Not enough results found for %s (run with --safepoints). Skipping..." % benchmark
+    return
+
+  print "%6s %8s %11s %16s %16s %14s %10s" % ("JVMs", "Heap", "Safepoints", "TTSP/iter (ms)", "VM op/iter (ms)",
+                                              "TTSP p99 (ms)", "TTSP share")
+  for jvm_count, memsize_to_results in sorted(safepoint_results.iteritems()):
+    for mem_size, summary in sorted(memsize_to_results.iteritems()):
+      print "%6d %6dMB %11d %16.1f %16.1f %14.1f %10.3f" % (jvm_count, mem_size, summary['safepoints'],
+        summary['ttsp_per_iteration'] * 1000, summary['operation_per_iteration'] * 1000, summary['ttsp_p99'] * 1000,
+        summary['ttsp_fraction'])
+
+  for metric, title, ylabel, scale in SAFEPOINT_METRICS:
+    plot_metric(benchmark, safepoint_results, metric, title, ylabel, scale)
+    save_or_show_current(output_dir, 'safepoints', benchmark, output_extension, suffix=metric)
+
+def plot_metric(benchmark, results, metric, title, ylabel, scale):
+  # Plots one metric of {num_jvms -> {mem_size -> {metric -> value}}} against the number of JVMs
+  plt.clf()
+  ax = plt.subplot(111)
+
+  keyed_by_mem_size = defaultdict(list)
+  for jvm_count, memsize_to_results in sorted(results.iteritems(), key=lambda t: t[0]):
+    for memsize, values in memsize_to_results.iteritems():
+      keyed_by_mem_size[memsize].append((jvm_count, values[metric] * scale))
+
+  max_value = 0
+  for mem_size, value_list in sorted(keyed_by_mem_size.iteritems(), key=lambda t: t[0]):
+    jvms = [t[0] for t in value_list]
+    values = [t[1] for t in value_list]
+    max_value = max([max_value] + values)
+    ax.plot(jvms, values, '--d', label="%d MB" % mem_size)
+
+  # Apply labels and bounds
+  plt.title("%s %s" % (benchmark, title))
+  plt.ylabel(ylabel)
+  plt.xlabel("Number of JVMs")
+  plt.xlim(0, max(jvms)*1.1)
+  plt.ylim(0, max_value*1.1 or 1)
+
+  plt.legend(loc='upper left')
+
 def parse_runtime_results(benchmark, benchmark_experiments, os_type, aggregate=True, stddev=False):
   # Returns dictionary of the form: {num_jvms -> {mem_size -> avg_runtime_ms}}
+  if STORE:
+    return results_store.runtime_results(STORE, DACAPO_DIR, os_type, benchmark, CONVERGENCES[benchmark], aggregate)
   jvms_to_results = defaultdict(lambda : defaultdict(int))
-  for exp in benchmark_experiments:
-    benchmark, num_jvms, mem_size = re.search("([a-zA-Z0-9]*)_(\d+)jvms_(\d+)MB$", exp).groups()
-    num_jvms, mem_size = int(num_jvms), int(mem_size)
-
-    exp_path = "/".join([results_dir, DACAPO_DIR, os_type, exp])
-
+  experiments = experiment_points(benchmark_experiments, os_type)
+  iterations = parse_consoles(benchmark, experiments, os_type)
+  for exp, num_jvms, mem_size, exp_path in experiments:
     exp_times = []
     for jvm in range(1, num_jvms+1):
-      # Runtimes are logged in the stderr files on linux and stout files on xen
-      if os_type == "xen":
-        filename = "/".join([exp_path, "stdout%02d" % jvm])
-      else:
-        filename = "/".join([exp_path, "stderr%02d" % jvm])
-      with open(filename, 'r') as f:
-        contents = f.read()
-      all_per_jvm_times = map(int, re.findall("%s .* in (\d+) msec" % benchmark, contents))
-      index_start = CONVERGENCES[benchmark]
-      index_end = index_start + 5
+      all_per_jvm_times = iterations[(exp, jvm)]['runtime_ms'].tolist()
+      window = measurement_window(exp_path, jvm, benchmark)
+      if window is None:
+        print "Skipping crashed domain %02d of %s" % (jvm, exp)
+        continue
+      index_start, num_iterations = window
+      index_end = index_start + num_iterations
       per_jvm_times = all_per_jvm_times[index_start:index_end]
-      if len(per_jvm_times) < 5:
-        print "Unable to find 5 valid runtimes for %s" % exp
+      if len(per_jvm_times) < num_iterations:
+        print "Unable to find %d valid runtimes for %s" % (num_iterations, exp)
         continue
-      # We'll use the sum
+      # We'll use the sum, scaled to 5 iterations so adaptive windows stay comparable
       if aggregate:
-        exp_times.append(np.sum(per_jvm_times))
+        exp_times.append(np.mean(per_jvm_times) * MEASURED_ITERATIONS)
       else:
         exp_times += per_jvm_times
+    if not exp_times:
+      continue
     # To find standard deviation for each experiment, call "np.std(exp_times)" here
     if aggregate:
       jvms_to_results[num_jvms][mem_size] = (np.mean(exp_times), np.std(exp_times))
@@ -289,35 +400,29 @@ def parse_runtime_results(benchmark, benchmark_experiments, os_type, aggregate=T
 
 def parse_gc(benchmark, benchmark_experiments, os_type):
   # Returns dictionary of the form: {num_jvms -> {mem_size -> (minior avg_runtime_s, major avg_runtime_s}}
+  if STORE:
+    return results_store.gc_results(STORE, DACAPO_DIR, os_type, benchmark, CONVERGENCES[benchmark])
   jvms_to_results = defaultdict(lambda : defaultdict(int))
-  for exp in benchmark_experiments:
-    benchmark, num_jvms, mem_size = re.search("([a-zA-Z0-9]*)_(\d+)jvms_(\d+)MB$", exp).groups()
-    num_jvms, mem_size = int(num_jvms), int(mem_size)
-
-    exp_path = "/".join([results_dir, DACAPO_DIR, os_type, exp])
-
+  experiments = experiment_points(benchmark_experiments, os_type)
+  iterations = parse_consoles(benchmark, experiments, os_type)
+  for exp, num_jvms, mem_size, exp_path in experiments:
     exp_times = []
     for jvm in range(1, num_jvms+1):
-      # Runtimes are logged in the stderr files on linux and stout files on xen
-      if os_type == "xen":
-        filename = "/".join([exp_path, "stdout%02d" % jvm])
-      else:
-        filename = "/".join([exp_path, "stderr%02d" % jvm])
-      with open(filename, 'r') as f:
-        contents = f.read()
-      index_start = CONVERGENCES[benchmark] + 1
-      index_end = index_start + 4
-      try:
-        contents = re.findall(r"starting warmup %d ([\s\S]*) completed warmup %d" % (index_start, index_end), contents)[0]
-      except:
+      window = measurement_window(exp_path, jvm, benchmark)
+      if window is None:
+        print "Skipping crashed domain %02d of %s" % (jvm, exp)
+        continue
+      index_start, num_iterations = window
+      measured = iterations[(exp, jvm)][index_start:index_start + num_iterations]
+      if len(measured) < num_iterations:
         print jvm
-        print "Unable to find 5 valid runtimes for %s" % exp
+        print "Unable to find %d valid runtimes for %s" % (num_iterations, exp)
         continue
-      major_gc_per_jvm_times = map(float, re.findall(r"\[Full GC.*, ([.\d]*) secs", contents))
-      minor_gc_per_jvm_times = map(float, re.findall(r"\[GC.*, ([.\d]*) secs", contents))
       # We'll use the sum
-      exp_times.append((np.sum(major_gc_per_jvm_times), np.sum(minor_gc_per_jvm_times)))
+      exp_times.append((np.sum(measured['gc_major_ms']) / 1000, np.sum(measured['gc_minor_ms']) / 1000))
     
+    if not exp_times:
+      continue
     #major_times, minor_times = zip(*exp_times)
     #jvms_to_results[num_jvms][mem_size] = (np.mean(major_times), np.mean(minor_times))
     
@@ -326,25 +431,77 @@ def parse_gc(benchmark, benchmark_experiments, os_type):
 
   return jvms_to_results
 
+def parse_gc_pauses(benchmark, benchmark_experiments, os_type):
+  # Returns dictionary of the form: {num_jvms -> {mem_size -> {metric -> value}}}, summarizing the
+  # GC events of every domain of each experiment over their measured iterations (see gc_log.gc_summary)
+  jvms_to_results = defaultdict(dict)
+  experiments = experiment_points(benchmark_experiments, os_type)
+  iterations = parse_consoles(benchmark, experiments, os_type)
+  events = parse_consoles(benchmark, experiments, os_type, worker=gc_event_table)
+  for exp, num_jvms, mem_size, exp_path in experiments:
+    measured_events, runtimes, rates = [], [], []
+    for jvm in range(1, num_jvms+1):
+      window = measurement_window(exp_path, jvm, benchmark)
+      if window is None:
+        print "Skipping crashed domain %02d of %s" % (jvm, exp)
+        continue
+      index_start, num_iterations = window
+      measured = iterations[(exp, jvm)][index_start:index_start + num_iterations]
+      if len(measured) < num_iterations:
+        print "Unable to find %d valid runtimes for %s" % (num_iterations, exp)
+        continue
+      # Number the measured iterations of every domain one after another
+      jvm_events = events[(exp, jvm)]
+      jvm_events = jvm_events[(jvm_events['iteration'] >= index_start) & (jvm_events['iteration'] < index_start + num_iterations)]
+      jvm_events['iteration'] += len(runtimes) - index_start
+      measured_events.append(jvm_events)
+      runtimes.extend(measured['runtime_ms'])
+      rates.append(allocation_rates(jvm_events))
+    if runtimes:
+      # Pauses are pooled across domains, but each domain's JVM keeps its own clock
+      summary = gc_summary(np.concatenate(measured_events), runtimes)
+      summary['allocation_rate'], summary['promotion_rate'] = np.mean(rates, axis=0)
+      jvms_to_results[num_jvms][mem_size] = summary
+  return jvms_to_results
+
+def parse_safepoints(benchmark, benchmark_experiments, os_type):
+  # Returns dictionary of the form: {num_jvms -> {mem_size -> {metric -> value}}}, splitting the
+  # safepoints of every domain of each experiment over their measured iterations into time to
+  # safepoint and VM operation time (see gc_log.safepoint_summary)
+  jvms_to_results = defaultdict(dict)
+  experiments = experiment_points(benchmark_experiments, os_type)
+  iterations = parse_consoles(benchmark, experiments, os_type)
+  safepoints = parse_consoles(benchmark, experiments, os_type, worker=safepoint_table)
+  for exp, num_jvms, mem_size, exp_path in experiments:
+    measured_safepoints, measured_stops, num_measured = [], [], 0
+    for jvm in range(1, num_jvms+1):
+      window = measurement_window(exp_path, jvm, benchmark)
+      if window is None:
+        print "Skipping crashed domain %02d of %s" % (jvm, exp)
+        continue
+      index_start, num_iterations = window
+      if len(iterations[(exp, jvm)][index_start:index_start + num_iterations]) < num_iterations:
+        print "Unable to find %d valid runtimes for %s" % (num_iterations, exp)
+        continue
+      jvm_safepoints, jvm_stops = safepoints[(exp, jvm)]
+      measured_safepoints.append(jvm_safepoints[(jvm_safepoints['iteration'] >= index_start) & (jvm_safepoints['iteration'] < index_start + num_iterations)])
+      measured_stops.append(jvm_stops[(jvm_stops['iteration'] >= index_start) & (jvm_stops['iteration'] < index_start + num_iterations)])
+      num_measured += num_iterations
+    if num_measured and sum(map(len, measured_safepoints)):
+      jvms_to_results[num_jvms][mem_size] = safepoint_summary(np.concatenate(measured_safepoints), np.concatenate(measured_stops), num_measured)
+  return jvms_to_results
+
 def parse_jit(benchmark, benchmark_experiments, os_type):
   # Returns dictionary of the form: {num_jvms -> {mem_size -> avg_runtime_ms}}
+  if STORE:
+    return results_store.jit_results(STORE, DACAPO_DIR, os_type, benchmark)
   jvms_to_results = defaultdict(lambda : defaultdict(int))
-  for exp in benchmark_experiments:
-    benchmark, num_jvms, mem_size = re.search("([a-zA-Z0-9]*)_(\d+)jvms_(\d+)MB$", exp).groups()
-    num_jvms, mem_size = int(num_jvms), int(mem_size)
-
-    exp_path = "/".join([results_dir, DACAPO_DIR, os_type, exp])
-
+  experiments = experiment_points(benchmark_experiments, os_type)
+  iterations = parse_consoles(benchmark, experiments, os_type, num_domains=5)
+  for exp, num_jvms, mem_size, exp_path in experiments:
     exp_times = []
     for jvm in range(1, 6):
-      # Runtimes are logged in the stderr files on linux and stout files on xen
-      if os_type == "xen":
-        filename = "/".join([exp_path, "stdout%02d" % jvm])
-      else:
-        filename = "/".join([exp_path, "stderr%02d" % jvm])
-      with open(filename, 'r') as f:
-        contents = f.read()
-      all_per_jvm_times = map(int, re.findall("%s .* in (\d+) msec" % benchmark, contents))
+      all_per_jvm_times = iterations[(exp, jvm)]['runtime_ms'].tolist()
       if benchmark == 'luindex':
         index_start = -4
       else:
@@ -358,29 +515,106 @@ def parse_jit(benchmark, benchmark_experiments, os_type):
 
 def parse_xenalyze(benchmark, benchmark_experiments, os_type):
   # Returns dictionary of the form: {num_jvms -> {mem_size -> avg_runtime_ms}}
+  if STORE:
+    return results_store.hazard_results(STORE, DACAPO_DIR, os_type, benchmark)
   jvms_to_results = defaultdict(lambda : defaultdict(int))
-  for exp in benchmark_experiments:
-    benchmark, num_jvms, mem_size = re.search("([a-zA-Z0-9]*)_(\d+)jvms_(\d+)MB$", exp).groups()
-    num_jvms, mem_size = int(num_jvms), int(mem_size)
+  experiments = experiment_points(benchmark_experiments, os_type)
+  hazards = parse_all(experiment_hazards, [(exp_path, num_jvms) for exp, num_jvms, mem_size, exp_path in experiments], JOBS)
+  for (exp, num_jvms, mem_size, exp_path), exp_times in zip(experiments, hazards):
+    jvms_to_results[num_jvms][mem_size] = np.mean(exp_times)
 
-    exp_path = "/".join([results_dir, DACAPO_DIR, os_type, exp])
+  return jvms_to_results
 
-    with open(os.path.join(exp_path, XENALYZE_FILE), 'r') as f:
+def experiment_hazards(task):
+  # Returns the fraction of time each domain of an experiment spent in concurrency hazard
+  exp_path, num_jvms = task
+  index_start = 1
+  index_end = index_start + num_jvms
+  if results_io.exists(os.path.join(exp_path, XENALYZE_FILE)):
+    with results_io.open_file(os.path.join(exp_path, XENALYZE_FILE), 'r') as f:
       contents = f.read()
-      index_start = 1
-      index_end = index_start + num_jvms
       domains = re.findall(r"Domain[\s\S]*?Grant table ops", contents)[index_start:index_end]
+    domains = [dict(map(lambda (runstate, time): (runstate.strip(), float(time)), re.findall(r"([\w ]+):[\d ]* ([.\d]+)s", domain)))
+               for domain in domains]
+  else:
+    # Runs with --trace stream only have the reduced trace
+    domain_times = load_domain_times(os.path.join(exp_path, REDUCED_FILE))
+    domains = [times for jvm, times in jvm_domains(domain_times, load_trace_times(exp_path), num_jvms)]
+
+  exp_times = []
+  for domain_runstates in domains:
+    total_time = reduce(lambda accum,(runstate, time): accum + time, domain_runstates.iteritems(), 0)
+    exp_times.append((domain_runstates['concurrency_hazard']) / total_time)
+  return np.array(exp_times)
+
+def parse_costop(benchmark, benchmark_experiments, os_type):
+  # Returns dictionary of the form: {num_jvms -> {mem_size -> {metric -> value}}}, averaging the
+  # co-scheduling statistics of the domains of each experiment over their measured iterations
+  jvms_to_results = defaultdict(dict)
+  experiments = []
+  for exp, num_jvms, mem_size, exp_path in experiment_points(benchmark_experiments, os_type):
+    if not os.path.exists(os.path.join(exp_path, 'trace_file.bin')):
+      print "No trace found for %s (run with --keeptrace)" % exp
+      continue
+    experiments.append((exp, num_jvms, mem_size, exp_path))
+
+  tasks = [(exp_path, benchmark, num_jvms, CONVERGENCES[benchmark], CPU_HZ) for exp, num_jvms, mem_size, exp_path in experiments]
+  for (exp, num_jvms, mem_size, exp_path), stats in zip(experiments, parse_all(costop_worker, tasks, JOBS)):
+    stats = stats.values()
+    if not stats:
+      continue
+    intervals = np.concatenate([s['hazard_intervals'] for s in stats])
+    jvms_to_results[num_jvms][mem_size] = {
+      'skew_mean': np.mean([s['skew_mean'] for s in stats]),
+      'hazard_p99': np.percentile(intervals, 99) if len(intervals) else 0.0,
+      'runnable_fraction': np.mean([s['runnable'].sum() / (s['elapsed'] * len(s['vcpus'])) for s in stats if s['elapsed'] > 0])
+    }
 
-    exp_times = []
-    for domain in domains:
-      domain_runstates = re.findall(r"([\w ]+):[\d ]* ([.\d]+)s", domain)
-      domain_runstates = dict(map(lambda (runstate, time): (runstate.strip(), float(time)), domain_runstates))
-      total_time = reduce(lambda accum,(runstate, time): accum + time, domain_runstates.iteritems(), 0)
-      exp_times.append((domain_runstates['concurrency_hazard']) / total_time)
+  return jvms_to_results
 
-    jvms_to_results[num_jvms][mem_size] = np.mean(exp_times)
+def sweep_mem_sizes(results):
+  # Every heap size run for any JVM count, from the experiments found. Adaptive sweeps run each
+  # JVM count at heap sizes of its own, so a JVM count's bars are only drawn at the sizes it has.
+  return sorted(set(memsize for memsize_to_results in results.values() for memsize in memsize_to_results))
 
-  return jvms_to_results
+def costop_worker(task):
+  return experiment_costop(*task)
+
+def experiment_points(benchmark_experiments, os_type):
+  # Returns [(exp, num_jvms, mem_size, exp_path)] for every experiment directory name
+  experiments = []
+  for exp in benchmark_experiments:
+    benchmark, num_jvms, mem_size = re.search("([a-zA-Z0-9]*)_(\d+)jvms_(\d+)MB$", exp).groups()
+    experiments.append((exp, int(num_jvms), int(mem_size), "/".join([results_dir, DACAPO_DIR, os_type, exp])))
+  return experiments
+
+def parse_consoles(benchmark, experiments, os_type, num_domains=None, worker=dacapo_iterations):
+  # Parses the console log of every domain of every experiment on a process pool.
+  # Returns {(exp, jvm) -> ITERATION_DTYPE array of its iterations}, or whatever else worker
+  # returns for a (console, benchmark) task
+  keys, tasks = [], []
+  for exp, num_jvms, mem_size, exp_path in experiments:
+    for jvm in range(1, (num_domains or num_jvms)+1):
+      # Runtimes are logged in the stderr files on linux and stout files on xen
+      if os_type == "xen":
+        filename = "/".join([exp_path, "stdout%02d" % jvm])
+      else:
+        filename = "/".join([exp_path, "stderr%02d" % jvm])
+      keys.append((exp, jvm))
+      tasks.append((filename, benchmark))
+  return dict(zip(keys, parse_all(worker, tasks, JOBS)))
+
+def measurement_window(exp_path, jvm, benchmark):
+  # Returns (warmup iterations, measured iterations) for one domain of an experiment, or None if
+  # its window was cut short (the domain crashed, exited or timed out) and is no measurement
+  window_file = os.path.join(exp_path, WINDOW_FILE)
+  if results_io.exists(window_file):
+    with results_io.open_file(window_file, 'r') as f:
+      window = json.load(f)["%02d" % jvm]
+    if window.get('crashed'):
+      return None
+    return window['warmup'], window['iterations']
+  return CONVERGENCES[benchmark], MEASURED_ITERATIONS
 
 def save_or_show_current(output_dir, subdirectory, benchmark, output_extension, suffix=None):
   if output_dir:
@@ -402,6 +636,8 @@ if __name__ == "__main__":
   parser.add_argument("-o", "--outputdir", action="store", default=False, help="provide a directory to save the experiment results into")
   parser.add_argument("-e", "--extension", action="store", default="eps", help="if -o is provided, this is the file type extension for the graph images")
   parser.add_argument("-b", "--benchmark", action="store", default=False, help="parse a specific benchmark")
+  parser.add_argument("-j", "--jobs", action="store", default=0, type=int, help="how many processes to parse logs on (default: one per cpu)")
+  parser.add_argument("--store", action="store", default=None, help="bring this results store up to date with the results directory and plot from it")
   cmdargs = parser.parse_args()
 
   if cmdargs.type == 'runtime':
@@ -424,10 +660,20 @@ if __name__ == "__main__":
     plotter = plot_jit
   elif cmdargs.type == 'xenalyze':
     plotter = plot_xenalyze
+  elif cmdargs.type == 'costop':
+    plotter = plot_costop
+  elif cmdargs.type == 'gcpauses':
+    plotter = plot_gc_pauses
+  elif cmdargs.type == 'safepoints':
+    plotter = plot_safepoints
   else:
     raise ValueError("Unknown graph type")
 
   results_dir = cmdargs.resultsdir
+  JOBS = cmdargs.jobs
+  if cmdargs.store:
+    STORE = results_store.open_store(cmdargs.store)
+    print "Read %d changed files into %s" % (results_store.ingest(STORE, results_dir, jobs=JOBS), cmdargs.store)
 
   experiments_dir = '/'.join([results_dir, DACAPO_DIR, cmdargs.xen])
   all_experiments = os.listdir(experiments_dir)
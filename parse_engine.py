@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import os
+import re
+import results_io
+from collections import defaultdict
+from gc_log import iteration_gc, gc_events, safepoint_events, ITERATION_DTYPE
+from latency_histogram import LatencyHistogram, load_histograms
+
+# Spreads log parsing over a process pool, one task per (experiment, domain) file. Workers
+# return small numpy arrays rather than log text, and results come back in task order
+# whatever order the workers finish in, so merging them is deterministic.
+
+# [READ], 95thPercentileLatency(ms), 3 and, with measurementtype=histogram, a line per 1ms bucket:
+# [READ], 0, 4521 ... [READ], >1000, 2
+YCSB_LINE_PATTERN = re.compile(r"^\[([A-Z-]+)\], ([^,\n]+), ([^\n]+)$", re.M)
+BUCKET_PATTERN = re.compile(r"(>?)(\d+)$")
+# cql_loadgen.py --histogram-file saves the exact histograms of ycsbrunstdoutTTII as ycsbrunhistTTII.npz
+YCSB_HISTOGRAM_FILE = "ycsbrunhist%s.npz"
+
+def parse_all(worker, tasks, jobs=0):
+  # Returns [worker(task) for task in tasks], computed on jobs processes (default: one per cpu).
+  # worker must be a module level function so the pool can find it.
+  tasks = list(tasks)
+  if jobs == 1 or len(tasks) < 2:
+    return map(worker, tasks)
+  processes = min(jobs or multiprocessing.cpu_count(), len(tasks))
+  pool = multiprocessing.Pool(processes)
+  try:
+    return pool.map(worker, tasks, chunksize=max(1, len(tasks) // (4 * processes)))
+  finally:
+    pool.terminate()
+
+def dacapo_iterations(task):
+  # Returns an ITERATION_DTYPE array with a row per iteration of a DaCapo console log, with the
+  # GC time logged during each
+  path, benchmark = task
+  return iteration_gc(path, benchmark)
+
+def gc_event_table(task):
+  # Returns the GC_EVENT_DTYPE array of every collection in a GC log, numbered by DaCapo
+  # iteration if a benchmark is given
+  path, benchmark = task
+  return gc_events(path, benchmark)
+
+def safepoint_table(task):
+  # Returns the (safepoints, stops) arrays of a console logged with safepoint statistics
+  path, benchmark = task
+  return safepoint_events(path, benchmark)
+
+def parse_ycsb_output(contents):
+  # Returns ({section -> {measure -> value}}, {operation -> LatencyHistogram in us}) for the summary
+  # YCSB prints at the end of a run. Histograms are only there if it ran with measurementtype=histogram.
+  summary = defaultdict(dict)
+  buckets = defaultdict(list)
+  for section, measure, value in YCSB_LINE_PATTERN.findall(contents):
+    bucket = BUCKET_PATTERN.match(measure.strip())
+    if bucket and section != 'OVERALL':
+      buckets[section].append((bucket.group(1) == '>', int(bucket.group(2)), int(value)))
+    else:
+      try:
+        summary[section][measure.strip()] = float(value)
+      except ValueError:
+        pass
+  histograms = dict()
+  for section, section_buckets in buckets.iteritems():
+    # A bucket counts latencies of [ms, ms + 1) and is recorded at the top of its range; the overflow
+    # bucket (>ms) at the largest latency seen
+    values = [max(summary[section].get('MaxLatency(us)', 0), ms * 1000) if overflow else (ms + 1) * 1000 - 1
+              for overflow, ms, count in section_buckets]
+    histograms[section] = LatencyHistogram()
+    histograms[section].record_values(values, [count for overflow, ms, count in section_buckets])
+  return summary, histograms
+
+def ycsb_histogram_file(path):
+  return os.path.join(os.path.dirname(path), YCSB_HISTOGRAM_FILE % os.path.basename(path)[len("ycsbrunstdout"):])
+
+def read_ycsb_run(path):
+  # parse_ycsb_output of a ycsbrunstdout file, with the histograms saved next to it in place of
+  # the 1ms buckets if there are any
+  summary, histograms = parse_ycsb_output(results_io.read(path))
+  histogram_file = ycsb_histogram_file(path)
+  if results_io.exists(histogram_file):
+    with results_io.open_file(histogram_file, 'rb') as f:
+      histograms.update(load_histograms(f))
+  return summary, histograms
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import re
+import numpy as np
+import results_io
+from dacapo_monitor import loadMeasurementWindows, EVENTS_FILE, MEASURED_ITERATIONS
+
+# xentrace record layout: one header word (event:28, extra words:3, tsc included:1), then
+# the tsc as two words if included, then up to 7 extra words. xentrace writes each per-cpu
+# buffer out as a window, prefixed by a TRC_TRACE_CPU_CHANGE record holding the cpu number
+# and the window's size in bytes.
+TRC_TRACE_CPU_CHANGE = 0x0001f003
+TRC_SCHED_CLASS = 0x0002
+TRC_SCHED_RUNSTATE_CHANGE = 0x00021001
+# Bits of a runstate change event holding the old and new runstates
+RUNSTATE_CHANGE_STATES = 0xff0
+DOMID_IDLE = 0x7fff
+MAX_EXTRA = 7
+BATCH_WORDS = 1 << 23
+
+RUNSTATES = ['running', 'runnable', 'blocked', 'offline']
+# xenalyze's classification of a whole domain by the runstates its vcpus are in
+DOMAIN_RUNSTATES = ['blocked', 'partial_run', 'full_run', 'partial_contention', 'concurrency_hazard', 'full_contention', 'lost']
+TRACE_TIMES_FILE = "trace_times.json"
+TIMELINE_FILE = "runstate_timeline.npz"
+
+RECORD_DTYPE = np.dtype([('tsc', '<u8'), ('cpu', '<u2'), ('event', '<u4'), ('n_extra', 'u1'), ('extra', '<u4', (MAX_EXTRA,))])
+RUNSTATE_DTYPE = np.dtype([('tsc', '<u8'), ('cpu', '<u2'), ('domain', '<u2'), ('vcpu', '<u2'), ('old', 'u1'), ('new', 'u1')])
+TIMELINE_DTYPE = np.dtype([('start', '<f8'), ('end', '<f8'), ('fractions', '<f4', (len(DOMAIN_RUNSTATES),))])
+ITERATION_DTYPE = np.dtype([('start', '<f8'), ('end', '<f8'), ('runtime', '<u4'), ('fractions', '<f4', (len(DOMAIN_RUNSTATES),))])
+
+def read_windows(words):
+  # Returns (start, end, cpu) word offsets of every per-cpu window in the trace
+  windows = []
+  words = words.view(np.ndarray)
+  pos, size = 0, len(words)
+  while pos + 3 <= size:
+    header, cpu, length = words[pos:pos + 3].tolist()
+    if header & 0x0fffffff != TRC_TRACE_CPU_CHANGE:
+      raise ValueError("Expected a cpu change record at word %d" % pos)
+    cpu, length = cpu & 0xffff, length // 4
+    windows.append((pos + 3, min(pos + 3 + length, size), cpu))
+    pos += 3 + length
+  return windows
+
+def record_starts(words, starts, ends, window_index):
+  # Finds the offset of every record in a batch of windows. Records are variable length, so
+  # follow the chain of next-record pointers from each window start by pointer doubling:
+  # after k rounds every record within 2^k hops of a window start has been found.
+  size = len(words)
+  jump = np.arange(1, size + 1, dtype=np.int32)
+  jump += (2 * (words >> 31) + ((words >> 28) & 7)).astype(np.int32)
+  # The chain ends at the end of each window, and so does any record that would run past it
+  jump[jump >= ends[window_index]] = size
+  jump = np.append(jump, np.int32(size))
+  frontier = starts[starts < ends]
+  on_chain = np.zeros(size + 1, dtype=bool)
+  on_chain[frontier] = True
+  while True:
+    found = jump[frontier]
+    found = found[found < size]
+    if len(found) == 0:
+      break
+    on_chain[found] = True
+    frontier = np.concatenate((frontier, found))
+    jump = jump[jump]
+  return np.flatnonzero(on_chain[:size])
+
+def fill_tsc(tsc, has_tsc, cpus):
+  # Records logged without a tsc happened at the last tsc seen on the same cpu, if any
+  if has_tsc.all():
+    return tsc
+  order = np.argsort(cpus, kind='mergesort')
+  cpus, has_tsc = cpus[order], has_tsc[order]
+  index = np.maximum.accumulate(np.where(has_tsc, np.arange(len(tsc)), 0))
+  known = has_tsc[index] & (cpus[index] == cpus)
+  filled = np.empty_like(tsc)
+  filled[order] = np.where(known, tsc[order][index], 0)
+  return filled
+
+def decode_batch(words, windows, event_class):
+  base = windows[0][0]
+  starts = np.array([start - base for start, end, cpu in windows], dtype=np.int32)
+  ends = np.array([end - base for start, end, cpu in windows], dtype=np.int32)
+  cpus = np.array([cpu for start, end, cpu in windows], dtype=np.uint16)
+  words = words[base:windows[-1][1]].view(np.ndarray)
+  # Index of the window every word belongs to, counting the cpu change record after it
+  window_index = np.repeat(np.arange(len(windows), dtype=np.int32), np.diff(np.append(starts, len(words))))
+
+  pos = record_starts(words, starts, ends, window_index)
+  header = words[pos]
+  has_tsc = (header >> 31).astype(bool)
+  # Clipped reads past the end of the batch are always masked out
+  tsc = np.take(words, pos + 1, mode='clip').astype(np.uint64) | (np.take(words, pos + 2, mode='clip').astype(np.uint64) << 32)
+  tsc = fill_tsc(np.where(has_tsc, tsc, 0), has_tsc, cpus[window_index[pos]])
+  if event_class is not None:
+    keep = header >> 16 & 0xfff == event_class
+    pos, header, has_tsc, tsc = pos[keep], header[keep], has_tsc[keep], tsc[keep]
+
+  n_extra = (header >> 28) & 7
+  records = np.zeros(len(pos), dtype=RECORD_DTYPE)
+  records['tsc'] = tsc
+  records['cpu'] = cpus[window_index[pos]]
+  records['event'] = header & 0x0fffffff
+  records['n_extra'] = n_extra
+  extra = (pos + 1 + 2 * has_tsc)[:, None] + np.arange(MAX_EXTRA)
+  records['extra'] = np.where(np.arange(MAX_EXTRA) < n_extra[:, None], np.take(words, extra, mode='clip'), 0)
+  return records
+
+def decode_trace(path, event_class=TRC_SCHED_CLASS):
+  # Decodes a xentrace binary trace into a RECORD_DTYPE array in file order, keeping only
+  # records of the given event class (None keeps everything)
+  words = np.memmap(path, dtype='<u4', mode='r')
+  windows = read_windows(words)
+  batches, batch = [], []
+  for window in windows:
+    batch.append(window)
+    if window[1] - batch[0][0] >= BATCH_WORDS:
+      batches.append(batch)
+      batch = []
+  if batch:
+    batches.append(batch)
+
+  decoded = []
+  for batch in batches:
+    decoded.append(decode_batch(words, batch, event_class))
+  if not decoded:
+    return np.zeros(0, dtype=RECORD_DTYPE)
+  return np.concatenate(decoded)
+
+def runstate_changes(records, include_idle=False):
+  # Decodes the runstate change records into a RUNSTATE_DTYPE array. Xen logs the old and new
+  # runstates in the event itself (event | old << 8 | new << 4), with one extra word holding
+  # domain << 16 | vcpu.
+  records = records[(records['event'] & ~RUNSTATE_CHANGE_STATES) == TRC_SCHED_RUNSTATE_CHANGE]
+  runstates = np.zeros(len(records), dtype=RUNSTATE_DTYPE)
+  runstates['tsc'] = records['tsc']
+  runstates['cpu'] = records['cpu']
+  runstates['vcpu'] = records['extra'][:, 0] & 0xffff
+  runstates['domain'] = records['extra'][:, 0] >> 16
+  runstates['old'] = (records['event'] >> 8) & 0xf
+  runstates['new'] = (records['event'] >> 4) & 0xf
+  if not include_idle:
+    runstates = runstates[runstates['domain'] != DOMID_IDLE]
+  return runstates
+
+def split_by(array, fields):
+  # Returns {key -> sub array} for every distinct value of the given fields, each in tsc order
+  order = np.lexsort([array['tsc']] + [array[field] for field in reversed(fields)])
+  array = array[order]
+  keys = np.stack([array[field].astype(np.int64) for field in fields], axis=1)
+  boundaries = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+  groups = np.split(array, boundaries)
+  return dict((tuple(int(group[0][field]) for field in fields) if len(fields) > 1 else int(group[0][fields[0]]), group) for group in groups if len(group))
+
+def split_by_cpu(records):
+  return split_by(records, ['cpu'])
+
+def split_by_vcpu(runstates):
+  return split_by(runstates, ['domain', 'vcpu'])
+
+def runstate_times(runstates, cpu_hz):
+  # Returns {(domain, vcpu) -> seconds spent in each runstate}
+  times = dict()
+  for key, changes in split_by_vcpu(runstates).iteritems():
+    durations = np.diff(changes['tsc'].astype(np.int64)) / cpu_hz
+    times[key] = np.bincount(changes['new'][:-1], weights=durations, minlength=len(RUNSTATES))[:len(RUNSTATES)]
+  return times
+
+def domain_runstates(changes):
+  # Returns the domain runstate holding from each of a domain's runstate changes (in tsc
+  # order) until the next one. A vcpu's state before its first change is that change's old state.
+  rows = np.arange(len(changes))
+  vcpus, first = np.unique(changes['vcpu'], return_index=True)
+  counts = np.zeros((len(changes), len(RUNSTATES)), dtype=np.int32)
+  np.add.at(counts, (rows, changes['old']), -1)
+  np.add.at(counts, (rows, changes['new']), 1)
+  counts = np.cumsum(counts, axis=0) + np.bincount(changes['old'][first], minlength=len(RUNSTATES))[:len(RUNSTATES)]
+  running, runnable, blocked = counts[:, 0] > 0, counts[:, 1] > 0, counts[:, 2] > 0
+  return np.select([running & runnable, running & blocked, running, runnable & blocked, runnable, blocked],
+                   [DOMAIN_RUNSTATES.index(state) for state in ['concurrency_hazard', 'partial_run', 'full_run', 'partial_contention', 'full_contention', 'blocked']],
+                   DOMAIN_RUNSTATES.index('lost'))
+
+def state_fractions(times, states, num_states, starts, ends):
+  # Fraction of each interval [starts, ends) spent in each state, given the times the state
+  # changed at. Time outside the first and last change is not counted.
+  durations = np.diff(times)
+  cumulative = np.zeros((len(times), num_states))
+  for state in range(num_states):
+    cumulative[1:, state] = np.cumsum(np.where(states[:-1] == state, durations, 0))
+  spent = np.stack([np.interp(ends, times, cumulative[:, state]) - np.interp(starts, times, cumulative[:, state]) for state in range(num_states)], axis=1)
+  total = spent.sum(axis=1)[:, None]
+  return np.where(total > 0, spent / np.where(total > 0, total, 1), np.nan)
+
+def host_times(tsc, first_tsc, trace_start, cpu_hz):
+  # Converts tscs to host times, taking the first record of the trace to be logged when it was started
+  return trace_start + (tsc.astype(np.int64) - np.int64(first_tsc)) / cpu_hz
+
+def read_iteration_events(path, benchmark):
+  # Returns (host time each iteration completed at, its runtime in ms) from an events file
+  completed, runtimes = [], []
+  with results_io.open_file(path, 'r') as f:
+    for line in f:
+      match = re.match(r"([.\d]+) .*%s .* in (\d+) msec" % benchmark, line)
+      if match:
+        completed.append(float(match.group(1)))
+        runtimes.append(int(match.group(2)))
+  return np.array(completed), np.array(runtimes, dtype=np.uint32)
+
+def sliding_windows(start, end, window, step):
+  starts = np.arange(start, max(end - window, start) + step / 2, step)
+  return starts, np.minimum(starts + window, end)
+
+def domain_timeline(changes, times, completed, runtimes, window, step):
+  # Returns (sliding windows, measured iterations) of one domain as TIMELINE_DTYPE and
+  # ITERATION_DTYPE arrays, both clipped to the measured iterations given
+  states = domain_runstates(changes)
+  if len(completed) == 0:
+    return np.zeros(0, dtype=TIMELINE_DTYPE), np.zeros(0, dtype=ITERATION_DTYPE)
+
+  measured = np.zeros(len(completed), dtype=ITERATION_DTYPE)
+  measured['start'] = completed - runtimes / 1000.0
+  measured['end'] = completed
+  measured['runtime'] = runtimes
+  measured['fractions'] = state_fractions(times, states, len(DOMAIN_RUNSTATES), measured['start'], measured['end'])
+
+  starts, ends = sliding_windows(measured['start'][0], measured['end'][-1], window, step)
+  timeline = np.zeros(len(starts), dtype=TIMELINE_DTYPE)
+  timeline['start'] = starts
+  timeline['end'] = ends
+  timeline['fractions'] = state_fractions(times, states, len(DOMAIN_RUNSTATES), starts, ends)
+  return timeline, measured
+
+def experiment_domains(exp_path, num_jvms, cpu_hz, trace=None):
+  # Returns [(jvm, runstate changes, their host times)] for every domain of a DaCapo experiment.
+  # Domains are matched to JVMs by the domids run_dacapo.py recorded in trace_times.json, or for
+  # experiments from before it did, in the order they were created after dom0. Without
+  # trace_times.json the times count from the start of the trace.
+  records = decode_trace(trace or os.path.join(exp_path, 'trace_file.bin'))
+  trace_times = load_trace_times(exp_path)
+  trace_start = trace_times.get('start', 0.0)
+  tscs = records['tsc'][records['tsc'] > 0]
+  first_tsc = tscs.min() if len(tscs) else 0
+  domains = split_by(runstate_changes(records), ['domain'])
+  return [(jvm, changes, host_times(changes['tsc'], first_tsc, trace_start, cpu_hz))
+          for jvm, changes in jvm_domains(domains, trace_times, num_jvms)]
+
+def load_trace_times(exp_path):
+  # Returns what run_dacapo.py recorded in trace_times.json, or {} for experiments without one
+  if not results_io.exists(os.path.join(exp_path, TRACE_TIMES_FILE)):
+    return dict()
+  with results_io.open_file(os.path.join(exp_path, TRACE_TIMES_FILE), 'r') as f:
+    return json.load(f)
+
+def jvm_domains(domains, trace_times, num_jvms):
+  # Returns [(jvm, domains[domid])] for the JVMs of an experiment given {domid -> value}, by the
+  # domids recorded in trace_times or, without them, in the order domains were created after dom0
+  domids = trace_times.get('domids')
+  if domids:
+    return [(jvm, domains[domids["%02d" % jvm]]) for jvm in range(1, num_jvms + 1) if domids.get("%02d" % jvm) in domains]
+  return list(enumerate([domains[domain] for domain in sorted(domains) if domain != 0][:num_jvms], 1))
+
+def measured_iterations(exp_path, jvm, benchmark, warmup):
+  # Returns (host completion times, runtimes in ms) of a domain's measured iterations, or
+  # None if its iterations were not timestamped
+  events = os.path.join(exp_path, EVENTS_FILE % jvm)
+  if not results_io.exists(events):
+    return None
+  completed, runtimes = read_iteration_events(events, benchmark)
+  window = loadMeasurementWindows(exp_path).get("%02d" % jvm, {'warmup': warmup, 'iterations': MEASURED_ITERATIONS})
+  end = window['warmup'] + window['iterations']
+  return completed[window['warmup']:end], runtimes[window['warmup']:end]
+
+def experiment_timelines(exp_path, benchmark, num_jvms, warmup, cpu_hz, window, step, trace=None):
+  # Returns {jvm -> (sliding windows, measured iterations)} for every domain of a DaCapo experiment
+  timelines = dict()
+  for jvm, changes, times in experiment_domains(exp_path, num_jvms, cpu_hz, trace):
+    measured = measured_iterations(exp_path, jvm, benchmark, warmup)
+    if measured is not None:
+      timelines[jvm] = domain_timeline(changes, times, measured[0], measured[1], window, step)
+  return timelines
+
+def vcpu_states(changes):
+  # Returns (vcpus, states) where states[k, i] is the runstate vcpus[i] is in from a domain's
+  # k-th runstate change until the next. A vcpu's state before its first change is that change's old state.
+  vcpus, column = np.unique(changes['vcpu'], return_inverse=True)
+  rows = np.arange(len(changes))
+  last = np.full((len(changes), len(vcpus)), -1, dtype=np.int64)
+  last[rows, column] = rows
+  last = np.maximum.accumulate(last, axis=0)
+  first = np.full(len(vcpus), len(changes), dtype=np.int64)
+  np.minimum.at(first, column, rows)
+  return vcpus, np.where(last >= 0, changes['new'][np.maximum(last, 0)], changes['old'][first][None, :])
+
+def costop_stats(changes, times, start=-np.inf, end=np.inf):
+  # Co-scheduling statistics of one domain over [start, end]:
+  #  running, runnable: seconds each vcpu spent running and runnable (waiting for a pcpu)
+  #  skew_mean, skew_max: how far the most delayed vcpu has fallen behind its siblings, in
+  #    seconds it spent runnable while a sibling ran since the domain last had no vcpu running
+  #  hazard_intervals: length of every interval in which some vcpus ran while others were runnable
+  durations = np.diff(np.clip(times, start, end))
+  vcpus, states = vcpu_states(changes)
+  states = states[:-1]
+  running = np.where(states == RUNSTATES.index('running'), durations[:, None], 0)
+  runnable = np.where(states == RUNSTATES.index('runnable'), durations[:, None], 0)
+
+  any_running = (states == RUNSTATES.index('running')).any(axis=1)
+  lag = np.cumsum(np.where(any_running[:, None], runnable, 0), axis=0)
+  reset = np.maximum.accumulate(np.where(any_running, -1, np.arange(len(durations))))
+  lag -= np.where(reset[:, None] >= 0, lag[np.maximum(reset, 0)], 0)
+  skew = lag.max(axis=1) if len(lag) else np.zeros(0)
+
+  hazard = domain_runstates(changes)[:-1] == DOMAIN_RUNSTATES.index('concurrency_hazard')
+  edges = np.diff(np.concatenate(([0], hazard.astype(np.int8), [0])))
+  elapsed = np.concatenate(([0], np.cumsum(durations)))
+  intervals = elapsed[np.flatnonzero(edges == -1)] - elapsed[np.flatnonzero(edges == 1)]
+
+  total = durations.sum()
+  return {'vcpus': vcpus, 'elapsed': total,
+          'running': running.sum(axis=0), 'runnable': runnable.sum(axis=0),
+          'skew_mean': (skew * durations).sum() / total if total > 0 else 0.0,
+          'skew_max': skew.max() if len(skew) else 0.0,
+          'hazard_intervals': intervals[intervals > 0]}
+
+def experiment_costop(exp_path, benchmark, num_jvms, warmup, cpu_hz, trace=None):
+  # Returns {jvm -> costop_stats} for every domain of a DaCapo experiment, over its measured
+  # iterations if they were timestamped and over the whole trace otherwise
+  stats = dict()
+  for jvm, changes, times in experiment_domains(exp_path, num_jvms, cpu_hz, trace):
+    measured = measured_iterations(exp_path, jvm, benchmark, warmup)
+    if measured is not None and len(measured[0]):
+      completed, runtimes = measured
+      stats[jvm] = costop_stats(changes, times, completed[0] - runtimes[0] / 1000.0, completed[-1])
+    else:
+      stats[jvm] = costop_stats(changes, times)
+  return stats
+
+def save_timelines(exp_path, timelines):
+  arrays = dict()
+  for jvm, (timeline, measured) in timelines.iteritems():
+    arrays['windows%02d' % jvm] = timeline
+    arrays['iterations%02d' % jvm] = measured
+  np.savez_compressed(os.path.join(exp_path, TIMELINE_FILE), **arrays)
+
+def load_timelines(exp_path):
+  # Returns {jvm -> (sliding windows, measured iterations)} as saved by save_timelines
+  timelines = dict()
+  with np.load(results_io.open_file(os.path.join(exp_path, TIMELINE_FILE), 'rb')) as arrays:
+    for name in arrays.files:
+      if name.startswith('windows'):
+        jvm = int(name[len('windows'):])
+        timelines[jvm] = (arrays[name], arrays['iterations%02d' % jvm])
+  return timelines
+
+def parse_hz(value):
+  units = {'K': 1e3, 'M': 1e6, 'G': 1e9}
+  if value[-1].upper() in units:
+    return float(value[:-1]) * units[value[-1].upper()]
+  return float(value)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("trace", action="store", help="xentrace binary trace file")
+  parser.add_argument("--cpu-hz", action="store", default="2.67G", help="tsc frequency used to convert cycles to seconds")
+  parser.add_argument("--timeline", action="store_true", default=False, help="save the domain runstate timeline of the dacapo experiment the trace is in")
+  parser.add_argument("--costop", action="store_true", default=False, help="print the vcpu co-scheduling statistics of the dacapo experiment the trace is in")
+  parser.add_argument("--warmup", action="store", default=None, type=int, help="warmup iterations of domains without a measurement window (default: from dacapo_convergences.json)")
+  parser.add_argument("--window", action="store", default=1.0, type=float, help="length in seconds of the timeline's sliding windows")
+  parser.add_argument("--step", action="store", default=0.5, type=float, help="seconds between the starts of consecutive sliding windows")
+  cmdargs = parser.parse_args()
+
+  if cmdargs.timeline or cmdargs.costop:
+    exp_path = os.path.dirname(os.path.abspath(cmdargs.trace))
+    benchmark, num_jvms, mem_size = re.search("([a-zA-Z0-9]*)_(\d+)jvms_(\d+)MB$", exp_path).groups()
+    warmup = cmdargs.warmup
+    if warmup is None:
+      with open('dacapo_convergences.json', 'r') as f:
+        warmup = json.load(f)[benchmark]
+
+  if cmdargs.costop:
+    stats = experiment_costop(exp_path, benchmark, int(num_jvms), warmup, parse_hz(cmdargs.cpu_hz), cmdargs.trace)
+    print "%-6s %10s %10s %10s %10s %10s  %s" % ("jvm", "skew mean", "skew max", "hazards", "p50", "p99", "runnable per vcpu")
+    for jvm, s in sorted(stats.iteritems()):
+      intervals = s['hazard_intervals'] * 1000
+      p50, p99 = np.percentile(intervals, [50, 99]) if len(intervals) else (0, 0)
+      print "%-6s %8.2fms %8.2fms %10d %8.2fms %8.2fms  %s" % ("%02d" % jvm, s['skew_mean'] * 1000, s['skew_max'] * 1000, len(intervals), p50, p99,
+                                                          " ".join("%.3fs" % r for r in s['runnable']))
+  elif cmdargs.timeline:
+    timelines = experiment_timelines(exp_path, benchmark, int(num_jvms), warmup, parse_hz(cmdargs.cpu_hz), cmdargs.window, cmdargs.step, cmdargs.trace)
+    save_timelines(exp_path, timelines)
+    hazard = DOMAIN_RUNSTATES.index('concurrency_hazard')
+    for jvm, (timeline, measured) in sorted(timelines.iteritems()):
+      print "jvm %02d: %d windows, hazard %s" % (jvm, len(timeline), " ".join("%dms/%.2f" % (m['runtime'], m['fractions'][hazard]) for m in measured))
+  else:
+    runstates = runstate_changes(decode_trace(cmdargs.trace))
+    print "%-12s %s" % ("d/v", " ".join("%12s" % state for state in RUNSTATES))
+    for (domain, vcpu), seconds in sorted(runstate_times(runstates, parse_hz(cmdargs.cpu_hz)).iteritems()):
+      print "%-12s %s" % ("d%dv%d" % (domain, vcpu), " ".join("%11.3fs" % s for s in seconds))
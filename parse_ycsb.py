@@ -1,41 +1,58 @@
 #!/usr/bin/env python
 
+import json
 import os
 import matplotlib.pyplot as plt
 import numpy as np
 import re
 import argparse
 from collections import defaultdict, namedtuple
+from parse_engine import parse_all, gc_event_table, read_ycsb_run
+from gc_log import gc_events, gc_summary, pauses, GC_KINDS
+from latency_histogram import merge_all
+import results_io
+from ycsb_timeline import experiment_attribution, save_attribution
 
 YCSB_DIR = 'cassandra_ycsb'
-RESULT_METRICS = ['ovr_runtime', 'ovr_thruput', 'r_latency', 'r_95_latency', 'r_99_latency', 'u_latency', 'u_95_latency', 'u_99_latency', 'rw_latency', 'rw_95_latency', 'rw_99_latency']
+# Saturation search result of run_cassandra_ycsb.py --knee
+KNEE_FILE = "knee.json"
+# Operations are told apart by name, the metric prefix is the one used for each below
+OPERATIONS = [('r', 'READ', 'Read'), ('u', 'UPDATE', 'Update'), ('rw', 'READ-MODIFY-WRITE', 'Read-Modify-Write')]
+LATENCY_PERCENTILES = [('95', 95, '95th'), ('99', 99, '99th'), ('999', 99.9, '99.9th')]
+RESULT_METRICS = ['ovr_runtime', 'ovr_thruput'] + ['%s_%slatency' % (prefix, suffix) for prefix, name, label in OPERATIONS
+                                                   for suffix in [''] + ['%s_' % key for key, percentile, ordinal in LATENCY_PERCENTILES]]
 RESULT_LABELS = {'ovr_runtime': ('Average Overall Runtime', 'Time (ms)'),
                  'ovr_thruput': ('Average Overall Throughput', 'Operations per second'),
-                 'r_95_latency': ('95th Percentile Read Latency', 'Latency (ms)'),
-                 'r_99_latency': ('99th Percentile Read Latency', 'Latency (ms)'),
-                 'r_latency': ('Read Operation Latency', u'Latency (\u03bcs)'),
-                 'u_latency': ('Update Operation Latency', u'Latency (\u03bcs)'),
-                 'u_95_latency': ('95th Percentile Update Latency', 'Latency (ms)'),
-                 'u_99_latency': ('99th Percentile Update Latency', 'Latency (ms)'),
-                 'rw_latency': ('Read-Modify-Write Operation Latency', u'Latency (\u03bcs)'),
-                 'rw_95_latency': ('95th Percentile Read-Modify-Write Latency', 'Latency (ms)'),
-                 'rw_99_latency': ('99th Percentile Read-Modify-Write Latency', 'Latency (ms)'),
                  }
-
+for prefix, name, label in OPERATIONS:
+  RESULT_LABELS['%s_latency' % prefix] = ('%s Operation Latency' % label, u'Latency (\u03bcs)')
+  for key, percentile, ordinal in LATENCY_PERCENTILES:
+    RESULT_LABELS['%s_%s_latency' % (prefix, key)] = ('%s Percentile %s Latency' % (ordinal, label), 'Latency (ms)')
 YCSB_Result = namedtuple('YCSB_Result', RESULT_METRICS)
 
+GC_PAUSE_METRICS = [('pause_p99', "99th Percentile GC Pause", "Pause (ms)", 1000),
+                    ('pause_max', "Longest GC Pause", "Pause (ms)", 1000),
+                    ('overhead', "GC Overhead", "Fraction of Time Paused", 1),
+                    ('allocation_rate', "Allocation Rate", "Allocation Rate (MB/s)", 1),
+                    ('promotion_rate', "Promotion Rate", "Promotion Rate (MB/s)", 1)]
+
 JVM_COUNTS = [1, 2, 4]
+JOBS = 0
 
 def plot(plot_type, experiments, os_type, results_dir, output_dir, output_extension):
   ycsb_results = parse_results(experiments, os_type)
+  plot_results(plot_type, ycsb_results, output_dir, output_extension)
 
+def plot_results(plot_type, ycsb_results, output_dir, output_extension):
+  # Plots one metric of parse_results' results against the JVM counts that ran
+  jvm_counts = [jvm_count for jvm_count in JVM_COUNTS if jvm_count in ycsb_results]
   metric_values = []  
   plt.clf()
-  for jvm_count in JVM_COUNTS:
+  for jvm_count in jvm_counts:
     ycsb_result = ycsb_results[jvm_count]
     metric_values.append(getattr(ycsb_result, plot_type))
   
-  plt.plot(JVM_COUNTS, metric_values, '-d')
+  plt.plot(jvm_counts, metric_values, '-d')
   plt.title(RESULT_LABELS[plot_type][0])
   plt.ylabel(RESULT_LABELS[plot_type][1])
   plt.xlabel("Number of Cassandra instances")
@@ -46,57 +63,51 @@ def plot(plot_type, experiments, os_type, results_dir, output_dir, output_extens
 
 def parse_results(experiments, os_type):
   jvms_to_results = defaultdict(list)
+  tasks = []
   for exp in experiments:
     jvm_count = int(re.search("(\d+)jvms$", exp).groups()[0])
     exp_path = "/".join([results_dir, YCSB_DIR, os_type, exp])
-    per_jvm_averages = defaultdict(list)
-    for jvm in range(1, jvm_count+1):
-      num_iterations = 5
-      iter_results = defaultdict(list)
-      for iteration in range(1, num_iterations+1):
-        # Runtimes are logged in the stderr files on linux and stout files on xen
-        if os_type == "xen":
-          filename = "/".join([exp_path, "ycsbrunstdout%02d%02d" % (jvm, iteration)])
-        else:
-          filename = "/".join([exp_path, "ycsbrunstdout%02d%02d" % (jvm, iteration)])
-        with open(filename, 'r') as f:
-          contents = f.read()
-        # Store results from each iteration this JVM ran
-        iter_results['ovr_runtime'].append(float(re.search("RunTime\(ms\), (\d+\.\d+)", contents).groups()[0]))
-        iter_results['ovr_thruput'].append(float(re.search("Throughput\(ops/sec\), (\d+\.\d+)", contents).groups()[0]))
-        lantency = map(float, re.findall("AverageLatency\(us\), (\d+\.\d+)", contents))
-        lantency_95 = map(float, re.findall("95thPercentileLatency\(ms\), (\d+)", contents))
-        lantency_99 = map(float, re.findall("99thPercentileLatency\(ms\), (\d+)", contents))
-        rw_95_latency = 0
-        rw_99_latency = 0
-        rw_latency = 0
-        if len(lantency_95) > 3:
-          u_latency, rw_latency, r_latency, cleanup_latency  = lantency
-          u_95_latency, rw_95_latency, r_95_latency, cleanup_95_latency = lantency_95
-          u_99_latency, rw_99_latency, r_99_latency, cleanup_99_latency = lantency_99
-        else:
-          u_latency, r_latency, cleanup_latency  = lantency
-          u_95_latency, r_95_latency, cleanup_95_latency = lantency_95
-          u_99_latency, r_99_latency, cleanup_99_latency = lantency_99
-        iter_results['u_latency'].append(u_latency)
-        iter_results['r_latency'].append(r_latency)
-        iter_results['r_95_latency'].append(r_95_latency)
-        iter_results['r_99_latency'].append(r_99_latency)
-        iter_results['u_95_latency'].append(u_95_latency)
-        iter_results['u_99_latency'].append(u_99_latency)
-        iter_results['rw_latency'].append(rw_95_latency)
-        iter_results['rw_95_latency'].append(rw_95_latency)
-        iter_results['rw_99_latency'].append(rw_99_latency)
-      # Record average across iterations for each JVM instance
-      for metric in RESULT_METRICS:
-        per_jvm_averages[metric].append(np.mean(iter_results[metric]))
-    # Record average across JVM instances for this experiment
-    cross_jvm_averages = []
-    for metric in RESULT_METRICS:
-      cross_jvm_averages.append(np.mean(per_jvm_averages[metric]))
-    jvms_to_results[jvm_count] = YCSB_Result(*cross_jvm_averages)
+    tasks.extend((exp, exp_path, jvm) for jvm in range(1, jvm_count+1))
+  per_exp_results = defaultdict(list)
+  for (exp, exp_path, jvm), jvm_result in zip(tasks, parse_all(jvm_results, tasks, JOBS)):
+    per_exp_results[exp].append(jvm_result)
+  for exp, per_jvm_results in per_exp_results.iteritems():
+    jvm_count = int(re.search("(\d+)jvms$", exp).groups()[0])
+    # Average the runtime and throughput across iterations for each JVM instance, then across JVM instances
+    result = dict((metric, np.mean([np.mean(jvm_result[metric]) for jvm_result in per_jvm_results])) for metric in ('ovr_runtime', 'ovr_thruput'))
+    # Latencies come from every operation of every iteration and JVM instance together
+    for prefix, name, label in OPERATIONS:
+      operations = sum(jvm_result['operations'].get(name, (0, 0))[0] for jvm_result in per_jvm_results)
+      latency_sum = sum(jvm_result['operations'].get(name, (0, 0))[1] for jvm_result in per_jvm_results)
+      result['%s_latency' % prefix] = latency_sum / operations if operations else 0
+      histogram = merge_all(jvm_result['histograms'][name] for jvm_result in per_jvm_results if name in jvm_result['histograms'])
+      for key, percentile, ordinal in LATENCY_PERCENTILES:
+        result['%s_%s_latency' % (prefix, key)] = histogram.percentile(percentile) / 1000.0
+    jvms_to_results[jvm_count] = YCSB_Result(**result)
   return jvms_to_results
 
+def jvm_results(task):
+  # Returns the runtimes and throughputs of the iterations one JVM instance ran, with
+  # {operation -> (count, latency sum in us)} and {operation -> LatencyHistogram} over all of them
+  exp, exp_path, jvm = task
+  num_iterations = 5
+  result = {'ovr_runtime': [], 'ovr_thruput': [], 'operations': dict(), 'histograms': dict()}
+  for iteration in range(1, num_iterations+1):
+    filename = "/".join([exp_path, "ycsbrunstdout%02d%02d" % (jvm, iteration)])
+    summary, histograms = read_ycsb_run(filename)
+    # Store results from each iteration this JVM ran
+    result['ovr_runtime'].append(summary['OVERALL']['RunTime(ms)'])
+    result['ovr_thruput'].append(summary['OVERALL']['Throughput(ops/sec)'])
+    for prefix, name, label in OPERATIONS:
+      if name not in summary:
+        continue
+      operations = summary[name].get('Operations', 0)
+      count, latency_sum = result['operations'].get(name, (0, 0))
+      result['operations'][name] = (count + operations, latency_sum + operations * summary[name].get('AverageLatency(us)', 0))
+      if name in histograms:
+        result['histograms'][name] = histograms[name].merge(result['histograms'][name]) if name in result['histograms'] else histograms[name]
+  return result
+
 def plot_gc(experiments, os_type):
   print "Parsing and plotting gc slowdowns ...\n"
   runtime_results = parse_gc(experiments, os_type)
@@ -115,30 +126,149 @@ def plot_gc(experiments, os_type):
 
 
 def parse_gc(experiments, os_type):
-  # Returns dictionary of the form: {num_jvms -> {mem_size -> (minior avg_runtime_s, major avg_runtime_s}}
+  # Returns dictionary of the form: {num_jvms -> (major avg_runtime_s, minor avg_runtime_s)}.
+  # CMS initial-mark and remark pauses count as major, concurrent phases not at all.
   jvms_to_results = defaultdict(lambda : defaultdict(int))
+  tasks = gc_logs(experiments, os_type)
+  per_exp_times = defaultdict(list)
+  for (jvm_count, filename), times in zip(tasks, parse_all(gc_times, tasks, JOBS)):
+    per_exp_times[jvm_count].append(times)
+  for jvm_count, exp_times in per_exp_times.iteritems():
+    # To find standard deviation for each experiment, call "np.std(exp_times)" here
+    major_times, minor_times = zip(*exp_times)
+    jvms_to_results[jvm_count] = (np.mean(major_times), np.mean(minor_times))
+  return jvms_to_results
+
+def gc_times(task):
+  # Returns the (major, minor) GC pause seconds logged by one JVM instance
+  jvm_count, filename = task
+  events = pauses(gc_events(filename))
+  young = events['kind'] == GC_KINDS.index('young')
+  # We'll use the sum
+  return (np.sum(events['pause'][~young]), np.sum(events['pause'][young]))
+
+def gc_logs(experiments, os_type):
+  # Returns [(jvm_count, GC log)] for every Cassandra instance of every experiment
+  logs = []
   for exp in experiments:
     jvm_count = int(re.search("(\d+)jvms$", exp).groups()[0])
     exp_path = os.path.join(results_dir, YCSB_DIR, os_type, exp)
-    num_iterations = 5
-    results = []
-    exp_times = []
     for jvm in xrange(1, jvm_count+1):
       # Runtimes are logged in the stderr files on linux and stout files on xen
       if os_type == "xen":
-        filename = os.path.join(exp_path, "stdout%02d" % jvm)
+        logs.append((jvm_count, os.path.join(exp_path, "stdout%02d" % jvm)))
       else:
-        filename = os.path.join(exp_path, "stderr%02d" % jvm)
-      with open(filename, 'r') as f:
-        contents = f.read()
-
-      major_gc_per_jvm_times = map(float, re.findall(r"CMS.*real=(\d+.\d*) secs", contents))
-      minor_gc_per_jvm_times = map(float, re.findall(r"\[GC.*real=(\d+.\d*) secs", contents))
-      # We'll use the sum
-      exp_times.append((np.sum(major_gc_per_jvm_times), np.sum(minor_gc_per_jvm_times)))
-    # To find standard deviation for each experiment, call "np.std(exp_times)" here
-    major_times, minor_times = zip(*exp_times)
-    jvms_to_results[jvm_count] = (np.mean(major_times), np.mean(minor_times))
+        logs.append((jvm_count, os.path.join(exp_path, "stderr%02d" % jvm)))
+  return logs
+
+def plot_gc_pauses(experiments, os_type, output_dir, output_extension):
+  print "Parsing and plotting gc pauses ...\n"
+  pause_results = parse_gc_pauses(experiments, os_type)
+  jvm_counts = sorted(pause_results)
+
+  print "%6s %8s %14s %14s %14s %10s %12s %12s" % ("JVMs", "Pauses", "p50 (ms)", "p99 (ms)", "Max (ms)",
+                                                  "Overhead", "Alloc (MB/s)", "Promo (MB/s)")
+  for jvm_count in jvm_counts:
+    summary = pause_results[jvm_count]
+    print "%6d %8d %14.2f %14.2f %14.2f %10.3f %12.1f %12.1f" % (jvm_count, summary['pauses'], summary['pause_p50'] * 1000,
+      summary['pause_p99'] * 1000, summary['pause_max'] * 1000, summary['overhead'], summary['allocation_rate'], summary['promotion_rate'])
+
+  for metric, title, ylabel, scale in GC_PAUSE_METRICS:
+    values = [pause_results[jvm_count][metric] * scale for jvm_count in jvm_counts]
+    plt.clf()
+    plt.plot(jvm_counts, values, '-d')
+    plt.title('Cassandra %s' % title)
+    plt.ylabel(ylabel)
+    plt.xlabel("Number of Cassandra instances")
+    plt.xlim(0, max(jvm_counts)+1)
+    plt.ylim(0, max(values)*1.1 or 1)
+    save_or_show_current(output_dir, 'gcpauses_%s' % metric, output_extension)
+
+def parse_gc_pauses(experiments, os_type):
+  # Returns dictionary of the form: {num_jvms -> {metric -> value}} (see gc_log.gc_summary). Pauses are
+  # pooled across instances; overhead and rates are averaged over them, as each JVM keeps its own clock.
+  jvms_to_results = dict()
+  tasks = gc_logs(experiments, os_type)
+  per_exp_events = defaultdict(list)
+  for (jvm_count, filename), events in zip(tasks, parse_all(gc_event_table, [(filename, None) for jvm_count, filename in tasks], JOBS)):
+    per_exp_events[jvm_count].append(events)
+  for jvm_count, exp_events in per_exp_events.iteritems():
+    summary = gc_summary(np.concatenate(exp_events))
+    per_jvm = [gc_summary(events) for events in exp_events]
+    for metric in ('overhead', 'allocation_rate', 'promotion_rate'):
+      summary[metric] = np.mean([jvm_summary[metric] for jvm_summary in per_jvm])
+    jvms_to_results[jvm_count] = summary
+  return jvms_to_results
+
+def plot_gc_spikes(experiments, os_type, output_dir, output_extension):
+  print "Parsing and plotting latency spikes against gc pauses ...\n"
+  spike_results = parse_gc_spikes(experiments, os_type)
+  jvm_counts = sorted(spike_results)
+
+  print "%6s %10s %8s %8s %10s %8s %12s %14s" % ("JVMs", "Intervals", "Spikes", "Target", "Neighbour", "None", "Target rate", "Neighbour rate")
+  for jvm_count in jvm_counts:
+    summary = spike_results[jvm_count]
+    print "%6d %10d %8d %8d %10d %8d %12.3f %14.3f" % (jvm_count, summary['intervals'], summary['spikes'], summary['target'],
+      summary['neighbour'], summary['none'], summary['target_rate'], summary['neighbour_rate'])
+
+  plt.clf()
+  for attribution, label, color in (('target', 'GC on target node', 'b'), ('neighbour', 'GC on a neighbour only', 'g')):
+    fractions = [float(spike_results[jvm_count][attribution]) / (spike_results[jvm_count]['spikes'] or 1) for jvm_count in jvm_counts]
+    plt.plot(jvm_counts, fractions, '-d' + color, label='Spikes during %s' % label)
+    # What the fraction would be if spikes had nothing to do with GC
+    plt.plot(jvm_counts, [spike_results[jvm_count]['%s_rate' % attribution] for jvm_count in jvm_counts], '--' + color,
+             label='Intervals during %s' % label)
+  plt.title('Cassandra Latency Spikes Overlapping GC Pauses')
+  plt.ylabel("Fraction")
+  plt.xlabel("Number of Cassandra instances")
+  plt.xlim(0, max(jvm_counts)+1)
+  plt.ylim(0, 1)
+  plt.legend(loc='best', prop={'size': 10})
+  save_or_show_current(output_dir, 'gcspikes', output_extension)
+
+def parse_gc_spikes(experiments, os_type):
+  # Returns dictionary of the form: {num_jvms -> {attribution or rate -> value}} (see
+  # ycsb_timeline.experiment_attribution), saving each experiment's spikes next to its logs.
+  # Only xen runs point each ycsb instance at its own cassandra node and log status lines.
+  jvms_to_results = dict()
+  for exp in experiments:
+    jvm_count = int(re.search("(\d+)jvms$", exp).groups()[0])
+    exp_path = os.path.join(results_dir, YCSB_DIR, os_type, exp)
+    summary, spike_list = experiment_attribution(exp_path, jvm_count)
+    save_attribution(exp_path, summary, spike_list)
+    jvms_to_results[jvm_count] = summary
+  return jvms_to_results
+
+def plot_knees(experiments, os_type, output_dir, output_extension):
+  print "Parsing and plotting saturation knees ...\n"
+  knees = parse_knees(experiments, os_type)
+  jvm_counts = sorted(knees)
+
+  print "%6s %22s %16s %10s %8s" % ("JVMs", "Max ops/sec per node", "Max ops/sec", "Saturated", "Probes")
+  for jvm_count in jvm_counts:
+    knee = knees[jvm_count]
+    print "%6d %22.0f %16.0f %10s %8d" % (jvm_count, knee['max_throughput_per_node'], knee['max_throughput'], knee['saturated'], len(knee['probes']))
+
+  plt.clf()
+  plt.plot(jvm_counts, [knees[jvm_count]['max_throughput'] for jvm_count in jvm_counts], '-db', label='All nodes')
+  plt.plot(jvm_counts, [knees[jvm_count]['max_throughput_per_node'] for jvm_count in jvm_counts], '-dg', label='Per node')
+  plt.title('Max Throughput within a %g ms p99 Latency SLO' % knees[jvm_counts[0]]['slo_ms'] if jvm_counts else 'Max Throughput')
+  plt.ylabel("Operations per second")
+  plt.xlabel("Number of Cassandra instances")
+  plt.xlim(0, max(jvm_counts or [0])+1)
+  plt.ylim(0, max([knees[jvm_count]['max_throughput'] for jvm_count in jvm_counts] or [1])*1.1)
+  plt.legend(loc='best', prop={'size': 10})
+  save_or_show_current(output_dir, 'knee', output_extension)
+
+def parse_knees(experiments, os_type):
+  # Returns dictionary of the form: {num_jvms -> knee} of the experiments that searched for
+  # their saturation knee, each knee as run_cassandra_ycsb.py saved it
+  jvms_to_results = dict()
+  for exp in experiments:
+    jvm_count = int(re.search("(\d+)jvms$", exp).groups()[0])
+    knee_file = os.path.join(results_dir, YCSB_DIR, os_type, exp, KNEE_FILE)
+    if results_io.exists(knee_file):
+      jvms_to_results[jvm_count] = json.loads(results_io.read(knee_file))
   return jvms_to_results
 
 def save_or_show_current(output_dir, plot_type, output_extension):
@@ -157,9 +287,11 @@ if __name__ == "__main__":
   parser.add_argument("-r", "--resultsdir", action="store", help="name of the directory containing the results")
   parser.add_argument("-o", "--outputdir", action="store", default=False, help="provide a directory to save the experiment results into")
   parser.add_argument("-e", "--extension", action="store", default="eps", help="if -o is provided, this is the file type extension for the graph images")
+  parser.add_argument("-j", "--jobs", action="store", default=0, type=int, help="how many processes to parse logs on (default: one per cpu)")
   cmdargs = parser.parse_args()
 
   results_dir = cmdargs.resultsdir
+  JOBS = cmdargs.jobs
 
   experiments_dir = '/'.join([results_dir, YCSB_DIR, cmdargs.xen])
   all_experiments = os.listdir(experiments_dir)
@@ -170,6 +302,12 @@ if __name__ == "__main__":
       plot(metric, experiments, cmdargs.xen, results_dir, cmdargs.outputdir, cmdargs.extension)
   elif cmdargs.type == 'gc':
     plot_gc(experiments, cmdargs.xen)
+  elif cmdargs.type == 'gcpauses':
+    plot_gc_pauses(experiments, cmdargs.xen, cmdargs.outputdir, cmdargs.extension)
+  elif cmdargs.type == 'gcspikes':
+    plot_gc_spikes(experiments, cmdargs.xen, cmdargs.outputdir, cmdargs.extension)
+  elif cmdargs.type == 'knee':
+    plot_knees(experiments, cmdargs.xen, cmdargs.outputdir, cmdargs.extension)
   else:
     plot(cmdargs.type, experiments, cmdargs.xen, results_dir, cmdargs.outputdir, cmdargs.extension)
 
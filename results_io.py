@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+import argparse
+import collections
+import errno
+import io
+import json
+import os
+import time
+import zipfile
+
+# Experiment directories can be packed into a single compressed zip, experiment.zip, in place of
+# their many small files (consoles, per iteration YCSB output, windows, summaries). The parsers
+# open files through this module, which reads a file from the directory if it is there and from
+# the directory's archive otherwise, so they work the same on packed and unpacked results. The
+# zip's central directory is the member index: a member is found and decompressed on its own.
+ARCHIVE_FILE = "experiment.zip"
+# Member of an archive holding the st_mtime of each file packed into it, as zip timestamps are
+# local time to 2s and the results store compares them against the files' own
+MTIMES_MEMBER = ".mtimes.json"
+# Left as they are: raw traces are memory mapped by parse_xentrace.py, and the store lives
+# at the top of the results directory anyway
+UNPACKED_FILES = ['trace_file.bin']
+# At most this many archives are kept open per process, the least recently used closed first,
+# so reading every experiment of a large sweep does not run out of file descriptors
+OPEN_ARCHIVES = 16
+# Open archives of this process, as file offsets would be shared with forked workers, each as
+# (archive inode and mtime, ZipFile, member mtimes), least recently used first
+_archives = collections.OrderedDict()
+
+def archive_of(path):
+  return os.path.join(os.path.dirname(path), ARCHIVE_FILE)
+
+def _member_mtimes(archive):
+  # Returns the st_mtime of each member packed with one recorded
+  try:
+    return json.loads(archive.read(MTIMES_MEMBER).decode('utf-8'))
+  except KeyError:
+    return dict()
+
+def _close_archive(key):
+  _archives.pop(key)[1].close()
+
+def _open_archive(archive_path):
+  # Returns (version, ZipFile, member mtimes) of an archive, or None if there is none
+  try:
+    stat = os.stat(archive_path)
+  except OSError:
+    return None
+  version = (stat.st_ino, stat.st_mtime)
+  key = (os.getpid(), archive_path)
+  if key in _archives:
+    if _archives[key][0] == version:
+      _archives[key] = _archives.pop(key)
+      return _archives[key]
+    # Replaced since it was opened, e.g. by pack
+    _close_archive(key)
+  while len(_archives) >= OPEN_ARCHIVES:
+    _close_archive(next(iter(_archives)))
+  archive = zipfile.ZipFile(archive_path, 'r')
+  _archives[key] = (version, archive, _member_mtimes(archive))
+  return _archives[key]
+
+def _archive(archive_path):
+  # Returns the open ZipFile of an archive, or None if there is none
+  opened = _open_archive(archive_path)
+  return None if opened is None else opened[1]
+
+def _member(path):
+  # Returns the ZipInfo of path in its directory's archive, or None
+  archive = _archive(archive_of(path))
+  if archive is None or os.path.basename(path) == MTIMES_MEMBER:
+    return None
+  try:
+    return archive.getinfo(os.path.basename(path))
+  except KeyError:
+    return None
+
+def _packed_mtime(info, mtimes):
+  # The st_mtime of a member when it was packed, from its zip timestamp if not recorded
+  if info.filename in mtimes:
+    return mtimes[info.filename]
+  return float(time.mktime(info.date_time + (0, 0, -1)))
+
+def exists(path):
+  return os.path.exists(path) or _member(path) is not None
+
+def archived(path):
+  # Whether path is only in its directory's archive
+  return not os.path.exists(path) and _member(path) is not None
+
+def read(path):
+  # Returns the contents of a file or archive member
+  if not archived(path):
+    with open(path, 'rb') as f:
+      return f.read()
+  return _archive(archive_of(path)).read(os.path.basename(path))
+
+def open_file(path, mode='r'):
+  # Opens a file for reading, from its directory's archive if it is not in the directory.
+  # Archive members are read into memory, so they can be seeked like files (e.g. by np.load).
+  if os.path.exists(path) or _member(path) is None:
+    return open(path, mode)
+  return io.BytesIO(read(path))
+
+def listdir(path):
+  # Names of the files in a directory and in its archive, without the archive itself
+  names = set(os.listdir(path))
+  archive = _archive(os.path.join(path, ARCHIVE_FILE))
+  if archive is not None:
+    names.update(archive.namelist())
+    names.discard(MTIMES_MEMBER)
+  names.discard(ARCHIVE_FILE)
+  return sorted(names)
+
+def stat(path):
+  # Returns (mtime, size) of a file, or of an archive member as it was when packed
+  if os.path.exists(path):
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+  member = _member(path)
+  if member is None:
+    raise OSError(errno.ENOENT, "No such file or archive member", path)
+  return _packed_mtime(member, _open_archive(archive_of(path))[2]), member.file_size
+
+def pack(exp_path):
+  # Moves the files of an experiment directory into its archive, adding to any already packed,
+  # and returns how many. Files are only removed once the new archive has been verified.
+  names = [name for name in sorted(os.listdir(exp_path))
+           if not name.startswith(ARCHIVE_FILE) and name not in UNPACKED_FILES and os.path.isfile(os.path.join(exp_path, name))]
+  if not names:
+    return 0
+  archive_path = os.path.join(exp_path, ARCHIVE_FILE)
+  packing_path = archive_path + ".packing"
+  mtimes = dict()
+  with zipfile.ZipFile(packing_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as packing:
+    if os.path.exists(archive_path):
+      # Members not replaced by a file written since the last pack are carried over
+      with zipfile.ZipFile(archive_path, 'r') as archive:
+        packed_mtimes = _member_mtimes(archive)
+        for info in archive.infolist():
+          if info.filename not in names and info.filename != MTIMES_MEMBER:
+            packing.writestr(info, archive.read(info))
+            mtimes[info.filename] = _packed_mtime(info, packed_mtimes)
+    for name in names:
+      path = os.path.join(exp_path, name)
+      mtimes[name] = os.stat(path).st_mtime
+      packing.write(path, name)
+    packing.writestr(MTIMES_MEMBER, json.dumps(mtimes, sort_keys=True))
+  with zipfile.ZipFile(packing_path, 'r') as packing:
+    if packing.testzip() is not None:
+      raise IOError("%s failed to verify after packing" % packing_path)
+    sizes = dict((info.filename, info.file_size) for info in packing.infolist())
+  os.rename(packing_path, archive_path)
+  for name in names:
+    path = os.path.join(exp_path, name)
+    if sizes.get(name) == os.stat(path).st_size:
+      os.remove(path)
+  return len(names)
+
+def unpack(exp_path):
+  # Restores the files of an experiment directory from its archive and removes it. Files
+  # written since it was packed are kept over their archived copies.
+  archive_path = os.path.join(exp_path, ARCHIVE_FILE)
+  if not os.path.exists(archive_path):
+    return 0
+  with zipfile.ZipFile(archive_path, 'r') as archive:
+    mtimes = _member_mtimes(archive)
+    members = [info for info in archive.infolist()
+               if info.filename != MTIMES_MEMBER and not os.path.exists(os.path.join(exp_path, info.filename))]
+    for info in members:
+      path = os.path.join(exp_path, info.filename)
+      with open(path, 'wb') as f:
+        f.write(archive.read(info))
+      mtime = _packed_mtime(info, mtimes)
+      os.utime(path, (mtime, mtime))
+  os.remove(archive_path)
+  return len(members)
+
+def experiment_dirs(results_dir):
+  # Every <results_dir>/<suite>/<platform>/<experiment> directory
+  for suite in sorted(os.listdir(results_dir)):
+    suite_dir = os.path.join(results_dir, suite)
+    if not os.path.isdir(suite_dir):
+      continue
+    for platform in sorted(os.listdir(suite_dir)):
+      platform_dir = os.path.join(suite_dir, platform)
+      if not os.path.isdir(platform_dir):
+        continue
+      for exp in sorted(os.listdir(platform_dir)):
+        if os.path.isdir(os.path.join(platform_dir, exp)):
+          yield os.path.join(platform_dir, exp)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("-r", "--resultsdir", action="store", help="name of the directory containing the results")
+  parser.add_argument("--unpack", action="store_true", default=False, help="restore the files of every packed experiment instead")
+  parser.add_argument("-v", "--verbose", action="store_true", default=False, help="list the experiments packed or unpacked")
+  cmdargs = parser.parse_args()
+
+  total = 0
+  for exp_path in experiment_dirs(cmdargs.resultsdir):
+    count = unpack(exp_path) if cmdargs.unpack else pack(exp_path)
+    if cmdargs.verbose and count:
+      print "%s %d files in %s" % ("Unpacked" if cmdargs.unpack else "Packed", count, exp_path)
+    total += count
+  print "%s %d files" % ("Unpacked" if cmdargs.unpack else "Packed", total)
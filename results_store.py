@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+from collections import defaultdict
+import numpy as np
+import results_io
+from trace_reducer import load_domain_times, REDUCED_FILE
+from parse_xentrace import jvm_domains, load_trace_times
+from parse_engine import parse_all, dacapo_iterations, read_ycsb_run
+
+# A normalized SQLite table of every DaCapo log and YCSB run under a results directory, so plots
+# can query it instead of re-scanning the logs. Every row remembers the file it came from, and files are
+# only re-read when their mtime or size changes.
+STORE_FILE = "results.sqlite"
+EXPERIMENT_PATTERN = re.compile(r"([a-zA-Z0-9]*)_(\d+)jvms_(\d+)MB$")
+CONSOLE_PATTERN = re.compile(r"(stdout|stderr)(\d+)$")
+YCSB_DIR = 'cassandra_ycsb'
+YCSB_EXPERIMENT_PATTERN = re.compile(r"(\d+)jvms$")
+YCSB_RUN_PATTERN = re.compile(r"ycsbrunstdout(\d\d)(\d\d)$")
+WINDOW_FILE = "measurement_window.json"
+XENALYZE_FILE = "xenalyze_summary"
+MEASURED_ITERATIONS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER);
+CREATE TABLE IF NOT EXISTS iterations (suite TEXT, platform TEXT, benchmark TEXT, num_jvms INTEGER, heap INTEGER, domain INTEGER,
+                                       iteration INTEGER, runtime_ms INTEGER, gc_minor_ms REAL, gc_major_ms REAL, path TEXT);
+CREATE INDEX IF NOT EXISTS iterations_point ON iterations (suite, platform, benchmark, num_jvms, heap);
+CREATE INDEX IF NOT EXISTS iterations_path ON iterations (path);
+CREATE TABLE IF NOT EXISTS windows (suite TEXT, platform TEXT, benchmark TEXT, num_jvms INTEGER, heap INTEGER, domain INTEGER,
+                                    warmup INTEGER, iterations INTEGER, crashed INTEGER, path TEXT);
+CREATE INDEX IF NOT EXISTS windows_path ON windows (path);
+CREATE TABLE IF NOT EXISTS runstates (suite TEXT, platform TEXT, benchmark TEXT, num_jvms INTEGER, heap INTEGER, domain INTEGER,
+                                      runstate TEXT, seconds REAL, path TEXT);
+CREATE INDEX IF NOT EXISTS runstates_path ON runstates (path);
+CREATE TABLE IF NOT EXISTS ycsb_runs (suite TEXT, platform TEXT, num_jvms INTEGER, instance INTEGER, iteration INTEGER, operation TEXT,
+                                      operations INTEGER, average_us REAL, p95_ms REAL, p99_ms REAL, p999_ms REAL, path TEXT);
+CREATE INDEX IF NOT EXISTS ycsb_runs_path ON ycsb_runs (path);
+"""
+DATA_TABLES = ['iterations', 'windows', 'runstates', 'ycsb_runs']
+# Percentiles of each YCSB run's own latency histogram kept in ycsb_runs, with their columns
+YCSB_PERCENTILES = [('p95_ms', 95), ('p99_ms', 99), ('p999_ms', 99.9)]
+
+def open_store(path):
+  db = sqlite3.connect(path)
+  db.executescript(SCHEMA)
+  if 'crashed' not in [column[1] for column in db.execute("PRAGMA table_info(windows)")]:
+    # Stores from before windows kept whether they were cut short: read every window file again
+    for (path,) in db.execute("SELECT DISTINCT path FROM windows").fetchall():
+      forget_file(db, path)
+    db.execute("DROP TABLE windows")
+    db.executescript(SCHEMA)
+  return db
+
+def parse_xenalyze_summary(path):
+  # Returns [{runstate -> seconds}] for every domain in a xenalyze summary, dom0 first
+  contents = results_io.read(path)
+  return [dict((runstate.strip(), float(time)) for runstate, time in re.findall(r"([\w ]+):[\d ]* ([.\d]+)s", domain))
+          for domain in re.findall(r"Domain[\s\S]*?Grant table ops", contents)]
+
+def file_rows(task):
+  # Returns (table, rows) for one file, or None if it holds nothing the store keeps
+  path, point, name, platform = task
+  suite, benchmark, num_jvms, heap = point
+  if suite == YCSB_DIR:
+    run = YCSB_RUN_PATTERN.match(name)
+    if not run:
+      return None
+    summary, histograms = read_ycsb_run(path)
+    return 'ycsb_runs', [(suite, platform, num_jvms, int(run.group(1)), int(run.group(2)), operation, int(measures.get('Operations', 0)),
+                          measures.get('AverageLatency(us)', 0.0)) +
+                         tuple(histograms[operation].percentile(percentile) / 1000.0 if operation in histograms else None
+                               for column, percentile in YCSB_PERCENTILES) + (path,)
+                         for operation, measures in sorted(summary.iteritems()) if operation != 'OVERALL' and 'Operations' in measures]
+  key = (suite, platform, benchmark, num_jvms, heap)
+  console = CONSOLE_PATTERN.match(name)
+  # Runtimes are logged in the stderr files on linux and stdout files on xen
+  if console and console.group(1) == ('stdout' if platform.startswith('xen') else 'stderr'):
+    domain = int(console.group(2))
+    iterations = dacapo_iterations((path, benchmark))
+    return 'iterations', [key + (domain, i, int(runtime), float(minor), float(major), path)
+                          for i, (runtime, minor, major) in enumerate(iterations.tolist())]
+  elif name == WINDOW_FILE:
+    with results_io.open_file(path, 'r') as f:
+      windows = json.load(f)
+    return 'windows', [key + (int(domain), window['warmup'], window['iterations'], int(window.get('crashed', False)), path)
+                       for domain, window in windows.iteritems()]
+  elif name == XENALYZE_FILE:
+    domains = parse_xenalyze_summary(path)[1:num_jvms + 1]
+    return 'runstates', [key + (domain, runstate, seconds, path) for domain, runstates in enumerate(domains, 1) for runstate, seconds in runstates.iteritems()]
+  elif name == REDUCED_FILE:
+    domains = jvm_domains(load_domain_times(path), load_trace_times(os.path.dirname(path)), num_jvms)
+    return 'runstates', [key + (domain, runstate, float(seconds), path) for domain, runstates in domains for runstate, seconds in runstates.iteritems()]
+  return None
+
+def forget_file(db, path):
+  for table in DATA_TABLES:
+    db.execute("DELETE FROM %s WHERE path = ?" % table, (path,))
+  db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+def ingest(db, results_dir, verbose=False, jobs=0):
+  # Brings the store up to date with every DaCapo experiment under results_dir:
+  # <results_dir>/<suite>/<platform>/<benchmark>_<NN>jvms_<MMMM>MB/, and every YCSB one:
+  # <results_dir>/cassandra_ycsb/<platform>/<N>jvms/. Changed files are parsed on
+  # jobs processes (default: one per cpu). Returns how many files were read.
+  results_dir = os.path.abspath(results_dir)
+  known = dict((path, (mtime, size)) for path, mtime, size in db.execute("SELECT path, mtime, size FROM files"))
+  seen, changed = set(), []
+  for suite in sorted(os.listdir(results_dir)):
+    suite_dir = os.path.join(results_dir, suite)
+    if not os.path.isdir(suite_dir):
+      continue
+    for platform in sorted(os.listdir(suite_dir)):
+      platform_dir = os.path.join(suite_dir, platform)
+      if not os.path.isdir(platform_dir):
+        continue
+      for exp in sorted(os.listdir(platform_dir)):
+        exp_path = os.path.join(platform_dir, exp)
+        if suite == YCSB_DIR:
+          match = YCSB_EXPERIMENT_PATTERN.match(exp)
+          point = match and (suite, None, int(match.group(1)), None)
+        else:
+          match = EXPERIMENT_PATTERN.match(exp)
+          point = match and (suite, match.group(1), int(match.group(2)), int(match.group(3)))
+        if not match or not os.path.isdir(exp_path):
+          continue
+        # Files packed into the experiment's archive are listed and read as if they were not
+        for name in results_io.listdir(exp_path):
+          path = os.path.join(exp_path, name)
+          stat = results_io.stat(path)
+          seen.add(path)
+          if known.get(path) != stat:
+            changed.append(((path, point, name, platform), stat))
+
+  read = 0
+  for ((path, point, name, platform), stat), rows in zip(changed, parse_all(file_rows, [task for task, stat in changed], jobs)):
+    forget_file(db, path)
+    if rows is not None:
+      table, rows = rows
+      if rows:
+        db.executemany("INSERT INTO %s VALUES (%s)" % (table, ", ".join(["?"] * len(rows[0]))), rows)
+      if verbose:
+        print "Ingested %s" % path
+      read += 1
+    db.execute("INSERT INTO files VALUES (?, ?, ?)", (path,) + stat)
+  # Files that have since been removed
+  for path in known:
+    if path.startswith(results_dir + os.sep) and path not in seen:
+      forget_file(db, path)
+  db.commit()
+  return read
+
+def measured_iterations(db, suite, platform, benchmark, warmup):
+  # Returns {(num_jvms, heap) -> {domain -> (window size, [(runtime_ms, gc_ms)] of the measured
+  # iterations)}}, taking the window of each domain from measurement_window.json if it has one.
+  # Domains whose window was cut short by a crash, exit or timeout are left out.
+  windows = dict(((num_jvms, heap, domain), (start, size, crashed)) for num_jvms, heap, domain, start, size, crashed in db.execute(
+    "SELECT num_jvms, heap, domain, warmup, iterations, crashed FROM windows WHERE suite = ? AND platform = ? AND benchmark = ?",
+    (suite, platform, benchmark)))
+  points = defaultdict(lambda: defaultdict(list))
+  sizes = dict()
+  for num_jvms, heap, domain, iteration, runtime, minor, major in db.execute(
+      "SELECT num_jvms, heap, domain, iteration, runtime_ms, gc_minor_ms, gc_major_ms FROM iterations "
+      "WHERE suite = ? AND platform = ? AND benchmark = ? ORDER BY num_jvms, heap, domain, iteration", (suite, platform, benchmark)):
+    start, size, crashed = windows.get((num_jvms, heap, domain), (warmup, MEASURED_ITERATIONS, False))
+    if crashed:
+      continue
+    sizes[(num_jvms, heap, domain)] = size
+    if start <= iteration < start + size:
+      points[(num_jvms, heap)][domain].append((runtime, minor + major))
+  return dict((point, dict((domain, (sizes[point + (domain,)], rows)) for domain, rows in domains.iteritems()))
+              for point, domains in points.iteritems())
+
+def runtime_results(db, suite, platform, benchmark, warmup, aggregate=True):
+  # Same shape as parse_dacapo.parse_runtime_results
+  jvms_to_results = defaultdict(lambda : defaultdict(int))
+  for (num_jvms, heap), domains in sorted(measured_iterations(db, suite, platform, benchmark, warmup).iteritems()):
+    exp_times = []
+    for domain, (size, rows) in sorted(domains.iteritems()):
+      if len(rows) < size:
+        print "Unable to find %d valid runtimes for %s_%02djvms_%04dMB" % (size, benchmark, num_jvms, heap)
+        continue
+      runtimes = [runtime for runtime, gc in rows]
+      if aggregate:
+        exp_times.append(np.mean(runtimes) * MEASURED_ITERATIONS)
+      else:
+        exp_times += runtimes
+    if not exp_times:
+      continue
+    if aggregate:
+      jvms_to_results[num_jvms][heap] = (np.mean(exp_times), np.std(exp_times))
+    else:
+      jvms_to_results[num_jvms][heap] = exp_times
+  return jvms_to_results
+
+def gc_results(db, suite, platform, benchmark, warmup):
+  # Same shape as parse_dacapo.parse_gc: mean over domains of the GC seconds in their measured iterations
+  jvms_to_results = defaultdict(lambda : defaultdict(int))
+  for (num_jvms, heap), domains in sorted(measured_iterations(db, suite, platform, benchmark, warmup).iteritems()):
+    exp_times = [sum(gc for runtime, gc in rows) / 1000.0 for size, rows in domains.values() if len(rows) == size]
+    if exp_times:
+      jvms_to_results[num_jvms][heap] = np.mean(exp_times)
+  return jvms_to_results
+
+def jit_results(db, suite, platform, benchmark, num_domains=5):
+  # Same shape as parse_dacapo.parse_jit: the sum of each domain's last iterations
+  last = 4 if benchmark == 'luindex' else 5
+  runtimes = defaultdict(lambda: defaultdict(list))
+  for num_jvms, heap, domain, runtime in db.execute(
+      "SELECT num_jvms, heap, domain, runtime_ms FROM iterations WHERE suite = ? AND platform = ? AND benchmark = ? AND domain <= ? "
+      "ORDER BY num_jvms, heap, domain, iteration", (suite, platform, benchmark, num_domains)):
+    runtimes[(num_jvms, heap)][domain].append(runtime)
+  jvms_to_results = defaultdict(lambda : defaultdict(int))
+  for (num_jvms, heap), domains in sorted(runtimes.iteritems()):
+    exp_times = [np.sum(times[-last:]) for domain, times in sorted(domains.iteritems())]
+    jvms_to_results[num_jvms][heap] = (np.mean(exp_times), np.std(exp_times))
+  return jvms_to_results
+
+def hazard_fractions(db, suite, platform, benchmark):
+  # Returns {(num_jvms, heap) -> [fraction of domain time in concurrency hazard, per domain]}
+  totals = defaultdict(lambda: defaultdict(float))
+  hazards = defaultdict(float)
+  for num_jvms, heap, domain, runstate, seconds in db.execute(
+      "SELECT num_jvms, heap, domain, runstate, seconds FROM runstates WHERE suite = ? AND platform = ? AND benchmark = ?",
+      (suite, platform, benchmark)):
+    totals[(num_jvms, heap)][domain] += seconds
+    if runstate == 'concurrency_hazard':
+      hazards[(num_jvms, heap, domain)] += seconds
+  return dict(((num_jvms, heap), [hazards[(num_jvms, heap, domain)] / total for domain, total in sorted(domains.iteritems()) if total > 0])
+              for (num_jvms, heap), domains in totals.iteritems())
+
+def hazard_results(db, suite, platform, benchmark):
+  # Same shape as parse_dacapo.parse_xenalyze: mean fraction of domain time in concurrency hazard
+  jvms_to_results = defaultdict(lambda : defaultdict(int))
+  for (num_jvms, heap), fractions in sorted(hazard_fractions(db, suite, platform, benchmark).iteritems()):
+    jvms_to_results[num_jvms][heap] = np.mean(fractions)
+  return jvms_to_results
+
+def ycsb_latencies(db, platform, column='p99_ms'):
+  # Returns {(num_jvms, operation) -> [column of every YCSB run, any instance and iteration]}
+  latencies = defaultdict(list)
+  for num_jvms, operation, latency in db.execute(
+      "SELECT num_jvms, operation, %s FROM ycsb_runs WHERE suite = ? AND platform = ? AND %s IS NOT NULL "
+      "ORDER BY num_jvms, operation, instance, iteration" % (column, column), (YCSB_DIR, platform)):
+    latencies[(num_jvms, operation)].append(latency)
+  return dict(latencies)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("-r", "--resultsdir", action="store", help="name of the directory containing the results")
+  parser.add_argument("-s", "--store", action="store", default=None, help="results store to update (default: %s in the results directory)" % STORE_FILE)
+  parser.add_argument("-j", "--jobs", action="store", default=0, type=int, help="how many processes to parse changed files on (default: one per cpu)")
+  parser.add_argument("-v", "--verbose", action="store_true", default=False, help="list the files read")
+  cmdargs = parser.parse_args()
+
+  db = open_store(cmdargs.store or os.path.join(cmdargs.resultsdir, STORE_FILE))
+  print "Read %d changed files" % ingest(db, cmdargs.resultsdir, cmdargs.verbose, cmdargs.jobs)
@@ -21,6 +21,8 @@ storagePort = 7000
 sslStoragePort = 7010
 nativeTrasportPort = 9042
 rpcPort = 9160
+# Directories under the base directory holding the datasets of every node
+DATASET_DIRS = ['data', 'log', 'saved_caches']
 
 def clearIps():
 	global localIps
@@ -31,6 +33,21 @@ def make_dir(mydir):
 		shutil.rmtree(mydir)
 	os.makedirs(mydir)
 
+def save_snapshot(basedir, snapshot_dir):
+	# Copies the datasets of every node of a cluster, drained and stopped beforehand, into snapshot_dir
+	saving = snapshot_dir + '.saving'
+	make_dir(saving)
+	for name in DATASET_DIRS:
+		shutil.copytree(os.path.join(basedir, name), os.path.join(saving, name))
+	os.rename(saving, snapshot_dir)
+
+def restore_snapshot(snapshot_dir, basedir):
+	for name in DATASET_DIRS:
+		target = os.path.join(basedir, name)
+		if os.path.exists(target):
+			shutil.rmtree(target)
+		shutil.copytree(os.path.join(snapshot_dir, name), target)
+
 def do_setup():
 	print '> Setting up Cassandra in directory ' + outdir
 	print '> Working directory: ' + workdir
@@ -232,6 +249,11 @@ def do_start(args):
 
 		print '> DONE set up nodes conf for cluster ' + str(clusterIndex)
 
+	# Start from a dataset saved by save_snapshot instead of empty, if given one
+	if getattr(args, 'snapshot', None):
+		print '> Restoring the datasets of all nodes from ' + args.snapshot
+		restore_snapshot(args.snapshot, local_dir)
+
 	print '> Launching Cassandra clusters and nodes'
 	print '>'
 	print '> Output redirected to ' + rundir
@@ -2,30 +2,67 @@
 
 import argparse
 import datetime
+import hashlib
 import json
 import os
 import shutil
 import subprocess
 import atexit
 import run_cassandra_cluster
+import parse_engine
 import re
 import time
-from threading import Thread
+from threading import Thread, Event
 from subprocess import Popen, PIPE
+from vcpu_sampler import startSampler, stopSampler
+from dacapo_monitor import logConsoleEvents
+from latency_histogram import merge_all
 
 YCSB_ITER = 6
 HEAP_RATIO = 0.9
 YOUNG_RATIO = 0.7
 OSV_IMAGE_DIR = "osv_images"
+# Host timestamped copies of the GC lines of each cassandra node and of the status lines
+# (throughput and latency every interval) of each ycsb run, for ycsb_timeline.py
+GC_EVENTS_FILE = "gcevents%02d"
+YCSB_STATUS_FILE = "ycsbstatus%02d%02d"
+GC_LINE_PATTERN = r"\[(Full GC|GC\b|CMS-concurrent-[a-z-]+: )"
+YCSB_STATUS_PATTERN = r" sec: \d+ operations"
+# With --loadgen, YCSB runs from cql_loadgen.py (python 3) on the host instead of from a ycsb
+# domain per node, so no load generating JVM competes with cassandra for CPUs and memory
+LOADGEN_CMD = ['python3', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cql_loadgen.py')]
+# Exact latency histograms of each cql_loadgen.py run, named after its ycsbrunstdout file
+YCSB_HISTOGRAM_FILE = "ycsbrunhist%s.npz"
+# With --knee, each JVM count's run phase is replaced by a search for its saturation knee: open
+# loop probes of --probe-seconds offer every node the same target throughput, doubling from
+# --knee-start until a probe fails and then bisecting to within --knee-tolerance. A probe fails
+# when the p99 latency of all its operations is over --slo-ms, any operation failed, or the nodes
+# completed less than KNEE_SHORTFALL of what was offered (throughput stopped rising).
+KNEE_FILE = "knee.json"
+KNEE_DIR = "knee"
+KNEE_SHORTFALL = 0.9
+KNEE_MAX_PROBES = 20
+# With --snapshot-dir, the dataset the load phase leaves is saved the first time and later runs
+# start from it instead of loading again: a qcow2 overlay of the base image with node 1's loaded
+# disk on Xen, where every node loads the same records on its own, or the data, commitlog and
+# saved caches directories of every node on linux, where they are spread over the cluster
+SNAPSHOT_IMAGE = "cassandra.qcow2"
+# Seconds for a node's last writes to reach its disk after flushing, before it is copied
+SNAPSHOT_SETTLE = 15
+XEN_JMX_PORT = 7199
+# Domain of each node started by scripts/run.py, named after its pid
+CASSANDRA_XEN_DOMAIN = "osv-cassandra-%d"
+# The load each ycsb domain ran
+LOADGEN_XEN_ARGS = ['-P', 'f', '-p', 'recordcount=5000', '-p', 'operationcount=100000', '--concurrency', '2']
 #ipPrefix = "169.229.48.%d"
 ipPrefix = "172.16.2.%d"
 cassandraIpStart = 3
 macAddr = "00:16:3e:16:02:%d"
 cassandraMacStart = 69
-cassandraXenCmdline = "--ip=eth0,172.16.2.%d,255.255.255.0  --defaultgw=172.16.2.1 --nameserver=10.0.0.1 /java.so -javaagent:/usr/cassandra/lib/jamm-0.2.6.jar -XX:+PrintGCDetails -XX:+PrintGCTimeStamps -XX:+CMSClassUnloadingEnabled -XX:+UseThreadPriorities -XX:ThreadPriorityPolicy=42 -Xms%dM -Xmx%dM -Xmn%dM -XX:+HeapDumpOnOutOfMemoryError -Xss256k -XX:StringTableSize=1000003 -XX:+UseParNewGC -XX:+UseConcMarkSweepGC -XX:+CMSParallelRemarkEnabled -XX:SurvivorRatio=8 -XX:MaxTenuringThreshold=1 -XX:CMSInitiatingOccupancyFraction=75 -XX:+UseCMSInitiatingOccupancyOnly -XX:+UseTLAB -XX:+UseCondCardMark -Djava.net.preferIPv4Stack=true -Dcom.sun.management.jmxremote.port=7199 -Dcom.sun.management.jmxremote.rmi.port=7199 -Dcom.sun.management.jmxremote.ssl=false -Dcom.sun.management.jmxremote.authenticate=false -Dlogback.configurationFile=logback.xml -Dcassandra.logdir=/usr/cassandra/logs -Dcassandra.storagedir=/usr/cassandra/data -Dcassandra-foreground=yes -classpath /usr/cassandra/conf/:/usr/cassandra/lib/* org.apache.cassandra.service.CassandraDaemon"
+cassandraXenCmdline = "--ip=eth0,172.16.2.%d,255.255.255.0  --defaultgw=172.16.2.1 --nameserver=10.0.0.1 /java.so -javaagent:/usr/cassandra/lib/jamm-0.2.6.jar -XX:+PrintGCDetails -XX:+PrintGCTimeStamps -XX:+PrintGCDateStamps -XX:+CMSClassUnloadingEnabled -XX:+UseThreadPriorities -XX:ThreadPriorityPolicy=42 -Xms%dM -Xmx%dM -Xmn%dM -XX:+HeapDumpOnOutOfMemoryError -Xss256k -XX:StringTableSize=1000003 -XX:+UseParNewGC -XX:+UseConcMarkSweepGC -XX:+CMSParallelRemarkEnabled -XX:SurvivorRatio=8 -XX:MaxTenuringThreshold=1 -XX:CMSInitiatingOccupancyFraction=75 -XX:+UseCMSInitiatingOccupancyOnly -XX:+UseTLAB -XX:+UseCondCardMark -Djava.net.preferIPv4Stack=true -Dcom.sun.management.jmxremote.port=7199 -Dcom.sun.management.jmxremote.rmi.port=7199 -Dcom.sun.management.jmxremote.ssl=false -Dcom.sun.management.jmxremote.authenticate=false -Dlogback.configurationFile=logback.xml -Dcassandra.logdir=/usr/cassandra/logs -Dcassandra.storagedir=/usr/cassandra/data -Dcassandra-foreground=yes -classpath /usr/cassandra/conf/:/usr/cassandra/lib/* org.apache.cassandra.service.CassandraDaemon"
 ycsbIpStart = 30
 ycsbMacStart = 80
-ycsbXenCmdline = '--ip=eth0,172.16.2.%s,255.255.255.0  --defaultgw=172.16.2.1 --nameserver=10.0.0.1 /java.so -cp /usr/YCSB/jdbc/src/main/conf:/usr/YCSB/cassandra/target/cassandra-binding-0.1.4.jar:/usr/YCSB/cassandra/target/archive-tmp/cassandra-binding-0.1.4.jar:/usr/YCSB/gemfire/src/main/conf:/usr/YCSB/core/target/core-0.1.4.jar:/usr/YCSB/nosqldb/src/main/conf:/usr/YCSB/hbase/src/main/conf:/usr/YCSB/dynamodb/conf:/usr/YCSB/infinispan/src/main/conf:/usr/YCSB/voldemort/src/main/conf com.yahoo.ycsb.Client -db com.yahoo.ycsb.db.CassandraCQLClient -P /usr/YCSB/workloads/workloadf %s -p "host=%s" -p port=9042 -p threadcount=2 -p operationcount=100000 -p recordcount=5000'
+ycsbXenCmdline = '--ip=eth0,172.16.2.%s,255.255.255.0  --defaultgw=172.16.2.1 --nameserver=10.0.0.1 /java.so -cp /usr/YCSB/jdbc/src/main/conf:/usr/YCSB/cassandra/target/cassandra-binding-0.1.4.jar:/usr/YCSB/cassandra/target/archive-tmp/cassandra-binding-0.1.4.jar:/usr/YCSB/gemfire/src/main/conf:/usr/YCSB/core/target/core-0.1.4.jar:/usr/YCSB/nosqldb/src/main/conf:/usr/YCSB/hbase/src/main/conf:/usr/YCSB/dynamodb/conf:/usr/YCSB/infinispan/src/main/conf:/usr/YCSB/voldemort/src/main/conf com.yahoo.ycsb.Client -s -db com.yahoo.ycsb.db.CassandraCQLClient -p status.interval=1 -P /usr/YCSB/workloads/workloadf %s -p "host=%s" -p measurementtype=histogram -p port=9042 -p threadcount=2 -p operationcount=100000 -p recordcount=5000'
 
 
 def clearCassandraInstances():
@@ -90,6 +127,139 @@ def makeOSvImageCopies(options, numCopies):
         basename = os.path.join(options.cassandra_image, imageName)
         subprocess.call(['cp', basename, image_path])
 
+def loadgenCommand(options, phase, hosts):
+    cmd = LOADGEN_CMD + [phase, '--hosts', ','.join(hosts)]
+    if options.xen:
+        cmd += LOADGEN_XEN_ARGS
+    if options.workload:
+        cmd += ['-P', options.workload]
+    if phase == 'load' and options.init_cql:
+        # Creates the keyspace and table itself, so cqlsh is not needed
+        cmd += ['--schema', options.init_cql]
+    if phase == 'run' and options.target_throughput > 0:
+        cmd += ['--target', str(options.target_throughput), '--arrival', options.arrival]
+    cmd += options.loadgen_args.split()
+    return cmd
+
+def probeTarget(options, hosts, target, probeDir):
+    # Offers target operations per second to each host for probe-seconds and returns the probe's
+    # {'target', 'throughput', 'p99_ms', 'errors', 'ok'}. On Xen each node gets its own load
+    # generator, as in the ycsb runs, on linux one drives the whole cluster.
+    mkdir(probeDir, clean=True)
+    groups = [[host] for host in hosts] if options.xen else [hosts]
+    procsAndFiles = []
+    for t, group in enumerate(groups):
+        groupTarget = target * len(group)
+        cmd = loadgenCommand(options, 'run', group)
+        cmd += ['-p', 'operationcount=%d' % max(int(groupTarget * options.probe_seconds), 1), '--target', str(groupTarget),
+                '--arrival', options.arrival, '--concurrency', str(options.knee_concurrency), '--status-interval', '0',
+                '--histogram-file', os.path.join(probeDir, YCSB_HISTOGRAM_FILE % ('%02d' % (t + 1)))]
+        printVerbose(options, " ".join(cmd))
+        probeOut = open(os.path.join(probeDir, 'ycsbrunstdout%02d' % (t + 1)), 'w')
+        probeErr = open(os.path.join(probeDir, 'ycsbrunstderr%02d' % (t + 1)), 'w')
+        procsAndFiles.append((subprocess.Popen(cmd, stdout=probeOut, stderr=probeErr), probeOut, probeErr, t))
+    waitForProcs(procsAndFiles)
+    throughput, errors, histograms = 0.0, 0, []
+    for t in xrange(len(groups)):
+        summary, runHistograms = parse_engine.read_ycsb_run(os.path.join(probeDir, 'ycsbrunstdout%02d' % (t + 1)))
+        throughput += summary['OVERALL'].get('Throughput(ops/sec)', 0.0) if 'OVERALL' in summary else 0.0
+        errors += sum(int(measures.get('Return=-1', 0)) for measures in summary.values())
+        # Read-modify-writes are left out, their reads and updates are counted on their own
+        histograms += [histogram for section, histogram in runHistograms.items() if section != 'READ-MODIFY-WRITE']
+    p99 = merge_all(histograms).percentile(99) / 1000.0
+    ok = bool(histograms) and p99 <= options.slo_ms and errors == 0 and throughput >= KNEE_SHORTFALL * target * len(hosts)
+    return {'target': target, 'throughput': throughput, 'p99_ms': p99, 'errors': errors, 'ok': ok}
+
+def searchKnee(options, hosts, outputdir):
+    # Returns and saves to knee.json the highest per node target throughput that met the SLO
+    probes = []
+    def probe(target):
+        result = probeTarget(options, hosts, target, os.path.join(outputdir, KNEE_DIR, 'probe%02d' % (len(probes) + 1)))
+        probes.append(result)
+        print '>Probe at %.0f ops/sec per node: %.0f ops/sec, p99 %.2f ms, %d errors, %s' % (target, result['throughput'],
+            result['p99_ms'], result['errors'], 'ok' if result['ok'] else 'failed')
+        return result['ok']
+    low, high, target = 0.0, None, options.knee_start
+    while high is None and len(probes) < KNEE_MAX_PROBES:
+        if probe(target):
+            low = target
+            target *= 2
+        else:
+            high = target
+    # Below a tolerance's worth of the first target there is nothing left to tell apart
+    while (high is not None and high - low > options.knee_tolerance * high and high > options.knee_tolerance * options.knee_start
+           and len(probes) < KNEE_MAX_PROBES):
+        target = (low + high) / 2
+        if probe(target):
+            low = target
+        else:
+            high = target
+    knee = {'numjvms': len(hosts), 'slo_ms': options.slo_ms, 'probe_seconds': options.probe_seconds, 'arrival': options.arrival,
+            'max_throughput_per_node': low, 'max_throughput': low * len(hosts), 'saturated': high is not None, 'probes': probes}
+    with open(os.path.join(outputdir, KNEE_FILE), 'w') as f:
+        json.dump(knee, f, sort_keys=True, indent=4, separators=(',', ': '))
+    return knee
+
+def snapshotPath(options, numjvms):
+    # Snapshot directory of the dataset this run loads, keyed by the workload, record count and
+    # other load arguments, the schema, and the base image (xen) or the node count (linux)
+    parts = ['xen' if options.xen else 'linux', options.workload, options.init_cql or '']
+    for path in (options.workload, options.init_cql):
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                parts.append(f.read())
+    if options.loadgen:
+        parts += (LOADGEN_XEN_ARGS if options.xen else []) + [options.loadgen_args]
+    else:
+        parts.append(ycsbXenCmdline if options.xen else options.ycsb_home)
+    if options.xen:
+        stat = os.stat(options.cassandra_image)
+        parts += [os.path.abspath(options.cassandra_image), str(stat.st_size), str(int(stat.st_mtime))]
+    else:
+        parts += [str(numjvms), options.cassandra_home]
+    return os.path.join(options.snapshot_dir, hashlib.sha1('\0'.join(parts)).hexdigest()[:16])
+
+def nodetool(options, ip, port, command):
+    # Runs a nodetool command against a node, raising if it fails
+    subprocess.check_call([os.path.join(options.cassandra_home, 'bin/nodetool'), '-h', ip, '-p', str(port), command])
+
+def saveXenSnapshot(options, snapshot, domain):
+    # Saves node 1's loaded image as a qcow2 overlay of the base image, holding only what loading changed.
+    # Its memtables are flushed to sstables first, so its disk holds the whole dataset, and its domain is
+    # paused while the image is copied, so nothing writes to it (qemu-img shares it with the paused backend).
+    nodetool(options, ipPrefix % cassandraIpStart, XEN_JMX_PORT, 'flush')
+    time.sleep(SNAPSHOT_SETTLE)
+    saving = snapshot + '.saving'
+    mkdir(saving, clean=True)
+    subprocess.check_call(['sudo', 'xl', 'pause', domain])
+    try:
+        subprocess.check_call(['qemu-img', 'convert', '-U', '-O', 'qcow2', '-B', os.path.abspath(options.cassandra_image),
+                               os.path.join(OSV_IMAGE_DIR, "cassandra.qemu_1"), os.path.join(saving, SNAPSHOT_IMAGE)])
+    finally:
+        subprocess.check_call(['sudo', 'xl', 'unpause', domain])
+    os.rename(saving, snapshot)
+
+def restoreXenSnapshot(options, snapshot, numCopies):
+    # Replaces each node's image with a new overlay of the snapshot, or a flattened copy of it for loop devices
+    snapshotImage = os.path.abspath(os.path.join(snapshot, SNAPSHOT_IMAGE))
+    for i in xrange(numCopies):
+        image_path = os.path.join(OSV_IMAGE_DIR, "cassandra.qemu_%d" % (i + 1))
+        if options.losetup:
+            subprocess.check_call(['qemu-img', 'convert', '-O', 'qcow2', snapshotImage, image_path])
+        else:
+            subprocess.check_call(['qemu-img', 'create', '-f', 'qcow2', '-F', 'qcow2', '-b', snapshotImage, image_path])
+
+def saveLocalSnapshot(options, snapshot, numjvms, cassandra_instances):
+    # Drains and stops every node, so no flush or compaction changes the files while they are copied.
+    # The cluster has to be started again afterwards.
+    for nodeIndex in xrange(numjvms):
+        nodetool(options, '127.0.0.1', run_cassandra_cluster.jmxPort + nodeIndex, 'drain')
+    for c in cassandra_instances.values():
+        c['process'].terminate()
+    for c in cassandra_instances.values():
+        c['process'].wait()
+    run_cassandra_cluster.save_snapshot(os.path.join(options.basedir, 'cassandra_cluster'), snapshot)
+
 def parseCpuModel():
     #Adapted from http://amitsaha.github.io/site/notes/articles/python_linux/article.html
     try:
@@ -170,16 +340,21 @@ def initCql(options, ip='127.0.0.1'):
 def runCassandra(options):
     # Check for ycsb and cassandra home.
     if not options.xen:
-        if not options.ycsb_home or not os.path.exists(options.ycsb_home):
+        if not options.loadgen and (not options.ycsb_home or not os.path.exists(options.ycsb_home)):
             raise Exception("Invalid ycsb home %s" % options.ycsb_home)
         if not options.cassandra_home or not os.path.exists(options.cassandra_home):
             raise Exception("Invalid cassandra home %s" % options.cassandra_home)
-        if not options.workload or not os.path.exists(options.workload):
+        if not options.loadgen and (not options.workload or not os.path.exists(options.workload)):
             raise Exception("Invalid workload file %s" % options.workload)
+    if (options.target_throughput > 0 or options.knee) and not options.loadgen:
+        raise Exception("Open loop runs (--target-throughput, --knee) need --loadgen")
+    if options.snapshot_dir and not options.cassandra_home:
+        raise Exception("Saving snapshots (--snapshot-dir) needs nodetool from --cassandra-home")
 
     if options.xen:
         makeOSvCassandraCopies(options, options.numjvms)
-        makeOSvYcsbCopies(options, options.numjvms)
+        if not options.loadgen:
+            makeOSvYcsbCopies(options, options.numjvms)
         print '>Done makign image copies...'
         options.heap = (int)(options.memsize * HEAP_RATIO)
         options.young = (int)(options.memsize * YOUNG_RATIO)
@@ -211,9 +386,13 @@ def runCassandra(options):
     json.dump(sys_state, sys_state_file, sort_keys=True, indent=4, separators=(',', ': '))
     sys_state_file.close()
 
+    if options.snapshot_dir:
+        mkdir(options.snapshot_dir)
+
     # Run Benchmarks under various numbers of JVMS and Heap Sizes
     numjvms = options.startjvm
     procAndFiles = []
+    knees = []
     while numjvms <= options.numjvms:
         printVerbose(options, "Num JVMs: %d" % numjvms)
         try:
@@ -223,6 +402,11 @@ def runCassandra(options):
                 # Run a xen.
                 nodes = []
                 cassandraXenInstances = {}
+                snapshot = snapshotPath(options, numjvms) if options.snapshot_dir else None
+                restored = snapshot is not None and os.path.exists(snapshot)
+                if restored:
+                    restoreXenSnapshot(options, snapshot, numjvms)
+                    print '>Restored the loaded dataset from %s' % snapshot
                 for t in xrange(numjvms):
                     cassandraCmdline = cassandraXenCmdline % (cassandraIpStart + t, options.heap, options.heap, options.young)
                     cmd = cassandraXenRunCommand(options, t)
@@ -240,92 +424,149 @@ def runCassandra(options):
                     fstderr = open(stderrFile, 'a')
                     p = subprocess.Popen(cmd, stdout=fstdout, stderr=fstderr)
                     cassandraXenInstances[t] = {'process':p, 'out':stdoutFile}
-                unfinished_nodes= cassandraXenInstances.keys()
-                print '>Now waiting for all cassandra instances set up'
-                while unfinished_nodes:
-                    done_nodes = []
-                    for node in unfinished_nodes:
-                         with open(cassandraXenInstances[node]['out'], 'r') as fout:
-                            outdata = fout.read()   
-                         if re.search("Listening for thrift clients...", outdata) != None:
-                            done_nodes.append(node)
-                    for node in done_nodes:
-                        unfinished_nodes.remove(node)
-                    time.sleep(0.1)
-                print '>All canssadra domains are ready! Start ycsb...'
-                for node in nodes:
-                    initCql(options, node)
-                print '>Done init all cqls'
+                gcDone = Event()
+                gcLoggers = []
                 for t in xrange(numjvms):
-                    ycsbCmdline = ycsbXenCmdline % (ycsbIpStart + t, '-load', nodes[t])
-                    cmd = ycsbXenRunCommand(options, t, 512)
-                    cmd += ['--execute=' + ycsbCmdline]
-                    cmd += ['--set-image-only']
-                    print cmd
-                    subprocess.check_call(cmd)
-                print '>Done set ycsb image load command arg'
-                procsAndFiles = []
-                for t in xrange(numjvms):
-                    cmd = ycsbXenRunCommand(options, t, 512)
-                    print cmd
-                    ycsbLoadOut = open(os.path.join(outputdir, 'ycsbloadstdout%02d' % (t + 1)), 'a')
-                    ycsbLoadErr = open(os.path.join(outputdir, 'ycsbloadstderr%02d' % (t + 1)), 'a')
-                    proc = subprocess.Popen(cmd, stdout=ycsbLoadOut, stderr=ycsbLoadErr)
-                    procsAndFiles.append((proc, ycsbLoadOut, ycsbLoadErr, t))
-                waitForProcs(procsAndFiles)
-                print '>Done loading phrases'
-                for t in xrange(numjvms):
-                    ycsbCmdline = ycsbXenCmdline % (ycsbIpStart + t, '-t', nodes[t])
-                    cmd = ycsbXenRunCommand(options, t, 512)
-                    cmd += ['--execute=' + ycsbCmdline]
-                    cmd += ['--set-image-only']
-                    subprocess.check_call(cmd)
-                print '>Done set ycsb image run command arg'
-                threads = []
-                for t in xrange(numjvms):
-                    cmd = ycsbXenRunCommand(options, t, 512)
-                    thread = Thread(target=runRunPhrase, args=(cmd, t, YCSB_ITER, outputdir))
-                    threads.append(thread)
-                for thread in threads:
+                    thread = Thread(target=logConsoleEvents, args=(cassandraXenInstances[t]['out'], os.path.join(outputdir, GC_EVENTS_FILE % (t + 1)), gcDone, GC_LINE_PATTERN))
+                    thread.daemon = True
                     thread.start()
-                for thread in threads:
-                    thread.join()
-                print '>Done ycsb'
+                    gcLoggers.append(thread)
+                sampler = None
+                if options.sampleinterval > 0:
+                    # Sample both the cassandra and the ycsb domains for the whole run
+                    sampler = startSampler(r"^osv-", options.sampleinterval)
+                try:
+                    unfinished_nodes= cassandraXenInstances.keys()
+                    print '>Now waiting for all cassandra instances set up'
+                    while unfinished_nodes:
+                        done_nodes = []
+                        for node in unfinished_nodes:
+                             with open(cassandraXenInstances[node]['out'], 'r') as fout:
+                                outdata = fout.read()   
+                             if re.search("Listening for thrift clients...", outdata) != None:
+                                done_nodes.append(node)
+                        for node in done_nodes:
+                            unfinished_nodes.remove(node)
+                        time.sleep(0.1)
+                    print '>All canssadra domains are ready! Start ycsb...'
+                    if not restored:
+                        if not options.loadgen:
+                            for node in nodes:
+                                initCql(options, node)
+                            print '>Done init all cqls'
+                            for t in xrange(numjvms):
+                                ycsbCmdline = ycsbXenCmdline % (ycsbIpStart + t, '-load', nodes[t])
+                                cmd = ycsbXenRunCommand(options, t, 512)
+                                cmd += ['--execute=' + ycsbCmdline]
+                                cmd += ['--set-image-only']
+                                print cmd
+                                subprocess.check_call(cmd)
+                            print '>Done set ycsb image load command arg'
+                        procsAndFiles = []
+                        for t in xrange(numjvms):
+                            if options.loadgen:
+                                cmd = loadgenCommand(options, 'load', [nodes[t]])
+                            else:
+                                cmd = ycsbXenRunCommand(options, t, 512)
+                            print cmd
+                            ycsbLoadOut = open(os.path.join(outputdir, 'ycsbloadstdout%02d' % (t + 1)), 'a')
+                            ycsbLoadErr = open(os.path.join(outputdir, 'ycsbloadstderr%02d' % (t + 1)), 'a')
+                            proc = subprocess.Popen(cmd, stdout=ycsbLoadOut, stderr=ycsbLoadErr)
+                            procsAndFiles.append((proc, ycsbLoadOut, ycsbLoadErr, t))
+                        waitForProcs(procsAndFiles)
+                        print '>Done loading phrases'
+                        if snapshot is not None:
+                            saveXenSnapshot(options, snapshot, CASSANDRA_XEN_DOMAIN % cassandraXenInstances[0]['process'].pid)
+                            print '>Saved the loaded dataset to %s' % snapshot
+                    if not options.loadgen:
+                        for t in xrange(numjvms):
+                            ycsbCmdline = ycsbXenCmdline % (ycsbIpStart + t, '-t', nodes[t])
+                            cmd = ycsbXenRunCommand(options, t, 512)
+                            cmd += ['--execute=' + ycsbCmdline]
+                            cmd += ['--set-image-only']
+                            subprocess.check_call(cmd)
+                        print '>Done set ycsb image run command arg'
+                    if options.knee:
+                        knees.append(searchKnee(options, nodes, outputdir))
+                    else:
+                        threads = []
+                        for t in xrange(numjvms):
+                            if options.loadgen:
+                                cmd = loadgenCommand(options, 'run', [nodes[t]])
+                            else:
+                                cmd = ycsbXenRunCommand(options, t, 512)
+                            thread = Thread(target=runRunPhrase, args=(cmd, t, YCSB_ITER, outputdir, options.loadgen))
+                            threads.append(thread)
+                        for thread in threads:
+                            thread.start()
+                        for thread in threads:
+                            thread.join()
+                    print '>Done ycsb'
+                    gcDone.set()
+                    for thread in gcLoggers:
+                        thread.join()
+                finally:
+                    # Stopped and saved even if the run fails part way
+                    if sampler is not None:
+                        stopSampler(sampler, outputdir)
                 shutdown_cassandra_instances(cassandraXenInstances)
             else:
                 cassandra_instances = {}
                 options.num_nodes = numjvms
                 options.nosleep = True
                 options.basedir = outputdir
+                snapshot = snapshotPath(options, numjvms) if options.snapshot_dir else None
+                options.snapshot = snapshot if snapshot is not None and os.path.exists(snapshot) else None
                 instances = run_cassandra_cluster.do_start(options)
                 print 'Returned instances'
                 cassandra_instances.update(instances)
                 print cassandra_instances
                 #atexit.register(shutdown_cassandra_instances)
-                if options.init_cql:
+                if options.init_cql and not options.loadgen and not options.snapshot:
                     initCql(options)
                 # Now run ycsb.
-                ycsbCmd = [os.path.join(options.ycsb_home, 'bin/ycsb'), 'load', 'cassandra-cql', '-P', options.workload]
+                # Latency histograms (one bucket per ms) let parse_ycsb.py merge runs exactly
+                if options.loadgen:
+                    ycsbCmd = loadgenCommand(options, 'load', run_cassandra_cluster.localIps[:numjvms])
+                else:
+                    ycsbCmd = [os.path.join(options.ycsb_home, 'bin/ycsb'), 'load', 'cassandra-cql', '-P', options.workload, '-p', 'measurementtype=histogram']
                 # Open stdout and stderr files to pipe output to
                 stdout = open(os.path.join(outputdir, 'ycsbloadstdout'), 'a')
                 stderr = open(os.path.join(outputdir, 'ycsbloadstderr'), 'a')
-                printVerbose(options, " ".join(ycsbCmd))
-                if options.stdout:
-                    proc = subprocess.Popen(ycsbCmd)
+                if options.snapshot:
+                    print 'Restored the loaded dataset from %s' % options.snapshot
                 else:
-                    proc = subprocess.Popen(ycsbCmd, stdout=stdout, stderr=stderr)
-                proc.wait()
-                print 'Done loading ycsb cassandra...'
-                ycsbCmd[1] = 'run'
-                for t in xrange(YCSB_ITER):
-                    stdout = open(os.path.join(outputdir, 'ycsbrunstdout%02d' % (t + 1)), 'a')
-                    stderr = open(os.path.join(outputdir, 'ycsbrunstderr%02d' % (t + 1)), 'a')
                     printVerbose(options, " ".join(ycsbCmd))
                     if options.stdout:
                         proc = subprocess.Popen(ycsbCmd)
                     else:
                         proc = subprocess.Popen(ycsbCmd, stdout=stdout, stderr=stderr)
                     proc.wait()
+                    print 'Done loading ycsb cassandra...'
+                    if snapshot is not None:
+                        saveLocalSnapshot(options, snapshot, numjvms, cassandra_instances)
+                        print 'Saved the loaded dataset to %s' % snapshot
+                        # The run phase starts from the snapshot like later runs do
+                        options.snapshot = snapshot
+                        cassandra_instances = run_cassandra_cluster.do_start(options)
+                if options.loadgen:
+                    ycsbCmd = loadgenCommand(options, 'run', run_cassandra_cluster.localIps[:numjvms])
+                else:
+                    ycsbCmd[ycsbCmd.index('load')] = 'run'
+                if options.knee:
+                    knees.append(searchKnee(options, run_cassandra_cluster.localIps[:numjvms], outputdir))
+                for t in xrange(YCSB_ITER if not options.knee else 0):
+                    stdout = open(os.path.join(outputdir, 'ycsbrunstdout%02d' % (t + 1)), 'a')
+                    stderr = open(os.path.join(outputdir, 'ycsbrunstderr%02d' % (t + 1)), 'a')
+                    runCmd = ycsbCmd
+                    if options.loadgen:
+                        runCmd = ycsbCmd + ['--histogram-file', os.path.join(outputdir, YCSB_HISTOGRAM_FILE % ('%02d' % (t + 1)))]
+                    printVerbose(options, " ".join(runCmd))
+                    if options.stdout:
+                        proc = subprocess.Popen(runCmd)
+                    else:
+                        proc = subprocess.Popen(runCmd, stdout=stdout, stderr=stderr)
+                    proc.wait()
                 shutdown_cassandra_instances(cassandra_instances)
 
         except KeyboardInterrupt as e:
@@ -339,13 +580,26 @@ def runCassandra(options):
         numjvms += 1
         time.sleep(10)
     cleanUp(options, procsAndFiles)
+    if knees:
+        print '%6s %22s %16s %10s' % ('JVMs', 'Max ops/sec per node', 'Max ops/sec', 'Saturated')
+        for knee in knees:
+            print '%6d %22.0f %16.0f %10s' % (knee['numjvms'], knee['max_throughput_per_node'], knee['max_throughput'], knee['saturated'])
 
-def runRunPhrase(cmd, t, iteratiions, outputdir):
+def runRunPhrase(cmd, t, iteratiions, outputdir, histograms=False):
     for i in xrange(iteratiions):
         ycsbRunOut = open(os.path.join(outputdir, 'ycsbrunstdout%02d%02d' % (t + 1, i + 1)), 'a')
         ycsbRunErr = open(os.path.join(outputdir, 'ycsbrunstderr%02d%02d' % (t + 1, i + 1)), 'a')
-        p = subprocess.Popen(cmd, stdout=ycsbRunOut, stderr=ycsbRunErr)
+        runCmd = cmd
+        if histograms:
+            runCmd = cmd + ['--histogram-file', os.path.join(outputdir, YCSB_HISTOGRAM_FILE % ('%02d%02d' % (t + 1, i + 1)))]
+        p = subprocess.Popen(runCmd, stdout=ycsbRunOut, stderr=ycsbRunErr)
+        statusDone = Event()
+        statusLogger = Thread(target=logConsoleEvents, args=(ycsbRunOut.name, os.path.join(outputdir, YCSB_STATUS_FILE % (t + 1, i + 1)), statusDone, YCSB_STATUS_PATTERN))
+        statusLogger.daemon = True
+        statusLogger.start()
         p.wait()
+        statusDone.set()
+        statusLogger.join()
         ycsbRunOut.close()
         ycsbRunErr.close()
 
@@ -382,7 +636,19 @@ if __name__ == "__main__":
     parser.add_argument("--cpupool", action="store", default="Pool-0", help="Which Xen cpupool to use")
     parser.add_argument('-nc', "--num-clusters", action="store", default=1, type=int, help="the number of clusters to run")
     parser.add_argument('--init-cql', action="store", help="the cql file to init cassandra for testing")
+    parser.add_argument("--loadgen", action="store_true", default=False, help="run ycsb from cql_loadgen.py on the host instead of from ycsb domains or ycsb-home")
+    parser.add_argument("--loadgen-args", action="store", default="", help="extra cql_loadgen.py arguments, e.g. \"--connections 4 --concurrency 16\"")
+    parser.add_argument("--target-throughput", action="store", default=0.0, type=float, help="with --loadgen, run open loop, offering this many operations per second per load generator (0 for closed loop)")
+    parser.add_argument("--arrival", action="store", default="constant", choices=['constant', 'poisson'], help="arrival process of the open loop operations (default: %(default)s)")
+    parser.add_argument("--knee", action="store_true", default=False, help="with --loadgen, search for the highest throughput per node that meets --slo-ms at each JVM count instead of running ycsb")
+    parser.add_argument("--slo-ms", action="store", default=10.0, type=float, help="p99 latency, in ms, a --knee probe must stay within (default: %(default)s)")
+    parser.add_argument("--knee-start", action="store", default=500.0, type=float, help="per node throughput of the first --knee probe (default: %(default)s)")
+    parser.add_argument("--knee-tolerance", action="store", default=0.05, type=float, help="bisect until the knee is known to within this fraction (default: %(default)s)")
+    parser.add_argument("--probe-seconds", action="store", default=10.0, type=float, help="length of each --knee probe (default: %(default)s)")
+    parser.add_argument("--knee-concurrency", action="store", default=64, type=int, help="operations each --knee load generator keeps in flight on each connection at most (default: %(default)s)")
+    parser.add_argument("--snapshot-dir", action="store", default=None, help="cache the dataset of the first load phase here and restore it instead of loading on later runs")
     parser.add_argument('--ycsb-cmd', action="store", default="",  help="extra ycsb arguments")
+    parser.add_argument("--sampleinterval", action="store", default=1.0, type=float, help="On Xen, seconds between samples of every domain's vcpu states and cpu time (0 to disable)")
     parser.add_argument('--clean', action="store", help="clean all cassandra domains")
 
     cmdargs = parser.parse_args()
@@ -8,10 +8,28 @@ import shutil
 import subprocess
 import time
 import re
-from threading import Thread
+import math
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+from threading import Thread, Event, BoundedSemaphore
+from vcpu_sampler import startSampler, stopSampler
+from dacapo_monitor import waitForSteadyState, waitForMeasurement, saveMeasurementWindows, experimentSummary, logIterationEvents, readIterationTimes, MEASURED_ITERATIONS, EVENTS_FILE
 
 ALL_BENCHMARKS = ["avrora", "h2", "jython", "luindex", "lusearch", "xalan"]
 OSV_IMAGE_DIR = "osv_images"
+TRACE_TIMES_FILE = "trace_times.json"
+# Extra iterations each domain is started with under --detectwarmup --pauseafterwarmup, for those
+# it completes between its steady state being detected (polled every second) and xl pausing it
+BARRIER_OVERSHOOT = 10
+# Seconds to wait for xl to create each domain before giving up on recording its domid
+DOMID_TIMEOUT = 60
+# Log every safepoint (time to reach it and time in its VM operation) and every stop of the
+# application threads, next to the GC output. Parsed by gc_log.safepoint_events.
+SAFEPOINT_FLAGS = ['-XX:+PrintSafepointStatistics', '-XX:PrintSafepointStatisticsCount=1', '-XX:+PrintGCApplicationStoppedTime']
+
+# Post-processing of finished experiments (xenalyze, trace reduction) runs in the background
+postProcessingPool = None
+postProcessingSlots = None
 
 def printVerbose(options, statement):
     if options.verbose:
@@ -40,18 +58,83 @@ def cleanUp(options, procsAndFiles):
     if options.xen:
         shutil.rmtree(OSV_IMAGE_DIR)
 
-def cleanUpTracer(tracer, trace_bin):
+def saveTraceTimes(outputdir, start, stop, domids):
+    # Host times the trace was started and stopped at, to line its tsc up with the iteration events,
+    # and the domid of each JVM's domain ("01", "02", ...), to find its records in the trace
+    with open(os.path.join(outputdir, TRACE_TIMES_FILE), 'w') as f:
+        json.dump({'start': start, 'stop': stop, 'domids': domids}, f, sort_keys=True, indent=4, separators=(',', ': '))
+
+def domainIds(options, procsAndFiles):
+    # Returns {"01" -> domid} of the domains of the JVMs, looked up by name once xl has created them
+    domids = dict()
+    deadline = time.time() + DOMID_TIMEOUT
+    with open(os.devnull, 'w') as devnull:
+        for proc, stdout, stderr, i in procsAndFiles:
+            while True:
+                xl = subprocess.Popen(["sudo", "xl", "domid", "osv-%s-%d" % (options.test, proc.pid)], stdout=subprocess.PIPE, stderr=devnull)
+                out = xl.communicate()[0]
+                if xl.returncode == 0:
+                    domids["%02d" % (i + 1)] = int(out.strip())
+                    break
+                if proc.poll() is not None or time.time() > deadline:
+                    break
+                time.sleep(0.1)
+    return domids
+
+def startPostProcessing(options):
+    global postProcessingPool, postProcessingSlots
+    postProcessingPool = ThreadPool(options.postworkers)
+    # Once a job is queued behind every worker, the next experiment waits rather than piling up more
+    postProcessingSlots = BoundedSemaphore(2 * options.postworkers)
+
+def postProcess(job):
+    postProcessingSlots.acquire()
+    def run():
+        try:
+            job()
+        finally:
+            postProcessingSlots.release()
+    postProcessingPool.apply_async(run)
+
+def finishPostProcessing():
+    postProcessingPool.close()
+    postProcessingPool.join()
+
+def xenCpuCount():
+    xl_info = subprocess.Popen(['sudo', 'xl', 'info'], stdout=subprocess.PIPE).communicate()[0]
+    nr_cpus = re.findall(r"nr_cpus\s*:\s*(\d+)", xl_info)
+    return int(nr_cpus[0]) if nr_cpus else 0
+
+def startTracer(options, outputdir):
+    if options.trace == "none":
+        return None, None
+    traceCmd = ["sudo", "xentrace", "-D", "-e", "0x0002f000"]
+    if options.trace == "stream":
+        # Reduce the trace as xentrace writes it out instead of saving it
+        tracer = subprocess.Popen(traceCmd, stdout=subprocess.PIPE)
+        reducer = subprocess.Popen(["./trace_reducer.py", outputdir, "--cpus", str(xenCpuCount()), "--sample", str(options.tracesample)], stdin=tracer.stdout)
+        tracer.stdout.close()
+        return tracer, reducer
+    return subprocess.Popen(traceCmd + [os.path.join(outputdir, 'trace_file.bin')]), None
+
+def cleanUpTracer(tracer, trace_bin, keep=False, reducer=None):
 
     def summary():
         outputdir = os.path.dirname(trace_bin)
         stdout = open(os.path.join(outputdir, 'xenalyze_summary'), 'w')
         stderr = open(os.path.join(outputdir, 'xenalyze_summary_err'), 'w')
         subprocess.call(["xenalyze", "--cpu-hz", "2.67G", "--summary", trace_bin], stdout=stdout, stderr=stderr)
-        subprocess.call(["sudo", "rm", trace_bin])
+        if not keep:
+            subprocess.call(["sudo", "rm", trace_bin])
 
+    if tracer is None:
+        return
     subprocess.call(["sudo", "pkill", "-TERM", "-P", str(tracer.pid)])
-    thread = Thread(target=summary)
-    thread.start()
+    if reducer:
+        # The reducer saves its results once it reaches the end of the trace
+        postProcess(reducer.wait)
+    else:
+        postProcess(summary)
 
 def makeOSvImageCopies(options, numCopies):
     mkdir(OSV_IMAGE_DIR)
@@ -120,6 +203,13 @@ def pauseAfterWarmUp(stdout, test, pid, numIterations):
         #Wait 1 Second before checking again
         time.sleep(1)
 
+def pauseAfterSteadyState(stdout, test, pid, alive, benchmark, options, warmups, i):
+    waitForSteadyState(stdout, benchmark, alive, options, warmups, i)
+    subprocess.call(["sudo", "xl", "pause", "osv-%s-%d" % (test, pid)])
+    # The domain ran on while its steady state was detected and it was paused, so its
+    # measurement starts from the iterations it had really completed by then
+    warmups[i]['completed'] = len(readIterationTimes(stdout, benchmark)[0])
+
 def waitForNIterations(stdout, test, pid, numIterations):
     while True:
         with open(stdout, 'r') as fout:
@@ -129,7 +219,246 @@ def waitForNIterations(stdout, test, pid, numIterations):
         #Wait 1 Second before checking again
         time.sleep(1)
 
+def consoleFile(options, outputdir, i):
+    # Runtimes are logged in the stderr files on linux and stdout files on xen
+    if options.xen:
+        return os.path.join(outputdir, 'stdout%02d' % (i + 1))
+    return os.path.join(outputdir, 'stderr%02d' % (i + 1))
+
+def domainAlive(options, proc):
+    # Whether a domain is still running: its xl domain on xen, its process on linux
+    if options.xen:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(["sudo", "xl", "domid", "osv-%s-%d" % (options.test, proc.pid)], stdout=devnull, stderr=devnull) == 0
+    return proc.poll() is None
+
+def endDomain(options, proc):
+    if options.xen:
+        subprocess.call(["sudo", "xl", "destroy", "osv-%s-%d" % (options.test, proc.pid)])
+    else:
+        proc.kill()
+
+def runExperiment(options, outputdir, benchmark, numjvms, heapsize, convergences, numBenchmarkIterations, procsAndFiles):
+    # If using xen, set the new image execute line first before running the image
+    if options.xen:
+        # Make the image copies
+        makeOSvImageCopies(options, options.numjvms)
+        for i in range(numjvms):
+            numIterations = 40
+            if options.adaptive or options.detectwarmup:
+                numIterations = numBenchmarkIterations
+            elif options.gangscheduled:
+                numIterations = numBenchmarkIterations + 10
+            jvmFlags = ['-Xmx%dM' % heapsize, '-XX:+PrintGCTimeStamps', '-XX:+PrintGCDetails', '-XX:+UseParallelOldGC']
+            if options.safepoints:
+                jvmFlags += SAFEPOINT_FLAGS
+            dacapo_cmd = " ".join(['/java.so'] + jvmFlags + ['-jar', "/dacapo.jar", "-n", str(numIterations), benchmark])
+            cmd = dacapoXenRunCommand(options, i, numjvms)
+            cmd += ['-e', dacapo_cmd, '--set-image-only']
+            printVerbose(options, " ".join(cmd))
+            subprocess.check_call(cmd)
+
+    # Start Xen Trace
+    tracer, reducer = startTracer(options, outputdir)
+    traceStart = time.time()
+
+    for i in range(numjvms):
+        cmd = ['java', '-Xmx%dM' % heapsize, '-jar', options.dacapo, '--scratch-directory', 'scratch%d' % i, "-n", str(numBenchmarkIterations), benchmark]
+        if options.safepoints:
+            # DaCapo logs its iterations to stderr, keep the safepoint records in order with them
+            cmd[2:2] = SAFEPOINT_FLAGS + ['-XX:+DisplayVMOutputToStderr']
+
+        if options.xen:
+            cmd = dacapoXenRunCommand(options, i, numjvms)
+
+        # Open stdout and stderr files to pipe output to
+        stdout = open(os.path.join(outputdir, 'stdout%02d' % (i + 1)), 'a')
+        stderr = open(os.path.join(outputdir, 'stderr%02d' % (i + 1)), 'a')
+
+        printVerbose(options, " ".join(cmd))
+        if options.stdout:
+            proc = subprocess.Popen(cmd)
+        else:
+            proc = subprocess.Popen(cmd, stdout=stdout, stderr=stderr)
+        procsAndFiles.append((proc, stdout, stderr, i))
+
+    domids = domainIds(options, procsAndFiles) if options.xen else dict()
+
+    sampler = None
+    if options.xen and options.sampleinterval > 0:
+        sampler = startSampler(r"^osv-%s-" % options.test, options.sampleinterval)
+
+    try:
+        # Timestamp every iteration as it is logged so it can be lined up with the trace
+        consolesDone = Event()
+        eventLoggers = []
+        for proc, stdout, stderr, i in procsAndFiles:
+            thread = Thread(target=logIterationEvents, args=(consoleFile(options, outputdir, i), os.path.join(outputdir, EVENTS_FILE % (i + 1)), consolesDone))
+            thread.daemon = True
+            eventLoggers.append(thread)
+            thread.start()
+
+        if options.xen and (options.pausefirst or options.gangscheduled):
+            threads = []
+            # Wait for all Xen domains start up first before running them
+            for proc, stdout, stderr, i in procsAndFiles:
+                thread = Thread(target=pauseFirst, args=(os.path.join(outputdir, 'stdout%02d' % (i + 1)), options.test, proc.pid))
+                threads.append(thread)
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # Now let them run again
+            if options.gangscheduled:
+                for proc, stdout, stderr, i in procsAndFiles:
+                    subprocess.call(["sudo", "xl", "cpupool-migrate", "osv-%s-%d" % (options.test, proc.pid), 'GangSched-Pool'])
+                domain1 = "osv-%s-%d" % (options.test, procsAndFiles[0][0].pid)
+                xl_list = subprocess.check_output(['sudo', 'xl', 'list'])
+                domain1_id = re.findall(r"%s\s*(\d*)" % domain1, xl_list)[0]
+                subprocess.call(["sudo", "./gsc", '-d', domain1_id, '-p', '1', '-c', '1,2,3', '-t', 'tt,200,100'])
+            else:
+                for proc, stdout, stderr, i in procsAndFiles:
+                    subprocess.call(["sudo", "xl", "unpause", "osv-%s-%d" % (options.test, proc.pid)])
+
+        warmups = dict()
+        if options.xen and options.pauseafterwarmup:
+            threads = []
+            # Wait for all Xen domains to warm up before continuing on
+            for proc, stdout, stderr, i in procsAndFiles:
+                if options.detectwarmup:
+                    alive = lambda proc=proc: domainAlive(options, proc)
+                    thread = Thread(target=pauseAfterSteadyState, args=(os.path.join(outputdir, 'stdout%02d' % (i + 1)), options.test, proc.pid, alive, benchmark, options, warmups, i))
+                else:
+                    thread = Thread(target=pauseAfterWarmUp, args=(os.path.join(outputdir, 'stdout%02d' % (i + 1)), options.test, proc.pid, convergences[benchmark]))
+                threads.append(thread)
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # Now let them run again
+            for proc, stdout, stderr, i in procsAndFiles:
+                subprocess.call(["sudo", "xl", "unpause", "osv-%s-%d" % (options.test, proc.pid)])
+
+        if options.adaptive or options.detectwarmup:
+            windows = dict()
+            threads = []
+            # Keep every domain running until all of them have finished their measurement
+            # window, so that no domain is measured under less contention than the others
+            for proc, stdout, stderr, i in procsAndFiles:
+                if i in warmups:
+                    # Measure from the barrier onwards
+                    args = (warmups[i]['completed'], options, windows, i, warmups[i]['steadystate'])
+                elif options.detectwarmup:
+                    args = (None, options, windows, i)
+                else:
+                    args = (convergences[benchmark], options, windows, i)
+                alive = lambda proc=proc: domainAlive(options, proc)
+                thread = Thread(target=waitForMeasurement, args=(consoleFile(options, outputdir, i), benchmark, alive) + args)
+                threads.append(thread)
+                thread.start()
+            for thread in threads:
+                thread.join()
+            saveMeasurementWindows(outputdir, windows)
+            # Now end them
+            for proc, stdout, stderr, i in procsAndFiles:
+                endDomain(options, proc)
+        elif options.xen and not options.gangscheduled:
+            print "DESTROY"
+            threads = []
+            # Detect when all Xen domains have hit some iteration
+            for proc, stdout, stderr, i in procsAndFiles:
+                thread = Thread(target=waitForNIterations, args=(os.path.join(outputdir, 'stdout%02d' % (i + 1)), options.test, proc.pid, numBenchmarkIterations))
+                threads.append(thread)
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # Now destroy them
+            for proc, stdout, stderr, i in procsAndFiles:
+                subprocess.call(["sudo", "xl", "destroy", "osv-%s-%d" % (options.test, proc.pid)])
+
+        while procsAndFiles:
+            proc, stdout, stderr, i = procsAndFiles.pop()
+            proc.wait()
+            stdout.close()
+            stderr.close()
+        consolesDone.set()
+    finally:
+        # Stopped and saved even if the run fails part way
+        if sampler is not None:
+            stopSampler(sampler, outputdir)
+    for thread in eventLoggers:
+        thread.join()
+    saveTraceTimes(outputdir, traceStart, time.time(), domids)
+    cleanUpTracer(tracer, os.path.join(outputdir, 'trace_file.bin'), options.keeptrace, reducer)
+
+def runSweepPoint(options, platformdir, benchmark, numjvms, heapsize, convergences, numBenchmarkIterations):
+    outputdir = os.path.join(platformdir, "%s_%02djvms_%04dMB" % (benchmark, numjvms, heapsize))
+    if options.safe and os.path.exists(outputdir):
+        return outputdir
+    mkdir(outputdir, clean=True)
+    procsAndFiles = []
+    try:
+        runExperiment(options, outputdir, benchmark, numjvms, heapsize, convergences, numBenchmarkIterations, procsAndFiles)
+    except (KeyboardInterrupt, subprocess.CalledProcessError) as e:
+        print "Detecting KeyboardInterrupt: Cleaning up Experiments"
+        cleanUp(options, procsAndFiles)
+        raise e
+    return outputdir
+
+def coarseGrid(low, high):
+    # The two ends of a sweep axis and their geometric middle
+    return sorted(set([low, int(round(math.sqrt(low * high))), high]))
+
+def refinementCandidates(results, options):
+    # Score the midpoint of every pair of neighbouring sweep points, along both axes, by how much
+    # the mean iteration time changes between them plus how uncertain the two measurements are
+    candidates = []
+    points = [point for point, summary in results.iteritems() if summary is not None]
+    for axis, resolution in ((0, 1), (1, options.heapresolution)):
+        lines = defaultdict(list)
+        for point in points:
+            lines[point[1 - axis]].append(point)
+        for line in lines.values():
+            line.sort(key=lambda point: point[axis])
+            for a, b in zip(line, line[1:]):
+                if b[axis] - a[axis] <= resolution:
+                    continue
+                (meanA, widthA), (meanB, widthB) = results[a], results[b]
+                change = abs(meanB - meanA) / min(meanA, meanB)
+                uncertainty = (min(widthA, 1.0) + min(widthB, 1.0)) / 2
+                midpoint = list(a)
+                midpoint[axis] = (a[axis] + b[axis]) // 2
+                if tuple(midpoint) not in results:
+                    candidates.append((change + uncertainty, tuple(midpoint)))
+    return candidates
+
+def adaptiveSweep(options, platformdir, benchmark, minheap, convergences, numBenchmarkIterations):
+    # Run a coarse grid first, then keep adding the sweep point that best resolves the
+    # slowdown curve until the next point would likely not fit in the time budget
+    results = dict()
+    costs = []
+
+    def measure(numjvms, heapsize):
+        printVerbose(options, "Num JVMs: %d, Heapsize: %dMB" % (numjvms, heapsize))
+        start = time.time()
+        outputdir = runSweepPoint(options, platformdir, benchmark, numjvms, heapsize, convergences, numBenchmarkIterations)
+        costs.append(time.time() - start)
+        results[(numjvms, heapsize)] = experimentSummary(outputdir, benchmark, numjvms, convergences[benchmark], options.xen)
+
+    for numjvms in coarseGrid(options.startjvms, options.numjvms):
+        for heapsize in coarseGrid(minheap, options.maxheap):
+            measure(numjvms, heapsize)
+
+    while True:
+        candidates = refinementCandidates(results, options)
+        if not candidates or sum(costs) + max(costs) > options.budget * 60:
+            break
+        score, point = max(candidates)
+        printVerbose(options, "Refining at %s (score %.3f)" % (point, score))
+        measure(*point)
+
 def runDacapo(options):
+    if (options.adaptive or options.detectwarmup) and options.stdout:
+        raise Exception("Adaptive and warmup detection modes need the console output in the results directory")
+
     if options.xen:
         if options.gangscheduled:
             platform = "xen_gangscheduled"
@@ -171,128 +500,38 @@ def runDacapo(options):
     #Loading Dacapo Convergences
     convergences = getDacapoConvergences(options)
 
+    startPostProcessing(options)
+
     # Run Benchmarks under various numbers of JVMS and Heap Sizes
-    procsAndFiles = None
     for benchmark in benchmarks:
         printVerbose(options, "Benchmark: %s" % benchmark)
-        numBenchmarkIterations = convergences[benchmark] + 5
+        numWarmupIterations = convergences[benchmark]
+        if options.detectwarmup:
+            numWarmupIterations = options.maxwarmup + options.steadyiterations
+            if options.xen and options.pauseafterwarmup:
+                numWarmupIterations += BARRIER_OVERSHOOT
+        numBenchmarkIterations = numWarmupIterations + MEASURED_ITERATIONS
+        if options.adaptive:
+            numBenchmarkIterations = numWarmupIterations + options.maxiterations
+        if options.adaptivesweep:
+            adaptiveSweep(options, platformdir, benchmark, max(options.startheap, minheaps[benchmark]), convergences, numBenchmarkIterations)
+            continue
         numjvms = options.startjvms
         while numjvms <= options.numjvms:
             printVerbose(options, "Num JVMs: %d" % numjvms)
             heapsize = max(options.startheap, minheaps[benchmark])
             maxheap = options.maxheap
             while heapsize <= maxheap:
-                try:
-                    printVerbose(options, "Heapsize: %dMB" % heapsize)
-                    procsAndFiles = []
-
-                    outputdir = os.path.join(platformdir, "%s_%02djvms_%04dMB" % (benchmark, numjvms, heapsize))
-                    if options.safe and os.path.exists(outputdir):
-                        heapsize *= 2
-                        continue
-                    else:
-                        mkdir(outputdir, clean=True)
-
-                    # If using xen, set the new image execute line first before running the image
-                    if options.xen:
-                        # Make the image copies
-                        makeOSvImageCopies(options, options.numjvms)
-                        for i in range(numjvms):
-                            numIterations = 40
-                            if options.gangscheduled:
-                                numIterations = numBenchmarkIterations + 10
-                            dacapo_cmd = " ".join(['/java.so', '-Xmx%dM' % heapsize, '-XX:+PrintGCTimeStamps', '-XX:+PrintGCDetails', '-XX:+UseParallelOldGC',
-                                                     '-jar', "/dacapo.jar", "-n", str(numIterations), benchmark])
-                            cmd = dacapoXenRunCommand(options, i, numjvms)
-                            cmd += ['-e', dacapo_cmd, '--set-image-only']
-                            printVerbose(options, " ".join(cmd))
-                            subprocess.check_call(cmd)
-
-                    # Start Xen Trace
-                    tracer = subprocess.Popen(["sudo", "xentrace", "-D", "-e", "0x0002f000", os.path.join(outputdir, 'trace_file.bin')])
-
-                    for i in range(numjvms):
-                        cmd = ['java', '-Xmx%dM' % heapsize, '-jar', options.dacapo, '--scratch-directory', 'scratch%d' % i, "-n", str(numBenchmarkIterations), benchmark]
-
-                        if options.xen:
-                            cmd = dacapoXenRunCommand(options, i, numjvms)
-
-                        # Open stdout and stderr files to pipe output to
-                        stdout = open(os.path.join(outputdir, 'stdout%02d' % (i + 1)), 'a')
-                        stderr = open(os.path.join(outputdir, 'stderr%02d' % (i + 1)), 'a')
-
-                        printVerbose(options, " ".join(cmd))
-                        if options.stdout:
-                            proc = subprocess.Popen(cmd)
-                        else:
-                            proc = subprocess.Popen(cmd, stdout=stdout, stderr=stderr)
-                        procsAndFiles.append((proc, stdout, stderr, i))
-
-                    if options.xen and (options.pausefirst or options.gangscheduled):
-                        threads = []
-                        # Wait for all Xen domains start up first before running them
-                        for proc, stdout, stderr, i in procsAndFiles:
-                            thread = Thread(target=pauseFirst, args=(os.path.join(outputdir, 'stdout%02d' % (i + 1)), options.test, proc.pid))
-                            threads.append(thread)
-                            thread.start()
-                        for thread in threads:
-                            thread.join()
-                        # Now let them run again
-                        if options.gangscheduled:
-                            for proc, stdout, stderr, i in procsAndFiles:
-                                subprocess.call(["sudo", "xl", "cpupool-migrate", "osv-%s-%d" % (options.test, proc.pid), 'GangSched-Pool'])
-                            domain1 = "osv-%s-%d" % (options.test, procsAndFiles[0][0].pid)
-                            xl_list = subprocess.check_output(['sudo', 'xl', 'list'])
-                            domain1_id = re.findall(r"%s\s*(\d*)" % domain1, xl_list)[0]
-                            subprocess.call(["sudo", "./gsc", '-d', domain1_id, '-p', '1', '-c', '1,2,3', '-t', 'tt,200,100'])
-                        else:
-                            for proc, stdout, stderr, i in procsAndFiles:
-                                subprocess.call(["sudo", "xl", "unpause", "osv-%s-%d" % (options.test, proc.pid)])
-
-                    if options.xen and options.pauseafterwarmup:
-                        threads = []
-                        # Wait for all Xen domains to warm up before continuing on
-                        for proc, stdout, stderr, i in procsAndFiles:
-                            thread = Thread(target=pauseAfterWarmUp, args=(os.path.join(outputdir, 'stdout%02d' % (i + 1)), options.test, proc.pid, convergences[benchmark]))
-                            threads.append(thread)
-                            thread.start()
-                        for thread in threads:
-                            thread.join()
-                        # Now let them run again
-                        for proc, stdout, stderr, i in procsAndFiles:
-                            subprocess.call(["sudo", "xl", "unpause", "osv-%s-%d" % (options.test, proc.pid)])
-
-                    if options.xen and not options.gangscheduled:
-                        print "DESTROY"
-                        threads = []
-                        # Detect when all Xen domains have hit some iteration
-                        for proc, stdout, stderr, i in procsAndFiles:
-                            thread = Thread(target=waitForNIterations, args=(os.path.join(outputdir, 'stdout%02d' % (i + 1)), options.test, proc.pid, numBenchmarkIterations))
-                            threads.append(thread)
-                            thread.start()
-                        for thread in threads:
-                            thread.join()
-                        # Now destroy them
-                        for proc, stdout, stderr, i in procsAndFiles:
-                            subprocess.call(["sudo", "xl", "destroy", "osv-%s-%d" % (options.test, proc.pid)])
-
-                    while procsAndFiles:
-                        proc, stdout, stderr, i = procsAndFiles.pop()
-                        proc.wait()
-                        stdout.close()
-                        stderr.close()
-                    cleanUpTracer(tracer, os.path.join(outputdir, 'trace_file.bin'))
-                    heapsize *= 2
-                except (KeyboardInterrupt, subprocess.CalledProcessError) as e:
-                    print "Detecting KeyboardInterrupt: Cleaning up Experiments"
-                    cleanUp(options, procsAndFiles)
-                    raise e
+                printVerbose(options, "Heapsize: %dMB" % heapsize)
+                runSweepPoint(options, platformdir, benchmark, numjvms, heapsize, convergences, numBenchmarkIterations)
+                heapsize *= 2
             if numjvms == options.numjvms:
                 numjvms *= 2
             else:
                 numjvms = min(numjvms * 2, options.numjvms)
 
-    cleanUp(options, procsAndFiles)
+    finishPostProcessing()
+    cleanUp(options, [])
 
 
 if __name__ == "__main__":
@@ -319,6 +558,23 @@ if __name__ == "__main__":
     parser.add_argument("--cpupool", action="store", default="Pool-0", help="Which Xen cpupool to use")
     parser.add_argument("--pausefirst", action="store_true", default=False, help="Whether or not to pause all the domains first and unpause them all at the same time")
     parser.add_argument("--pauseafterwarmup", action="store_true", default=False, help="Whether or not to set a barrier after warming up domains")
+    parser.add_argument("--detectwarmup", action="store_true", default=False, help="Detect the end of warmup of each domain from its iteration times instead of using dacapo_convergences.json")
+    parser.add_argument("--steadyiterations", action="store", default=5, type=int, help="With --detectwarmup, how many steady iterations must follow the detected warmup")
+    parser.add_argument("--maxwarmup", action="store", default=20, type=int, help="With --detectwarmup, maximum number of warmup iterations")
+    parser.add_argument("--keeptrace", action="store_true", default=False, help="Keep the raw xentrace output (trace_file.bin) for parse_xentrace.py")
+    parser.add_argument("--trace", action="store", default="xentrace", choices=["xentrace", "stream", "none"], help="xentrace: save the trace and summarize it with xenalyze afterwards, stream: reduce the trace to per domain runstate times as it is written, none: don't trace")
+    parser.add_argument("--tracesample", action="store", default=0, type=int, help="With --trace stream, also keep every Nth runstate change (default: none)")
+    parser.add_argument("--sampleinterval", action="store", default=1.0, type=float, help="On Xen, seconds between samples of every domain's vcpu states and cpu time (0 to disable)")
+    parser.add_argument("--safepoints", action="store_true", default=False, help="Run the JVMs with safepoint statistics and application stopped time logging, for parse_dacapo.py -t safepoints")
+    parser.add_argument("--postworkers", action="store", default=2, type=int, help="How many experiments to post-process (xenalyze, trace reduction) at once")
+    parser.add_argument("--adaptivesweep", action="store_true", default=False, help="Instead of doubling JVM counts and heap sizes, refine a coarse grid where the results change fastest or are least certain")
+    parser.add_argument("--budget", action="store", default=240, type=int, help="With --adaptivesweep, machine time in minutes to spend per benchmark (the coarse grid is always run)")
+    parser.add_argument("--heapresolution", action="store", default=16, type=int, help="With --adaptivesweep, smallest heap size step in MB")
+    parser.add_argument("--adaptive", action="store_true", default=False, help="Run measured iterations until the confidence interval of the mean is narrow enough")
+    parser.add_argument("--ciwidth", action="store", default=0.02, type=float, help="In adaptive mode, target half width of the 95%% confidence interval relative to the mean")
+    parser.add_argument("--miniterations", action="store", default=5, type=int, help="In adaptive mode, minimum number of measured iterations")
+    parser.add_argument("--maxiterations", action="store", default=40, type=int, help="In adaptive mode, maximum number of measured iterations")
+    parser.add_argument("--windowtimeout", action="store", default=60, type=int, help="In adaptive and warmup detection modes, minutes to wait for a domain's measurement window before recording it as crashed (0 to wait forever)")
     
     cmdargs = parser.parse_args()
     if cmdargs.test == "dacapo":
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Runs cql_loadgen.py against its stand-in node on an ephemeral port: python3 -m pytest test_cql_loadgen.py
+import argparse
+import asyncio
+import os
+import re
+from collections import defaultdict
+from cql_loadgen import StandInNode, CqlConnection, loadProperties, runPhase
+from latency_histogram import load_histograms
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init_ycsb_testtable.cql')
+RECORDS = 200
+OPERATIONS = 400
+SUMMARY_PATTERN = r"^\[([A-Z-]+)\], ([^,]+), (.+)$"
+
+
+def options(phase, port, **overrides):
+    values = dict(phase=phase, hosts='127.0.0.1', port=port, workload='f', properties=[], connections=1, concurrency=2,
+                  protocol_version=None, schema=None, target=0.0, arrival='constant', histogram_file=None,
+                  status_interval=0, seed=1)
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+def parseSummary(output):
+    # Returns {section -> {key -> value}} of a YCSB summary, with the histogram buckets under 'buckets'
+    summary = defaultdict(dict)
+    for line in output.splitlines():
+        match = re.match(SUMMARY_PATTERN, line)
+        if not match:
+            continue
+        section, key, value = match.groups()
+        if re.match(r"^>?\d+$", key):
+            summary[section].setdefault('buckets', {})[key] = int(value)
+        else:
+            summary[section][key] = float(value)
+    return summary
+
+async def withNode(node, phases):
+    # Runs each phase(port, **overrides) against the node, returning what they return
+    server = await asyncio.start_server(node.handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    results = []
+    try:
+        for phase, overrides in phases:
+            results.append(await phase(port, **overrides))
+    finally:
+        server.close()
+        await server.wait_closed()
+    return results
+
+def phase(name, capsys):
+    async def run(port, **overrides):
+        properties = loadProperties('f', ['recordcount=%d' % RECORDS, 'operationcount=%d' % OPERATIONS])
+        await runPhase(options(name, port, schema=SCHEMA if name == 'load' else None, **overrides), properties)
+        return parseSummary(capsys.readouterr().out)
+    return run
+
+def checkBuckets(summary, section):
+    # The per ms buckets add up to the successful operations, as parse_ycsb.py relies on
+    assert sum(summary[section]['buckets'].values()) == summary[section]['Return=0']
+    assert summary[section]['Return=0'] == summary[section]['Operations']
+
+
+def test_load_and_run_workload_f(capsys):
+    node = StandInNode()
+    load, run = asyncio.run(withNode(node, [(phase('load', capsys), {}), (phase('run', capsys), {})]))
+    assert load['INSERT']['Operations'] == RECORDS
+    checkBuckets(load, 'INSERT')
+    assert len(node.tables['usertable']) == RECORDS
+    assert all(len(row) == 10 for row in node.tables['usertable'].values())
+
+    # Workload f: half reads, half read-modify-writes, whose read and update parts are measured too
+    assert set(run) == set(['OVERALL', 'READ', 'UPDATE', 'READ-MODIFY-WRITE'])
+    rmw = run['READ-MODIFY-WRITE']['Operations']
+    assert 0 < rmw < OPERATIONS
+    assert run['READ']['Operations'] == OPERATIONS
+    assert run['UPDATE']['Operations'] == rmw
+    for section in ['READ', 'UPDATE', 'READ-MODIFY-WRITE']:
+        checkBuckets(run, section)
+    # RunTime is printed to 0.1ms
+    assert abs(run['OVERALL']['Throughput(ops/sec)'] * run['OVERALL']['RunTime(ms)'] / 1000 - OPERATIONS) < 1
+    assert 'Target(ops/sec)' not in run['OVERALL']
+    # Updates only touch keys that were loaded
+    assert len(node.tables['usertable']) == RECORDS
+
+def test_protocol_v3_fallback(capsys):
+    async def connect(port):
+        connection = await CqlConnection('127.0.0.1', port).connect()
+        version = connection.version
+        await connection.close()
+        return version
+
+    node = StandInNode(versions=[3])
+    version, load = asyncio.run(withNode(node, [(connect, {}), (phase('load', capsys), {})]))
+    assert version == 3
+    assert load['INSERT']['Operations'] == RECORDS
+    checkBuckets(load, 'INSERT')
+
+def test_open_loop_target(capsys, tmp_path):
+    target = 1000.0
+    histograms = str(tmp_path / 'hist.npz')
+    node = StandInNode()
+    load, run = asyncio.run(withNode(node, [(phase('load', capsys), {}),
+                                            (phase('run', capsys), {'target': target, 'histogram_file': histograms})]))
+    assert run['OVERALL']['Target(ops/sec)'] == target
+    # Operations arrive at the target rate however fast the node is
+    assert run['OVERALL']['RunTime(ms)'] >= 0.95 * OPERATIONS / target * 1000
+    assert run['OVERALL']['Throughput(ops/sec)'] <= 1.05 * target
+    assert run['READ']['Operations'] == OPERATIONS
+    for section in ['READ', 'UPDATE', 'READ-MODIFY-WRITE']:
+        checkBuckets(run, section)
+    saved = load_histograms(histograms)
+    assert set(saved) == set(['READ', 'UPDATE', 'READ-MODIFY-WRITE'])
+    for section, histogram in saved.items():
+        assert histogram.count() == run[section]['Operations']
+
+def test_open_loop_latency_includes_queueing(capsys):
+    # Offered more than a one-worker node serving 2ms requests can do, operations queue and
+    # their latency, measured from the intended start, grows past the service time
+    node = StandInNode(serviceTime=0.002, workers=1)
+    load, run = asyncio.run(withNode(node, [(phase('load', capsys), {}), (phase('run', capsys), {'target': 1000.0})]))
+    assert run['READ']['AverageLatency(us)'] > 10 * 2000
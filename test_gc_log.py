@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+# Parses a DaCapo console excerpt logged with -XX:+PrintSafepointStatistics: python -m unittest test_gc_log
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from gc_log import safepoint_events
+
+# As a JDK 8 h2 run logs it with -XX:+PrintSafepointStatistics -XX:PrintSafepointStatisticsCount=1
+# -XX:+PrintGCApplicationStoppedTime, including the guaranteed safepoints with no VM operation
+CONSOLE = """\
+===== DaCapo 9.12 h2 starting warmup 1 =====
+         vmop                    [threads: total initially_running wait_to_block]    [time: spin block sync cleanup vmop] page_trap_count
+0.353: ParallelGCFailedAllocation       [      11          0              0    ]      [     0     0     0     0    14    ]  0   
+Total time for which application threads were stopped: 0.0148420 seconds, Stopping threads took: 0.0000210 seconds
+         vmop                    [threads: total initially_running wait_to_block]    [time: spin block sync cleanup vmop] page_trap_count
+1.362: no vm operation                  [      12          1              1    ]      [     0     0     3     0     0    ]  0   
+Total time for which application threads were stopped: 0.0034870 seconds, Stopping threads took: 0.0031520 seconds
+===== DaCapo 9.12 h2 completed warmup 1 in 1822 msec =====
+===== DaCapo 9.12 h2 starting =====
+         vmop                    [threads: total initially_running wait_to_block]    [time: spin block sync cleanup vmop] page_trap_count
+2.451: RevokeBias                       [      12          0              1    ]      [     0     0     1     0     0    ]  0   
+Total time for which application threads were stopped: 0.0011240 seconds, Stopping threads took: 0.0009830 seconds
+===== DaCapo 9.12 h2 PASSED in 1301 msec =====
+"""
+
+
+class SafepointEventsTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'stdout01')
+    with open(self.path, 'wb') as f:
+      f.write(CONSOLE)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_operations(self):
+    safepoints, stops = safepoint_events(self.path, 'h2')
+    self.assertEqual(safepoints['operation'].tolist(), ['ParallelGCFailedAllocation', 'no vm operation', 'RevokeBias'])
+    self.assertEqual(safepoints['timestamp'].tolist(), [0.353, 1.362, 2.451])
+    self.assertEqual(safepoints['threads'].tolist(), [11, 12, 12])
+    self.assertEqual(safepoints['time_to_safepoint'].tolist(), [0.0, 0.003, 0.001])
+    self.assertEqual(safepoints['operation_time'].tolist(), [0.014, 0.0, 0.0])
+    self.assertEqual(safepoints['iteration'].tolist(), [0, 0, 1])
+
+  def test_stops(self):
+    safepoints, stops = safepoint_events(self.path, 'h2')
+    self.assertEqual(len(stops), 3)
+    self.assertTrue(np.allclose(stops['stopped'], [0.0148420, 0.0034870, 0.0011240]))
+    self.assertTrue(np.allclose(stops['stopping'], [0.0000210, 0.0031520, 0.0009830]))
+    self.assertEqual(stops['iteration'].tolist(), [0, 0, 1])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+# Decodes synthetic traces laid out the way Xen writes them: python -m unittest test_parse_xentrace
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import numpy as np
+from parse_xentrace import decode_trace, runstate_changes, TRC_TRACE_CPU_CHANGE, TRC_SCHED_RUNSTATE_CHANGE, DOMID_IDLE
+
+RUNNING, RUNNABLE, BLOCKED = 0, 1, 2
+
+
+def record(event, extra, tsc=None):
+  # One trace record: header (event, extra word count, tsc flag), the tsc, then the extra words
+  header = event | (len(extra) << 28) | ((tsc is not None) << 31)
+  words = [header] + ([tsc & 0xffffffff, tsc >> 32] if tsc is not None else []) + list(extra)
+  return struct.pack('<%dI' % len(words), *words)
+
+def window(cpu, records):
+  # A per-cpu buffer as xentrace writes it out, after a cpu change record giving its size
+  data = b''.join(records)
+  return record(TRC_TRACE_CPU_CHANGE, [cpu, len(data)]) + data
+
+def runstate_change(tsc, domain, vcpu, old, new):
+  # As Xen's trace_runstate_change logs it: the runstates in the event, domain and vcpu in one word
+  return record(TRC_SCHED_RUNSTATE_CHANGE | (old << 8) | (new << 4), [(domain << 16) | vcpu], tsc)
+
+
+class RunstateChangesTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def decode(self, windows):
+    path = os.path.join(self.dir, 'trace_file.bin')
+    with open(path, 'wb') as f:
+      f.write(b''.join(windows))
+    return runstate_changes(decode_trace(path))
+
+  def test_xen_layout(self):
+    runstates = self.decode([
+      window(0, [runstate_change(100, 1, 0, BLOCKED, RUNNABLE),
+                 runstate_change(110, 1, 0, RUNNABLE, RUNNING),
+                 # Another scheduler record, without a tsc, is not a runstate change
+                 record(0x00022001, [5]),
+                 runstate_change(120, DOMID_IDLE, 0, RUNNING, RUNNABLE)]),
+      window(3, [runstate_change(105, 2, 3, RUNNING, BLOCKED),
+                 runstate_change(130, 2, 3, BLOCKED, RUNNABLE)])])
+    self.assertEqual(len(runstates), 4)
+    self.assertEqual(runstates['tsc'].tolist(), [100, 110, 105, 130])
+    self.assertEqual(runstates['cpu'].tolist(), [0, 0, 3, 3])
+    self.assertEqual(runstates['domain'].tolist(), [1, 1, 2, 2])
+    self.assertEqual(runstates['vcpu'].tolist(), [0, 0, 3, 3])
+    self.assertEqual(runstates['old'].tolist(), [BLOCKED, RUNNABLE, RUNNING, BLOCKED])
+    self.assertEqual(runstates['new'].tolist(), [RUNNABLE, RUNNING, BLOCKED, RUNNABLE])
+
+  def test_idle_domain(self):
+    runstates = self.decode([window(1, [runstate_change(100, DOMID_IDLE, 1, RUNNING, RUNNABLE)])])
+    self.assertEqual(len(runstates), 0)
+    path = os.path.join(self.dir, 'trace_file.bin')
+    idle = runstate_changes(decode_trace(path), include_idle=True)
+    self.assertEqual(idle['domain'].tolist(), [DOMID_IDLE])
+    self.assertEqual(idle['new'].tolist(), [RUNNABLE])
+
+if __name__ == "__main__":
+  unittest.main()
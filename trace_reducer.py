@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+import numpy as np
+import results_io
+from parse_xentrace import decode_batch, runstate_changes, split_by, domain_runstates, parse_hz, \
+  TRC_TRACE_CPU_CHANGE, TRC_SCHED_CLASS, RUNSTATES, DOMAIN_RUNSTATES, RECORD_DTYPE, RUNSTATE_DTYPE
+
+# Reduces a xentrace stream read from stdin to per vcpu and per domain runstate times as it
+# arrives, so the raw trace never has to be written out. Run as: xentrace ... | trace_reducer.py out.npz
+CHUNK_BYTES = 1 << 23
+MAX_HELD = 1 << 21
+REDUCED_FILE = "trace_reduced.npz"
+
+def complete_windows(words):
+  # Returns the (start, end, cpu) word offsets of the complete per-cpu windows at the start
+  # of words, and the offset of the first word not in one
+  windows = []
+  pos, size = 0, len(words)
+  while pos + 3 <= size:
+    header, cpu, length = words[pos:pos + 3].tolist()
+    if header & 0x0fffffff != TRC_TRACE_CPU_CHANGE:
+      raise ValueError("Expected a cpu change record at word %d" % pos)
+    end = pos + 3 + length // 4
+    if end > size:
+      break
+    windows.append((pos + 3, end, cpu & 0xffff))
+    pos = end
+  return windows, pos
+
+def new_reduction():
+  return {'vcpu_times': dict(), 'domain_times': dict(), 'last': dict(), 'domain_tsc': dict(), 'samples': [],
+          'cpu_tsc': dict(), 'held': np.zeros(0, dtype=RUNSTATE_DTYPE), 'records': 0, 'bytes': 0}
+
+def release_ordered(reduction, records, cpus, flush=False):
+  # Each cpu's records arrive in tsc order, but the windows of different cpus interleave.
+  # Hold back the runstate changes later than the oldest latest tsc of any cpu, since a
+  # window still to come may hold earlier ones, and return the rest in tsc order.
+  for cpu in np.unique(records['cpu']).tolist():
+    reduction['cpu_tsc'][cpu] = max(reduction['cpu_tsc'].get(cpu, 0), int(records['tsc'][records['cpu'] == cpu].max()))
+  held = np.concatenate((reduction['held'], runstate_changes(records)))
+  held = held[np.argsort(held['tsc'], kind='mergesort')]
+  if flush or len(held) > MAX_HELD:
+    ready = len(held)
+  elif len(reduction['cpu_tsc']) < max(cpus, 1):
+    # Until every cpu has been heard from, any of them may still hold earlier changes
+    ready = 0
+  else:
+    ready = np.searchsorted(held['tsc'], min(reduction['cpu_tsc'].values()), side='right')
+  reduction['held'] = held[ready:]
+  return held[:ready]
+
+def reduce_runstates(reduction, runstates, cpu_hz, sample_every):
+  # Adds a batch of runstate changes to the running per vcpu and per domain times. Each
+  # batch starts from the last change seen of every vcpu, so time spanning two batches is
+  # counted once. Changes that arrive out of order count as zero time.
+  reduction['records'] += len(runstates)
+  if sample_every:
+    reduction['samples'].append(runstates[::sample_every])
+  if len(runstates) == 0:
+    return
+
+  for domain, changes in split_by(runstates, ['domain']).iteritems():
+    carried = np.array([row for key, row in reduction['last'].iteritems() if key[0] == domain], dtype=RUNSTATE_DTYPE)
+    carried['old'] = carried['new']
+
+    # Domain runstates: the carried vcpus are put back in their states at the last change
+    # counted, so the domain's open interval continues from there
+    at_last = carried.copy()
+    at_last['tsc'] = reduction['domain_tsc'].get(domain, 0)
+    combined = np.concatenate((at_last, changes))
+    durations = np.maximum(np.diff(combined['tsc'].astype(np.int64)), 0) / cpu_hz
+    times = np.bincount(domain_runstates(combined)[:-1], weights=durations, minlength=len(DOMAIN_RUNSTATES))
+    reduction['domain_times'][domain] = reduction['domain_times'].get(domain, 0) + times
+    reduction['domain_tsc'][domain] = max(reduction['domain_tsc'].get(domain, 0), int(changes['tsc'].max()))
+
+    # Vcpu runstates: each vcpu's open interval continues from its own last change
+    for (domain, vcpu), vcpu_changes in split_by(np.concatenate((carried, changes)), ['domain', 'vcpu']).iteritems():
+      durations = np.maximum(np.diff(vcpu_changes['tsc'].astype(np.int64)), 0) / cpu_hz
+      times = np.bincount(vcpu_changes['new'][:-1], weights=durations, minlength=len(RUNSTATES))[:len(RUNSTATES)]
+      reduction['vcpu_times'][(domain, vcpu)] = reduction['vcpu_times'].get((domain, vcpu), 0) + times
+      reduction['last'][(domain, vcpu)] = vcpu_changes[-1]
+
+def reduce_stream(stream, cpu_hz, cpus=0, sample_every=0):
+  reduction = new_reduction()
+  pending = b''
+  while True:
+    data = stream.read(CHUNK_BYTES)
+    pending += data
+    reduction['bytes'] += len(data)
+    words = np.frombuffer(pending, dtype='<u4', count=len(pending) // 4)
+    windows, consumed = complete_windows(words)
+    if windows:
+      records = decode_batch(words, windows, TRC_SCHED_CLASS)
+      reduce_runstates(reduction, release_ordered(reduction, records, cpus), cpu_hz, sample_every)
+      pending = pending[consumed * 4:]
+    if not data:
+      break
+  reduce_runstates(reduction, release_ordered(reduction, np.zeros(0, dtype=RECORD_DTYPE), cpus, flush=True), cpu_hz, sample_every)
+  return reduction
+
+def save_reduction(path, reduction):
+  vcpus = sorted(reduction['vcpu_times'])
+  domains = sorted(reduction['domain_times'])
+  samples = reduction['samples']
+  np.savez_compressed(path,
+    vcpus=np.array(vcpus, dtype=np.uint16).reshape(-1, 2),
+    vcpu_times=np.array([reduction['vcpu_times'][key] for key in vcpus]).reshape(-1, len(RUNSTATES)),
+    domains=np.array(domains, dtype=np.uint16),
+    domain_times=np.array([reduction['domain_times'][domain] for domain in domains]).reshape(-1, len(DOMAIN_RUNSTATES)),
+    samples=np.concatenate(samples) if samples else np.zeros(0, dtype=RUNSTATE_DTYPE),
+    counts=np.array([reduction['records'], reduction['bytes']], dtype=np.uint64))
+
+def load_domain_times(path):
+  # Returns {domain -> {domain runstate -> seconds}} from a reduced trace
+  with np.load(results_io.open_file(path, 'rb')) as reduced:
+    return dict((int(domain), dict(zip(DOMAIN_RUNSTATES, times))) for domain, times in zip(reduced['domains'], reduced['domain_times']))
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("output", action="store", help="where to save the reduced trace, or a directory to save %s in" % REDUCED_FILE)
+  parser.add_argument("--cpu-hz", action="store", default="2.67G", help="tsc frequency used to convert cycles to seconds")
+  parser.add_argument("--cpus", action="store", default=0, type=int, help="number of physical cpus being traced (default: however many have been seen)")
+  parser.add_argument("--sample", action="store", default=0, type=int, help="also keep every Nth runstate change (default: none)")
+  cmdargs = parser.parse_args()
+
+  output = cmdargs.output
+  if os.path.isdir(output):
+    output = os.path.join(output, REDUCED_FILE)
+  stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+  save_reduction(output, reduce_stream(stdin, parse_hz(cmdargs.cpu_hz), cmdargs.cpus, cmdargs.sample))
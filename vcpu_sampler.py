@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import re
+import subprocess
+import time
+from array import array
+from threading import Thread, Event
+import numpy as np
+import results_io
+
+SAMPLES_FILE = "vcpu_samples.npz"
+STATES = ['running', 'runnable', 'blocked', 'paused', 'offline']
+# Name, ID, VCPU, CPU, State, Time(s) columns of xl vcpu-list
+VCPU_LIST_PATTERN = re.compile(r"^(\S+)\s+(\d+)\s+(\d+)\s+(\d+|-)\s+(\S+)\s+([.\d]+)", re.M)
+
+def vcpuState(cpu, flags):
+    # xl flags a vcpu as r(unning), b(locked) or p(aused). One that is none of these is
+    # waiting for a cpu, unless it has no cpu at all and is offline.
+    if 'p' in flags:
+        return STATES.index('paused')
+    if cpu == '-':
+        return STATES.index('offline')
+    for flag, state in (('r', 'running'), ('b', 'blocked')):
+        if flag in flags:
+            return STATES.index(state)
+    return STATES.index('runnable')
+
+def newSamples():
+    return {'time': array('d'), 'domain': array('H'), 'vcpu': array('H'), 'cpu': array('h'),
+            'state': array('B'), 'cputime': array('d'), 'names': dict()}
+
+def takeSample(samples, pattern):
+    # One xl vcpu-list call covers every vcpu of every domain
+    output = subprocess.Popen(['sudo', 'xl', 'vcpu-list'], stdout=subprocess.PIPE).communicate()[0]
+    now = time.time()
+    for name, domid, vcpu, cpu, flags, cputime in VCPU_LIST_PATTERN.findall(output):
+        if not re.search(pattern, name):
+            continue
+        samples['names'][int(domid)] = name
+        samples['time'].append(now)
+        samples['domain'].append(int(domid))
+        samples['vcpu'].append(int(vcpu))
+        samples['cpu'].append(-1 if cpu == '-' else int(cpu))
+        samples['state'].append(vcpuState(cpu, flags))
+        samples['cputime'].append(float(cputime))
+
+def sampleVcpus(samples, pattern, interval, stop):
+    start, ticks = time.time(), 0
+    while not stop.is_set():
+        takeSample(samples, pattern)
+        ticks += 1
+        # Keep to the tick schedule however long the query took
+        stop.wait(max(0, start + ticks * interval - time.time()))
+
+def startSampler(pattern, interval):
+    # Samples the vcpus of the domains whose names match pattern every interval seconds in
+    # the background, until stopSampler is called
+    samples, stop = newSamples(), Event()
+    thread = Thread(target=sampleVcpus, args=(samples, pattern, interval, stop))
+    thread.daemon = True
+    thread.start()
+    return thread, stop, samples
+
+def stopSampler(sampler, outputdir):
+    thread, stop, samples = sampler
+    stop.set()
+    thread.join()
+    saveSamples(os.path.join(outputdir, SAMPLES_FILE), samples)
+
+def saveSamples(path, samples):
+    domains = sorted(samples['names'])
+    np.savez_compressed(path,
+        time=np.array(samples['time'], dtype=np.float64),
+        domain=np.array(samples['domain'], dtype=np.uint16),
+        vcpu=np.array(samples['vcpu'], dtype=np.uint16),
+        cpu=np.array(samples['cpu'], dtype=np.int16),
+        state=np.array(samples['state'], dtype=np.uint8),
+        cputime=np.array(samples['cputime'], dtype=np.float64),
+        domains=np.array(domains, dtype=np.uint16),
+        names=np.array([samples['names'][domain] for domain in domains], dtype=str))
+
+def loadSamples(path):
+    with np.load(results_io.open_file(path, 'rb')) as samples:
+        return dict((name, samples[name]) for name in samples.files)
+
+def domainSummary(samples):
+    # Returns {domain name -> (fraction of vcpu samples in each state, mean busy vcpus)}
+    summary = dict()
+    for domain, name in zip(samples['domains'], samples['names']):
+        mine = samples['domain'] == domain
+        fractions = np.bincount(samples['state'][mine], minlength=len(STATES)) / float(mine.sum())
+        # Busy vcpus: cpu seconds used over wall seconds elapsed, summed over the domain's vcpus
+        busy = 0.0
+        for vcpu in np.unique(samples['vcpu'][mine]):
+            times, cputimes = samples['time'][mine & (samples['vcpu'] == vcpu)], samples['cputime'][mine & (samples['vcpu'] == vcpu)]
+            if len(times) > 1 and times[-1] > times[0]:
+                busy += (cputimes[-1] - cputimes[0]) / (times[-1] - times[0])
+        summary[name] = (fractions, busy)
+    return summary
+
+if __name__ == "__main__":
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog='run')
+    parser.add_argument("samples", action="store", help="vcpu samples file (%s) or experiment directory to summarize" % SAMPLES_FILE)
+    cmdargs = parser.parse_args()
+
+    path = cmdargs.samples
+    if os.path.isdir(path):
+        path = os.path.join(path, SAMPLES_FILE)
+    print "%-24s %s %10s" % ("domain", " ".join("%9s" % state for state in STATES), "busy vcpus")
+    for name, (fractions, busy) in sorted(domainSummary(loadSamples(path)).iteritems()):
+        print "%-24s %s %10.2f" % (name, " ".join("%9.3f" % f for f in fractions), busy)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import re
+import numpy as np
+import results_io
+from gc_log import gc_events, pauses, parse_datestamp, EVENT_PATTERN
+
+# Puts the status intervals YCSB prints while it runs (-s) and the GC pauses of every Cassandra
+# node of a Xen experiment on the host clock, then attributes each latency spike to a GC pause
+# on the node the YCSB instance was sending to, to one on a co-located neighbour, or to neither.
+YCSB_DIR = 'cassandra_ycsb'
+GC_EVENTS_FILE = "gcevents%02d"
+YCSB_STATUS_FILE = "ycsbstatus%02d%02d"
+ATTRIBUTION_FILE = "gc_attribution.json"
+# An interval is a spike when an operation's mean latency is SPIKE_FACTOR times its median over
+# the run, or throughput drops below the median over SPIKE_FACTOR
+SPIKE_FACTOR = 3.0
+OPERATIONS = [('read', 'READ'), ('update', 'UPDATE'), ('read_modify_write', 'READ-MODIFY-WRITE')]
+STATUS_DTYPE = np.dtype([('start', '<f8'), ('end', '<f8'), ('operations', '<i8'), ('throughput', '<f8')] +
+                        [(field, '<f8') for field, name in OPERATIONS])
+#   10 sec: 52412 operations; 5241.2 current ops/sec; [UPDATE AverageLatency(us)=185.27] [READ AverageLatency(us)=183.44]
+# and on newer YCSB versions [READ: Count=1000, Max=..., Min=..., Avg=183.44, ...]
+STATUS_PATTERN = re.compile(r"^([.\d]+) .*?(\d+) sec: (\d+) operations; ([.\d]+) current ops/sec;(.*)$", re.M)
+STATUS_LATENCY_PATTERN = re.compile(r"\[([A-Z-]+)(?: AverageLatency\(us\)=|: .*?Avg=)([.\d]+)")
+ATTRIBUTIONS = ['target', 'neighbour', 'none']
+
+def read_status(path):
+  # Returns a STATUS_DTYPE array of the intervals in a ycsbstatusNNII file, on the host clock.
+  # Each interval ends when its line was seen and spans the seconds YCSB says passed since the last.
+  contents = results_io.read(path)
+  rows = []
+  last_elapsed, last_operations = 0, 0
+  for seen, elapsed, operations, throughput, latencies in STATUS_PATTERN.findall(contents):
+    elapsed, operations = int(elapsed), int(operations)
+    latencies = dict((name, float(latency)) for name, latency in STATUS_LATENCY_PATTERN.findall(latencies))
+    rows.append((float(seen) - (elapsed - last_elapsed), float(seen), operations - last_operations, float(throughput)) +
+                tuple(latencies.get(name, np.nan) for field, name in OPERATIONS))
+    last_elapsed, last_operations = elapsed, operations
+  return np.array(rows, dtype=STATUS_DTYPE)
+
+def spikes(status, factor=SPIKE_FACTOR):
+  # Returns a mask of the intervals where some operation's latency spiked or throughput collapsed
+  spiked = status['throughput'] * factor < np.median(status['throughput']) if len(status) else np.zeros(0, dtype=bool)
+  for field, name in OPERATIONS:
+    latency = status[field]
+    if np.isnan(latency).all():
+      continue
+    spiked |= np.nan_to_num(latency) > factor * np.nanmedian(latency)
+  return spiked
+
+def guest_clock_offset(events_file):
+  # Returns how far the host clock is ahead of the guest's datestamps, from the GC lines the host
+  # saw: each was seen no earlier than its pause ended, so the smallest gap is the best estimate.
+  # None if the node's GC lines were not logged with datestamps or not seen by the host at all.
+  if not results_io.exists(events_file):
+    return None
+  gaps = []
+  with results_io.open_file(events_file, 'r') as f:
+    for line in f:
+      seen, text = line.split(' ', 1)
+      match = EVENT_PATTERN.search(text.encode('ascii', 'replace'))
+      if match and match.group(1) and match.group(5):
+        gaps.append(float(seen) - parse_datestamp(match.group(1)) - float(match.group(5)))
+  return min(gaps) if gaps else None
+
+def node_pauses(exp_path, node):
+  # Returns [(start, end)] of the GC pauses of a cassandra node on the host clock, from its
+  # datestamps corrected by guest_clock_offset if it has them, else from when the host saw them
+  events = pauses(gc_events(os.path.join(exp_path, "stdout%02d" % node)))
+  events_file = os.path.join(exp_path, GC_EVENTS_FILE % node)
+  if len(events) and not np.isnan(events['datestamp']).any():
+    offset = guest_clock_offset(events_file) or 0.0
+    starts = events['datestamp'] + offset
+    return np.column_stack((starts, starts + events['pause']))
+  intervals = []
+  if results_io.exists(events_file):
+    with results_io.open_file(events_file, 'r') as f:
+      for line in f:
+        seen, text = line.split(' ', 1)
+        match = EVENT_PATTERN.search(text.encode('ascii', 'replace'))
+        if match and match.group(3):
+          intervals.append((float(seen) - float(match.group(5)), float(seen)))
+  return np.array(intervals, dtype=np.float64).reshape(-1, 2)
+
+def overlapping(intervals, pause_intervals):
+  # Returns a mask of the intervals (start, end columns) that overlap any pause
+  if len(pause_intervals) == 0 or len(intervals) == 0:
+    return np.zeros(len(intervals), dtype=bool)
+  pause_intervals = pause_intervals[np.argsort(pause_intervals[:, 0])]
+  latest_end = np.maximum.accumulate(pause_intervals[:, 1])
+  before = np.searchsorted(pause_intervals[:, 0], intervals[:, 1])
+  return (before > 0) & (latest_end[np.maximum(before - 1, 0)] > intervals[:, 0])
+
+def experiment_attribution(exp_path, num_nodes, factor=SPIKE_FACTOR):
+  # Returns ({attribution or rate -> value}, [spike]) for an experiment. Spikes on a YCSB
+  # instance are attributed to a GC pause on its target node first, then on any neighbour.
+  # target_rate and neighbour_rate are the fractions of all intervals overlapping such pauses,
+  # the rates spikes would show if GC had nothing to do with them.
+  node_intervals = dict((node, node_pauses(exp_path, node)) for node in range(1, num_nodes + 1))
+  counts = dict((attribution, 0) for attribution in ATTRIBUTIONS)
+  totals = {'intervals': 0, 'target_intervals': 0, 'neighbour_intervals': 0}
+  spike_list = []
+  for node in range(1, num_nodes + 1):
+    neighbours = [node_intervals[other] for other in range(1, num_nodes + 1) if other != node]
+    neighbour_intervals = np.concatenate(neighbours) if neighbours else np.zeros((0, 2))
+    iteration = 1
+    while results_io.exists(os.path.join(exp_path, YCSB_STATUS_FILE % (node, iteration))):
+      status = read_status(os.path.join(exp_path, YCSB_STATUS_FILE % (node, iteration)))
+      intervals = np.column_stack((status['start'], status['end']))
+      on_target = overlapping(intervals, node_intervals[node])
+      on_neighbour = overlapping(intervals, neighbour_intervals)
+      totals['intervals'] += len(status)
+      totals['target_intervals'] += int(on_target.sum())
+      totals['neighbour_intervals'] += int(on_neighbour.sum())
+      for i in np.nonzero(spikes(status, factor))[0]:
+        attribution = 'target' if on_target[i] else 'neighbour' if on_neighbour[i] else 'none'
+        counts[attribution] += 1
+        spike_list.append({'node': node, 'iteration': iteration, 'start': status['start'][i], 'end': status['end'][i],
+                           'throughput': status['throughput'][i], 'attribution': attribution,
+                           'latency': dict((field, status[field][i]) for field, name in OPERATIONS if not np.isnan(status[field][i]))})
+      iteration += 1
+  summary = dict(counts)
+  summary['spikes'] = sum(counts.values())
+  summary['intervals'] = totals['intervals']
+  summary['target_rate'] = float(totals['target_intervals']) / totals['intervals'] if totals['intervals'] else 0.0
+  summary['neighbour_rate'] = float(totals['neighbour_intervals']) / totals['intervals'] if totals['intervals'] else 0.0
+  return summary, spike_list
+
+def save_attribution(exp_path, summary, spike_list):
+  with open(os.path.join(exp_path, ATTRIBUTION_FILE), 'w') as f:
+    json.dump({'summary': summary, 'spikes': spike_list}, f, sort_keys=True, indent=2)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog='run')
+  parser.add_argument("-r", "--resultsdir", action="store", help="name of the directory containing the results")
+  parser.add_argument("-g", "--gangscheduled", action="store_const", default='xen', const='xen_gangscheduled', help="parse the gang scheduled xen results")
+  parser.add_argument("--factor", action="store", default=SPIKE_FACTOR, type=float, help="how many times its median an interval's latency must be to count as a spike")
+  cmdargs = parser.parse_args()
+
+  experiments_dir = os.path.join(cmdargs.resultsdir, YCSB_DIR, cmdargs.gangscheduled)
+  experiments = sorted(filter(lambda s: re.match(r"\d+jvms$", s), os.listdir(experiments_dir)), key=lambda s: int(s[:-4]))
+  print "%6s %10s %8s %8s %10s %8s %12s %14s" % ("JVMs", "Intervals", "Spikes", "Target", "Neighbour", "None", "Target rate", "Neighbour rate")
+  for exp in experiments:
+    exp_path = os.path.join(experiments_dir, exp)
+    summary, spike_list = experiment_attribution(exp_path, int(exp[:-4]), cmdargs.factor)
+    save_attribution(exp_path, summary, spike_list)
+    print "%6d %10d %8d %8d %10d %8d %12.3f %14.3f" % (int(exp[:-4]), summary['intervals'], summary['spikes'], summary['target'],
+                                                     summary['neighbour'], summary['none'], summary['target_rate'], summary['neighbour_rate'])